@@ -0,0 +1,344 @@
+"""
+Análises vetorizadas (NumPy) sobre o histórico de colisões.
+
+O histórico é carregado uma vez em colunas (HistoricoColunar): instantes,
+código do sensor, intensidade, velocidade, distância e x/y, com NaN onde o
+produtor não enviou o campo. Percentis, histogramas, agrupamentos por sensor,
+distribuição dos intervalos entre colisões e taxas móveis são operações sobre
+arrays inteiros, sem laços Python por evento.
+
+Relatórios pesados (histórico completo da persistência) rodam num pool de
+processos (ExecutorRelatorios): a leitura dos arquivos e os cálculos não
+disputam o GIL com a ingestão.
+
+NumPy é opcional: sem ele o módulo importa normalmente, e as análises
+levantam AnaliticaIndisponivel.
+"""
+
+import concurrent.futures
+import json
+import multiprocessing
+import sqlite3
+import threading
+from array import array
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:     # Dependência opcional (requirements.txt)
+    np = None
+
+from decodificador import Decodificador, PayloadInvalido
+from persistencia import PersistenciaJSONL
+
+NUMPY_DISPONIVEL = np is not None
+
+COLUNAS_NUMERICAS = ("intensidade", "velocidade", "distancia", "x", "y")
+
+
+class AnaliticaIndisponivel(RuntimeError):
+    """NumPy não está instalado."""
+
+
+def _exigir_numpy():
+    if np is None:
+        raise AnaliticaIndisponivel("Análises vetorizadas exigem NumPy (pip install numpy).")
+
+
+def _lista(valores, casas=4):
+    """Array -> lista JSON (NaN -> None)."""
+    return [None if v != v else round(float(v), casas) for v in valores]
+
+
+class HistoricoColunar:
+    """Histórico em colunas NumPy, em ordem de chegada."""
+
+    def __init__(self, recebido_em, sensor, sensores, **colunas):
+        self.recebido_em = recebido_em      # float64, epoch
+        self.sensor = sensor                # int32, índice em `sensores`
+        self.sensores = sensores            # Nomes dos sensores por código
+        for nome in COLUNAS_NUMERICAS:
+            setattr(self, nome, colunas[nome])      # float64, NaN = ausente
+
+    @classmethod
+    def de_eventos(cls, eventos):
+        """Monta as colunas a partir de EventoColisao (uma passada, sem dicts intermediários)."""
+        _exigir_numpy()
+        nan = float("nan")
+        instantes, codigos = array("d"), array("i")
+        valores = {nome: array("d") for nome in COLUNAS_NUMERICAS}
+        colunas_valores = [(nome, valores[nome].append) for nome in COLUNAS_NUMERICAS]
+        indice_sensor = {}
+        for evento in eventos:
+            instantes.append(evento.recebido_em)
+            codigo = indice_sensor.get(evento.sensor)
+            if codigo is None:
+                codigo = indice_sensor[evento.sensor] = len(indice_sensor)
+            codigos.append(codigo)
+            for nome, anexar in colunas_valores:
+                valor = getattr(evento, nome)
+                anexar(nan if valor is None else valor)
+        colunas = {nome: np.frombuffer(valores[nome], dtype=np.float64) for nome in COLUNAS_NUMERICAS}
+        return cls(
+            np.frombuffer(instantes, dtype=np.float64), np.frombuffer(codigos, dtype=np.int32),
+            [str(s) for s in indice_sensor], **colunas,
+        )
+
+    @classmethod
+    def de_registros(cls, registros, decodificador=None):
+        """Monta a partir de (recebido_em, dados) já decodificados (ex.: relidos da persistência)."""
+        decodificador = decodificador or Decodificador()
+
+        def eventos():
+            for recebido_em, dados in registros:
+                try:
+                    yield decodificador.normalizar(dados, recebido_em)
+                except PayloadInvalido:
+                    continue
+
+        return cls.de_eventos(eventos())
+
+    def __len__(self):
+        return len(self.recebido_em)
+
+    def filtrar(self, inicio=None, fim=None):
+        """Subconjunto entre os instantes `inicio` e `fim` (epoch, inclusivos)."""
+        mascara = np.ones(len(self), dtype=bool)
+        if inicio is not None:
+            mascara &= self.recebido_em >= inicio
+        if fim is not None:
+            mascara &= self.recebido_em <= fim
+        if mascara.all():
+            return self
+        colunas = {nome: getattr(self, nome)[mascara] for nome in COLUNAS_NUMERICAS}
+        return HistoricoColunar(self.recebido_em[mascara], self.sensor[mascara], self.sensores, **colunas)
+
+    # ========== DISTRIBUIÇÕES ==========
+    def percentis(self, coluna, percentis=(50, 90, 95, 99)):
+        """Resumo da coluna (ignorando ausentes): n, média, desvio, mínimo, máximo e percentis."""
+        valores = getattr(self, coluna)
+        valores = valores[~np.isnan(valores)]
+        if not len(valores):
+            return {"n": 0}
+        quantis = np.percentile(valores, percentis)
+        return {
+            "n": int(len(valores)),
+            "media": round(float(valores.mean()), 4),
+            "desvio": round(float(valores.std()), 4),
+            "minimo": float(valores.min()),
+            "maximo": float(valores.max()),
+            "percentis": {f"p{p:g}": round(float(q), 4) for p, q in zip(percentis, quantis)},
+        }
+
+    def histograma(self, coluna, faixas=20):
+        """Histograma da coluna (ignorando ausentes): limites e contagens das faixas."""
+        valores = getattr(self, coluna)
+        valores = valores[~np.isnan(valores)]
+        if not len(valores):
+            return {"limites": [], "contagens": []}
+        contagens, limites = np.histogram(valores, bins=faixas)
+        return {"limites": _lista(limites), "contagens": contagens.tolist()}
+
+    def intervalos(self, percentis=(50, 90, 95, 99), faixas=20):
+        """Distribuição dos intervalos (s) entre colisões consecutivas: geral e média por sensor.
+
+        O histograma usa faixas em escala logarítmica (intervalos variam de ms a horas).
+        """
+        ordem = np.argsort(self.recebido_em, kind="stable")
+        geral = np.diff(self.recebido_em[ordem])
+        resultado = {"n": int(len(geral))}
+        if len(geral):
+            quantis = np.percentile(geral, percentis)
+            resultado.update({
+                "media": round(float(geral.mean()), 6),
+                "percentis": {f"p{p:g}": round(float(q), 6) for p, q in zip(percentis, quantis)},
+            })
+            positivos = geral[geral > 0]
+            if len(positivos):
+                minimo, maximo = positivos.min(), positivos.max()
+                limites = np.geomspace(minimo, maximo if maximo > minimo else minimo * 10, faixas + 1)
+                contagens, _ = np.histogram(positivos, bins=limites)
+                resultado["histograma_log"] = {
+                    "limites": _lista(limites, 6), "contagens": contagens.tolist(),
+                    "zero": int(len(geral) - len(positivos)),
+                }
+
+        # Por sensor: ordena por (sensor, instante); diferenças só entre vizinhos do mesmo sensor
+        ordem = np.lexsort((self.recebido_em, self.sensor))
+        sensores, instantes = self.sensor[ordem], self.recebido_em[ordem]
+        mesmo = sensores[1:] == sensores[:-1]
+        diferencas, donos = np.diff(instantes)[mesmo], sensores[1:][mesmo]
+        n = len(self.sensores)
+        quantidade = np.bincount(donos, minlength=n)
+        soma = np.bincount(donos, weights=diferencas, minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = soma / quantidade
+        resultado["media_por_sensor"] = {
+            self.sensores[i]: round(float(media[i]), 6) for i in np.flatnonzero(quantidade)
+        }
+        return resultado
+
+    # ========== AGRUPAMENTOS ==========
+    def por_sensor(self, limite=None):
+        """Contagem, participação e média/máximo de intensidade e velocidade por sensor (maiores primeiro)."""
+        n = len(self.sensores)
+        contagem = np.bincount(self.sensor, minlength=n)
+        resultado = {}
+        for coluna in ("intensidade", "velocidade"):
+            valores = getattr(self, coluna)
+            presentes = ~np.isnan(valores)
+            codigos = self.sensor[presentes]
+            quantidade = np.bincount(codigos, minlength=n)
+            soma = np.bincount(codigos, weights=valores[presentes], minlength=n)
+            maximo = np.full(n, np.nan)
+            if presentes.any():
+                maximo[:] = -np.inf
+                np.maximum.at(maximo, codigos, valores[presentes])
+                maximo[quantidade == 0] = np.nan
+            with np.errstate(invalid="ignore", divide="ignore"):
+                resultado[coluna] = (soma / quantidade, maximo)
+        total = max(1, len(self))
+        ordem = np.argsort(-contagem, kind="stable")[:limite]
+        return [
+            {
+                "sensor": self.sensores[i],
+                "contagem": int(contagem[i]),
+                "participacao": round(float(contagem[i]) / total, 4),
+                **{
+                    f"{coluna}_{estatistica}": _lista([valores[i]])[0]
+                    for coluna, pares in resultado.items()
+                    for estatistica, valores in zip(("media", "maximo"), pares)
+                },
+            }
+            for i in ordem if contagem[i]
+        ]
+
+    def taxas_moveis(self, janela=60.0, passo=10.0, max_pontos=1000):
+        """Colisões por minuto numa janela deslizante de `janela` s, amostrada a cada `passo` s.
+
+        Com históricos longos o passo aumenta para caber em `max_pontos` amostras.
+        """
+        if not len(self):
+            return {"passo": passo, "janela": janela, "inicio": None, "por_minuto": []}
+        inicio = float(self.recebido_em.min())
+        duracao = float(self.recebido_em.max()) - inicio
+        passo = max(passo, duracao / max_pontos)
+        janela = max(janela, passo)
+        baldes = ((self.recebido_em - inicio) // passo).astype(np.int64)
+        contagens = np.bincount(baldes)
+        # Soma deslizante via soma acumulada: acumulada[i] - acumulada[i - largura]
+        largura = max(1, int(round(janela / passo)))
+        acumulada = np.concatenate(([0], np.cumsum(contagens)))
+        moveis = acumulada[1:] - acumulada[np.maximum(0, np.arange(1, len(acumulada)) - largura)]
+        por_minuto = moveis * (60.0 / (largura * passo))
+        return {
+            "passo": round(passo, 6),
+            "janela": round(largura * passo, 6),
+            "inicio": inicio,
+            "por_minuto": _lista(por_minuto, 3),
+            "maximo": round(float(por_minuto.max()), 3),
+            "media": round(len(self) * 60.0 / max(duracao, passo), 3),
+        }
+
+
+def gerar_relatorio(historico, opcoes=None):
+    """Relatório completo (dict JSON) de um HistoricoColunar."""
+    opcoes = opcoes or {}
+    historico = historico.filtrar(opcoes.get("inicio"), opcoes.get("fim"))
+    percentis = tuple(opcoes.get("percentis", (50, 90, 95, 99)))
+    faixas = opcoes.get("faixas", 20)
+    if not len(historico):
+        return {"eventos": 0}
+    return {
+        "eventos": len(historico),
+        "inicio": float(historico.recebido_em.min()),
+        "fim": float(historico.recebido_em.max()),
+        "distribuicoes": {
+            coluna: {**historico.percentis(coluna, percentis), "histograma": historico.histograma(coluna, faixas)}
+            for coluna in ("intensidade", "velocidade", "distancia")
+        },
+        "intervalos": historico.intervalos(percentis, faixas),
+        "por_sensor": historico.por_sensor(opcoes.get("limite_sensores")),
+        "taxa": historico.taxas_moveis(opcoes.get("janela_taxa", 60), opcoes.get("passo_taxa", 10)),
+    }
+
+
+# ========== LEITURA DA PERSISTÊNCIA ==========
+def ler_registros(data_config, date_format):
+    """Itera (recebido_em, dados) do backend configurado, lendo os arquivos diretamente."""
+    backend = data_config.get("storage_backend", "json")
+    if backend == "jsonl":
+        diretorio = Path(data_config["segments_dir"])
+        manifesto = diretorio / PersistenciaJSONL.MANIFESTO
+        if not manifesto.exists():
+            return
+        segmentos = json.loads(manifesto.read_text(encoding="utf-8"))["segmentos"]
+        for segmento in segmentos:
+            caminho = diretorio / segmento["arquivo"]
+            if not caminho.exists():
+                continue
+            with open(caminho, "r", encoding="utf-8") as f:
+                for linha in f:
+                    if linha.strip():
+                        registro = json.loads(linha)
+                        yield registro["recebido_em"], registro["dados"]
+    elif backend == "sqlite":
+        # Somente leitura: não interfere no detector que está gravando (modo WAL)
+        conn = sqlite3.connect(f"file:{data_config['sqlite_file']}?mode=ro", uri=True)
+        try:
+            for recebido_em, dados in conn.execute("SELECT recebido_em, dados FROM eventos ORDER BY id"):
+                yield recebido_em, json.loads(dados)
+        finally:
+            conn.close()
+    else:
+        caminho = Path(data_config["data_file"])
+        if not caminho.exists():
+            return
+        for registro in json.loads(caminho.read_text(encoding="utf-8")):
+            yield datetime.strptime(registro["timestamp"], date_format).timestamp(), registro["dados"]
+
+
+def relatorio_persistencia(data_config, date_format, opcoes=None):
+    """Carrega todo o histórico persistido e gera o relatório (executado no processo do pool)."""
+    historico = HistoricoColunar.de_registros(ler_registros(data_config, date_format))
+    return gerar_relatorio(historico, opcoes)
+
+
+# ========== POOL DE PROCESSOS ==========
+class ExecutorRelatorios:
+    """Pool de processos criado sob demanda para os relatórios pesados."""
+
+    def __init__(self, processos=1, metodo_inicio="spawn"):
+        self.processos = processos
+        self.metodo_inicio = metodo_inicio
+        self._pool = None
+        self._lock = threading.Lock()   # Requisições simultâneas criam um único pool
+
+    @classmethod
+    def de_config(cls, config):
+        return cls(config["workers"], config["start_method"])
+
+    def _executor(self):
+        _exigir_numpy()
+        with self._lock:
+            if self._pool is None:
+                # spawn: o processo filho não herda locks/threads do detector (fork num processo multithread é frágil)
+                contexto = multiprocessing.get_context(self.metodo_inicio)
+                self._pool = concurrent.futures.ProcessPoolExecutor(self.processos, mp_context=contexto)
+            return self._pool
+
+    def relatorio_eventos(self, eventos, opcoes=None):
+        """Monta as colunas aqui (cópia dos eventos em memória) e calcula o relatório no pool. Retorna o Future."""
+        executor = self._executor()
+        return executor.submit(gerar_relatorio, HistoricoColunar.de_eventos(eventos), opcoes)
+
+    def relatorio_persistencia(self, data_config, date_format, opcoes=None):
+        """Leitura dos arquivos e cálculo inteiramente no pool. Retorna o Future."""
+        return self._executor().submit(relatorio_persistencia, dict(data_config), date_format, opcoes)
+
+    def fechar(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
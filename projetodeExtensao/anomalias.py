@@ -0,0 +1,251 @@
+"""
+Detecção de anomalias por sensor, em streaming e O(1) por evento.
+
+Para cada sensor são mantidas médias e variâncias móveis exponenciais (EWMA) de
+dois sinais:
+- ritmo: log do intervalo desde a colisão anterior do sensor (em log, um
+  processo de Poisson vira uma distribuição quase simétrica e a escala da taxa
+  de cada sensor deixa de importar);
+- intensidade da colisão.
+Cada evento é comparado com o estado *anterior* a ele: uma CUSUM unilateral
+(soma dos z acima da folga `cusum_k`, disparando em `cusum_h`) acusa desvios
+pequenos porém persistentes — um sensor que passou a disparar mais rápido ou
+mais forte —, e um z-score de intensidade acima de `limiar_z` acusa uma colisão
+isolada muito mais forte que o normal do sensor. (Um intervalo curto isolado é
+comum num processo de Poisson, por isso o ritmo só é acusado pela CUSUM.)
+
+O estado fica em colunas `array('d')` (um slot por sensor, gravadas como bytes
+na seção do snapshot) e um dict sensor -> slot: ~10 floats por sensor, poucas
+dezenas de MB para 100k sensores. Acima de `max_sensores`, os vistos há mais
+tempo saem em bloco.
+"""
+
+import heapq
+import math
+import struct
+import threading
+from array import array
+
+from recuperacao import desempacotar_partes, desempacotar_textos, empacotar_partes, empacotar_textos, ler_coluna
+
+EULER_GAMMA = 0.5772156649015329
+
+# Colunas de estado por slot
+CAMPOS = (
+    "ultimo",           # Epoch da última colisão
+    "n",                # Amostras de intervalo já vistas
+    "ritmo_media",      # EWMA de log(intervalo)
+    "ritmo_var",
+    "ritmo_cusum",      # CUSUM do ritmo (intervalos mais curtos que o normal)
+    "intensidade_n",
+    "intensidade_media",
+    "intensidade_var",
+    "intensidade_cusum",
+    "ultimo_alerta",    # Epoch do último alerta do sensor (0 = nunca)
+)
+
+
+class DetectorAnomalias:
+    """Estado EWMA por sensor e detecção por z-score / CUSUM (thread-safe)."""
+
+    def __init__(self, alfa=0.01, min_amostras=20, limiar_z=4.0, cusum_k=0.5, cusum_h=10.0,
+                 intervalo_minimo=0.001, intervalo_alerta=60.0, max_sensores=100_000,
+                 desvio_minimo_ritmo=0.1, desvio_minimo_intensidade=0.5):
+        self.alfa = alfa
+        self.min_amostras = min_amostras
+        self.limiar_z = limiar_z
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.intervalo_minimo = intervalo_minimo        # Intervalos menores (mesmo instante) contam como este
+        self.intervalo_alerta = intervalo_alerta        # Alertas de um mesmo sensor: no máximo um por intervalo
+        self.max_sensores = max_sensores
+        # Pisos das variâncias: sensores muito regulares não geram z enormes por ruído mínimo
+        self.var_minima_ritmo = desvio_minimo_ritmo ** 2
+        self.var_minima_intensidade = desvio_minimo_intensidade ** 2
+        self._slots = {}            # sensor -> slot
+        self._livres = []           # Slots liberados por sensores removidos
+        self._colunas = {}
+        self._montar_colunas({campo: array("d") for campo in CAMPOS})
+        self._lock = threading.Lock()
+        self.anomalias = 0
+        self.removidos = 0
+
+    @classmethod
+    def de_config(cls, config):
+        """Cria a partir de ANOMALY_CONFIG; None se desativado."""
+        if not config["enabled"]:
+            return None
+        return cls(
+            config["alpha"], config["min_samples"], config["z_threshold"], config["cusum_k"],
+            config["cusum_h"], config["min_gap"], config["alert_interval"], config["max_sensors"],
+        )
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def memoria_bytes(self):
+        """Bytes das colunas de estado (sem o dict de slots)."""
+        return sum(coluna.itemsize * len(coluna) for coluna in self._colunas.values())
+
+    def _montar_colunas(self, colunas):
+        self._colunas = colunas
+        # Colunas de cada sinal pré-agrupadas (evita montar chaves no caminho quente)
+        self._ritmo = ("ritmo", colunas["n"], colunas["ritmo_media"], colunas["ritmo_var"], colunas["ritmo_cusum"])
+        self._intensidade = ("intensidade", colunas["intensidade_n"], colunas["intensidade_media"],
+                             colunas["intensidade_var"], colunas["intensidade_cusum"])
+
+    # ========== SLOTS ==========
+    def _novo_slot(self, sensor, instante):
+        if len(self._slots) >= self.max_sensores:
+            self._remover_antigos(instante)
+        if self._livres:
+            slot = self._livres.pop()
+            for coluna in self._colunas.values():
+                coluna[slot] = 0.0
+        else:
+            slot = len(self._colunas["ultimo"])
+            for coluna in self._colunas.values():
+                coluna.append(0.0)
+        self._colunas["ultimo"][slot] = instante
+        self._slots[sensor] = slot
+        return slot
+
+    def _remover_antigos(self, instante):
+        """Remove de uma vez ~1% dos sensores vistos há mais tempo (custo amortizado O(1) por sensor novo)."""
+        ultimo = self._colunas["ultimo"]
+        quantidade = max(1, len(self._slots) // 100)
+        antigos = heapq.nsmallest(quantidade, self._slots.items(), key=lambda par: ultimo[par[1]])
+        for sensor, slot in antigos:
+            del self._slots[sensor]
+            self._livres.append(slot)
+        self.removidos += len(antigos)
+
+    # ========== DETECÇÃO ==========
+    def registrar_eventos(self, eventos):
+        """Atualiza o estado com um lote de EventoColisao. Retorna as anomalias detectadas (lista de dicts)."""
+        anomalias = []
+        with self._lock:
+            for evento in eventos:
+                self._registrar(evento.sensor, evento.recebido_em, evento.intensidade, anomalias)
+            self.anomalias += len(anomalias)
+        return anomalias
+
+    def _registrar(self, sensor, instante, intensidade, anomalias):
+        ultimo = self._colunas["ultimo"]
+        slot = self._slots.get(sensor)
+        achados = []
+        if slot is None:
+            slot = self._novo_slot(sensor, instante)
+        else:
+            intervalo = max(instante - ultimo[slot], self.intervalo_minimo)
+            if instante > ultimo[slot]:
+                ultimo[slot] = instante
+            # Ritmo: z positivo = intervalo mais curto que o normal (sensor disparando mais rápido)
+            self._sinal(slot, self._ritmo, -math.log(intervalo), self.var_minima_ritmo, False, achados)
+        if intensidade is not None:
+            self._sinal(slot, self._intensidade, intensidade, self.var_minima_intensidade, True, achados)
+        if achados:
+            ultimo_alerta = self._colunas["ultimo_alerta"]
+            if instante - ultimo_alerta[slot] >= self.intervalo_alerta:
+                ultimo_alerta[slot] = instante
+                for sinal, metodo, valor, z in achados:
+                    anomalias.append({
+                        "sensor": sensor, "instante": instante, "sinal": sinal, "metodo": metodo,
+                        "valor": round(valor, 6), "z": round(z, 3),
+                    })
+
+    def _sinal(self, slot, colunas, valor, var_minima, usar_z, achados):
+        """Pontua `valor` contra a EWMA do sinal (z-score e CUSUM) e depois atualiza a EWMA."""
+        nome, n_col, media_col, var_col, cusum_col = colunas
+        n = n_col[slot]
+        media = media_col[slot]
+        if n == 0:
+            media_col[slot] = valor
+            n_col[slot] = 1
+            return
+        var = var_col[slot]
+        if n >= self.min_amostras:
+            z = (valor - media) / math.sqrt(var if var > var_minima else var_minima)
+            if usar_z and z > self.limiar_z:
+                achados.append((nome, "zscore", valor, z))
+            # Incremento limitado a limiar_z: um único valor extremo não dispara a CUSUM sozinho
+            cusum = cusum_col[slot] + min(z, self.limiar_z) - self.cusum_k
+            if cusum > self.cusum_h:
+                achados.append((nome, "cusum", valor, cusum))
+                cusum = 0.0
+            cusum_col[slot] = cusum if cusum > 0.0 else 0.0
+        # EWMA da média e da variância (forma incremental). No aquecimento, peso 1/(n+1):
+        # média/variância acumuladas exatas, em vez de uma EWMA ainda presa ao primeiro valor
+        alfa = 1.0 / (n + 1) if n * self.alfa < 1 else self.alfa
+        diferenca = valor - media
+        incremento = alfa * diferenca
+        media_col[slot] = media + incremento
+        var_col[slot] = (1 - alfa) * (var + diferenca * incremento)
+        n_col[slot] = n + 1
+
+    # ========== CONSULTAS ==========
+    def obter(self, sensor):
+        """Estado do sensor (taxa estimada da EWMA do ritmo, em colisões/min) ou None."""
+        with self._lock:
+            slot = self._slots.get(sensor)
+            if slot is None:
+                return None
+            c = self._colunas
+            estado = {campo: c[campo][slot] for campo in CAMPOS}
+        n = estado["n"]
+        return {
+            "sensor": sensor,
+            "ultimo": estado["ultimo"],
+            "amostras": int(n),
+            # Chegadas de Poisson com taxa λ: E[-log intervalo] = log λ + γ (constante de Euler)
+            "taxa_estimada_por_minuto": round(60 * math.exp(estado["ritmo_media"] - EULER_GAMMA), 4) if n else None,
+            "intensidade_media": round(estado["intensidade_media"], 4) if estado["intensidade_n"] else None,
+            "intensidade_desvio": round(math.sqrt(estado["intensidade_var"]), 4) if estado["intensidade_n"] else None,
+            "cusum_ritmo": round(estado["ritmo_cusum"], 3),
+            "cusum_intensidade": round(estado["intensidade_cusum"], 3),
+            "ultimo_alerta": estado["ultimo_alerta"] or None,
+        }
+
+    def estatisticas(self):
+        return {
+            "sensores": len(self._slots),
+            "anomalias": self.anomalias,
+            "removidos": self.removidos,
+            "memoria_bytes": self.memoria_bytes,
+        }
+
+    # ========== SNAPSHOT ==========
+    def capturar(self):
+        """Cópia do estado sob o lock (dict de slots e colunas copiados em bloco); ver `serializar`."""
+        with self._lock:
+            return (self.anomalias, dict(self._slots), list(self._livres),
+                    [array("d", self._colunas[campo]) for campo in CAMPOS])
+
+    @staticmethod
+    def serializar(captura):
+        """Estado em bytes (seção do snapshot): total de anomalias, sensores, slots, slots livres e colunas."""
+        anomalias, slots, livres, colunas = captura
+        partes = [
+            struct.pack("<q", anomalias),
+            empacotar_textos(list(slots)),
+            array("q", slots.values()).tobytes(),
+            array("q", livres).tobytes(),
+        ]
+        partes.extend(coluna.tobytes() for coluna in colunas)
+        return empacotar_partes(partes)
+
+    def exportar(self):
+        return self.serializar(self.capturar())
+
+    def restaurar(self, dados):
+        partes = desempacotar_partes(dados)
+        (anomalias,) = struct.unpack("<q", partes[0])
+        slots = dict(zip(desempacotar_textos(partes[1]), ler_coluna("q", partes[2])))
+        livres = ler_coluna("q", partes[3]).tolist()
+        colunas = {campo: ler_coluna("d", parte) for campo, parte in zip(CAMPOS, partes[4:])}
+        with self._lock:
+            self._montar_colunas(colunas)
+            self._slots = slots
+            self._livres = livres
+            self.anomalias = anomalias
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks das funções quentes do DetectorColisao.
+
+Chama diretamente _on_message, o processamento de mensagens, _check_connection_health
+e _save_data com payloads sintéticos no formato do simulador_colisoes.py, para
+históricos de 10^2 a 10^6 eventos, e mede o pipeline completo (publicação ->
+fila -> workers -> buffer) pelo transporte loopback, sem broker nem rede. Reporta ops/s, latência p50/p99 e alocações
+(tracemalloc) e grava os resultados em JSON para comparação entre commits.
+
+Uso:
+    python benchmark_detector.py                              # todos os tamanhos
+    python benchmark_detector.py --tamanhos 100 10000 --tempo 0.5
+    python benchmark_detector.py --comparar data/benchmarks/bench_<commit>_<data>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+from config import (
+    MQTT_CONFIG, LOGGING_CONFIG, DATA_CONFIG, STATS_CONFIG, PIPELINE_CONFIG, DEDUP_CONFIG, ANOMALY_CONFIG,
+)
+from detector_colisao import DetectorColisao
+from deduplicacao import Deduplicador
+from anomalias import DetectorAnomalias
+from transporte import ClienteLoopback
+
+TAMANHOS_PADRAO = (100, 1_000, 10_000, 100_000, 1_000_000)
+TIPOS_COLISAO = ["colisão frontal", "colisão lateral", "colisão traseira", "colisão múltipla", "quase colisão"]
+SENSORES = ["sensor_a", "sensor_b", "sensor_c", "sensor_d"]
+WORKERS_PIPELINE = PIPELINE_CONFIG["workers"]
+
+
+def gerar_payloads(quantidade, semente=42):
+    """Payloads iguais aos publicados pelo simulador_colisoes.py."""
+    rnd = random.Random(semente)
+    payloads = []
+    for i in range(1, quantidade + 1):
+        dados = {
+            "tipo": "colisao",
+            "sensor": rnd.choice(SENSORES),
+            "timestamp": time.time(),
+            "colisao_id": i,
+            "tipo_colisao": rnd.choice(TIPOS_COLISAO),
+            "intensidade": rnd.randint(1, 10),
+            "localizacao": {"x": rnd.randint(0, 100), "y": rnd.randint(0, 100)},
+            "velocidade": rnd.randint(20, 120),
+            "mensagem": f"Colisão #{i} detectada no {rnd.choice(SENSORES)}",
+        }
+        payloads.append(json.dumps(dados, indent=2).encode("utf-8"))
+    return payloads
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(funcao, tempo, min_ops, max_ops):
+    """Executa `funcao(i)` até esgotar o tempo (respeitando min/max) e mede cada chamada."""
+    latencias = []
+    relogio = time.perf_counter_ns
+    limite = relogio() + int(tempo * 1e9)
+    i = 0
+    while i < max_ops and (i < min_ops or relogio() < limite):
+        inicio = relogio()
+        funcao(i)
+        latencias.append(relogio() - inicio)
+        i += 1
+    latencias.sort()
+    total = sum(latencias)
+    return {
+        "ops": i,
+        "ops_por_s": round(i / (total / 1e9), 1) if total else 0.0,
+        "p50_us": round(_percentil(latencias, 50) / 1000, 2),
+        "p99_us": round(_percentil(latencias, 99) / 1000, 2),
+    }
+
+
+def medir_alocacoes(funcao, ops):
+    """Bytes retidos por operação e pico alocado durante `ops` chamadas (tracemalloc)."""
+    tracemalloc.start()
+    try:
+        antes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for i in range(ops):
+            funcao(i)
+        depois, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "alocado_por_op_bytes": round((depois - antes) / ops, 1) if ops else 0.0,
+        "pico_kib": round((pico - antes) / 1024, 1),
+    }
+
+
+class BancadaDetector:
+    """Detector isolado (transporte loopback, sem threads de worker) com histórico pré-carregado."""
+
+    def __init__(self, tamanho, backend, diretorio):
+        DATA_CONFIG.update(max_history_size=tamanho, storage_backend=backend, auto_save_interval=10 ** 9)
+        PIPELINE_CONFIG.update(workers=0, queue_size=0)
+        MQTT_CONFIG.update(transport="loopback")
+        STATS_CONFIG.update(stats_interval=0)   # Pior caso: taxas, pico e intervalo a cada chamada
+        LOGGING_CONFIG.update(level="WARNING")
+        # Os payloads se repetem a cada 1000 mensagens: com deduplicação seriam descartados (ver "deduplicar")
+        DEDUP_CONFIG.update(enabled=False)
+        prefixo = Path(diretorio) / f"n{tamanho}"
+        os.environ.update(
+            DATA_FILE=f"{prefixo}.json", SEGMENTS_DIR=f"{prefixo}_segmentos", SQLITE_FILE=f"{prefixo}.db",
+            ROLLUPS_FILE=f"{prefixo}_rollups.json", LOG_FILE=f"{prefixo}.log", RECOVERY_DIR=f"{prefixo}_recuperacao",
+        )
+        self.detector = DetectorColisao()
+        self.detector._print = lambda *args, **kwargs: None
+        self.tamanho = tamanho
+
+    def preencher(self, payloads):
+        """Enche o buffer até o tamanho do histórico (fora da medição)."""
+        detector = self.detector
+        agora = time.time_ns()
+        for i in range(self.tamanho):
+            evento = detector.decodificador.decodificar(payloads[i % len(payloads)], (agora + i * 1000) / 1e9)
+            detector.colisoes.adicionar(evento)
+            detector.persistencia.registrar(evento)
+        detector.taxa_colisoes.registrar(self.tamanho)
+        detector._save_data()
+
+    def ponta_a_ponta(self, payloads, quantidade):
+        """Publica `quantidade` mensagens QoS 1 pelo barramento e espera os workers processarem todas."""
+        detector = self.detector
+        detector.pipeline_config["workers"] = WORKERS_PIPELINE
+        detector._start_workers()
+        detector.client.connect()
+        publicador = ClienteLoopback("bench_publicador", barramento=detector.client.barramento)
+        publicador.connect()
+        topico = detector.mqtt_config["topic"]
+        alvo = detector.colisoes.ultimo_seq + quantidade
+        latencias = []
+        relogio = time.perf_counter_ns
+        inicio = relogio()
+        for i in range(quantidade):
+            antes = relogio()
+            publicador.publish(topico, payloads[i % len(payloads)], qos=1)
+            latencias.append(relogio() - antes)
+        limite = time.monotonic() + 120
+        while detector.colisoes.ultimo_seq < alvo and time.monotonic() < limite:
+            time.sleep(0.001)
+        total = relogio() - inicio
+        processadas = quantidade - (alvo - detector.colisoes.ultimo_seq)
+        latencias.sort()
+        return {
+            "ops": processadas,
+            "ops_por_s": round(processadas / (total / 1e9), 1),
+            "p50_us": round(_percentil(latencias, 50) / 1000, 2),   # Publicação (até o ack)
+            "p99_us": round(_percentil(latencias, 99) / 1000, 2),
+            "workers": WORKERS_PIPELINE,
+        }
+
+    def encerrar(self):
+        self.detector._stop_event.set()
+        self.detector.persistencia.fechar()
+        self.detector._parar_logging()
+
+
+def _exibir(resultado):
+    print(
+        f"   {resultado['benchmark']:<24} {resultado['ops_por_s']:>12,.0f} ops/s  "
+        f"p50 {resultado['p50_us']:>10.2f}µs  p99 {resultado['p99_us']:>10.2f}µs  "
+        + (f"{resultado['alocado_por_op_bytes']:>10.1f} B/op" if "alocado_por_op_bytes" in resultado else "")
+    )
+
+
+def executar(tamanhos, backend, tempo, semente, mensagens_ponta=20_000):
+    payloads = gerar_payloads(1000, semente)
+    topico = MQTT_CONFIG["topic"]
+    mensagens = [SimpleNamespace(topic=topico, payload=p) for p in payloads]
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix="bench_detector_") as diretorio:
+        for tamanho in tamanhos:
+            print(f"⏱️  Histórico de {tamanho} eventos...", flush=True)
+            bancada = BancadaDetector(tamanho, backend, diretorio)
+            bancada.preencher(payloads)
+            detector = bancada.detector
+
+            def on_message(i):
+                detector._on_message(None, None, mensagens[i % len(mensagens)])
+
+            def processar(i):
+                detector._processar_lote([(topico, payloads[i % len(payloads)], time.time_ns())])
+
+            def saude(i):
+                detector._check_connection_health()
+
+            def salvar(i):
+                detector._save_data()
+
+            # Chaves sempre novas: custo em regime (inclui a expulsão das mais antigas do LRU)
+            evento = detector.decodificador.decodificar(payloads[0], time.time())
+            deduplicadores = {
+                "lru": Deduplicador(DEDUP_CONFIG["max_entries"], DEDUP_CONFIG["ttl"]),
+                "bloom": Deduplicador(DEDUP_CONFIG["max_entries"], DEDUP_CONFIG["ttl"], bloom=True),
+            }
+
+            def deduplicar(i, deduplicador=deduplicadores["lru"]):
+                evento.colisao_id = i
+                deduplicador.duplicado(evento, None)
+
+            def deduplicar_bloom(i):
+                deduplicar(i, deduplicadores["bloom"])
+
+            # Anomalias: frota de max_sensors sensores em rodízio (estado de todos em memória)
+            anomalias = DetectorAnomalias.de_config({**ANOMALY_CONFIG, "enabled": True})
+            frota = [f"sensor_{i:06d}" for i in range(ANOMALY_CONFIG["max_sensors"])]
+            evento_anomalia = detector.decodificador.decodificar(payloads[1], 0.0)
+
+            def detectar_anomalias(i):
+                evento_anomalia.sensor = frota[i % len(frota)]
+                evento_anomalia.recebido_em = i * 1e-3
+                anomalias.registrar_eventos((evento_anomalia,))
+
+            casos = (
+                # nome, função, min_ops, max_ops, ops medidas com tracemalloc
+                ("on_message", on_message, 1000, 200_000, 1000),
+                ("processar_mensagem", processar, 1000, 200_000, 1000),
+                ("check_connection_health", saude, 1000, 200_000, 1000),
+                ("save_data", salvar, 3, 1000, 1),
+                ("deduplicar", deduplicar, 1000, 200_000, 1000),
+                ("deduplicar_bloom", deduplicar_bloom, 1000, 200_000, 1000),
+                ("detectar_anomalias", detectar_anomalias, 1000, 200_000, 1000),
+            )
+            for nome, funcao, min_ops, max_ops, ops_alocacao in casos:
+                resultado = {"benchmark": nome, "historico": tamanho}
+                resultado.update(medir(funcao, tempo, min_ops, max_ops))
+                resultado.update(medir_alocacoes(funcao, ops_alocacao))
+                # on_message só enfileira: esvazia a fila entre as medições
+                while not detector._fila.empty():
+                    detector._fila.get_nowait()
+                resultados.append(resultado)
+                _exibir(resultado)
+            if mensagens_ponta:
+                resultado = {"benchmark": "ponta_a_ponta", "historico": tamanho}
+                resultado.update(bancada.ponta_a_ponta(payloads, mensagens_ponta))
+                resultados.append(resultado)
+                _exibir(resultado)
+            bancada.encerrar()
+    return resultados
+
+
+def _commit_atual():
+    try:
+        saida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).resolve().parent,
+        )
+        return saida.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def comparar(base, atual, limiar):
+    """Imprime a variação de cada benchmark em relação à base. Retorna a quantidade de regressões."""
+    anteriores = {(r["benchmark"], r["historico"]): r for r in base["resultados"]}
+    regressoes = 0
+    print(f"\n📊 Comparação com {base['meta'].get('commit')} ({base['meta'].get('data')})")
+    for r in atual["resultados"]:
+        anterior = anteriores.get((r["benchmark"], r["historico"]))
+        if anterior is None:
+            continue
+        var_ops = (r["ops_por_s"] / anterior["ops_por_s"] - 1) if anterior["ops_por_s"] else 0.0
+        var_p99 = (r["p99_us"] / anterior["p99_us"] - 1) if anterior["p99_us"] else 0.0
+        regrediu = var_ops < -limiar or var_p99 > limiar
+        regressoes += regrediu
+        print(
+            f"{'⚠️ ' if regrediu else '  '} {r['benchmark']:<24} n={r['historico']:<8} "
+            f"ops/s {var_ops:+7.1%}  p99 {var_p99:+7.1%}"
+        )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks do DetectorColisao")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=list(TAMANHOS_PADRAO),
+                        help="tamanhos de histórico (max_history_size)")
+    parser.add_argument("--backend", choices=("json", "jsonl", "sqlite"), default=DATA_CONFIG["storage_backend"])
+    parser.add_argument("--tempo", type=float, default=1.0, help="segundos de medição por benchmark")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--mensagens", type=int, default=20_000,
+                        help="mensagens do teste ponta a ponta via loopback (0 desativa)")
+    parser.add_argument("--saida", type=Path, default=None, help="arquivo JSON de resultados")
+    parser.add_argument("--comparar", type=Path, default=None, help="resultados anteriores para comparação")
+    parser.add_argument("--limiar", type=float, default=0.10, help="variação considerada regressão (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    commit = _commit_atual()
+    agora = datetime.now()
+    relatorio = {
+        "meta": {
+            "commit": commit,
+            "data": agora.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "backend": args.backend,
+            "tempo": args.tempo,
+            "semente": args.semente,
+        },
+        "resultados": executar(args.tamanhos, args.backend, args.tempo, args.semente, args.mensagens),
+    }
+
+    saida = args.saida or (
+        Path(__file__).resolve().parent / "data" / "benchmarks"
+        / f"bench_{commit or 'local'}_{agora.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Resultados salvos em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        if comparar(base, relatorio, args.limiar):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
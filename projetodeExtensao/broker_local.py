@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Broker MQTT 3.1.1 mínimo, em processo, para testes locais sem mosquitto.
+
+Suporta CONNECT, SUBSCRIBE/UNSUBSCRIBE (curingas + e #), PUBLISH QoS 0/1
+(QoS 2 é aceito e entregue como QoS 1), PINGREQ, DISCONNECT, assinaturas
+compartilhadas ($share/<grupo>/<filtro>) e troca de sessão por client id.
+Não implementa retain, will, persistência de sessão nem autenticação.
+
+Uso: python broker_local.py [--host 127.0.0.1] [--port 1883]
+"""
+
+import argparse
+import asyncio
+import itertools
+import struct
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topico_corresponde(filtro, topico):
+    """Verifica se o tópico casa com o filtro MQTT (curingas + e #)."""
+    partes_filtro = filtro.split("/")
+    partes_topico = topico.split("/")
+    # Curingas no primeiro nível não casam com tópicos de sistema ($SYS...)
+    if topico.startswith("$") and partes_filtro[0] in ("+", "#"):
+        return False
+    for i, parte in enumerate(partes_filtro):
+        if parte == "#":
+            return True
+        if i >= len(partes_topico):
+            return False
+        if parte != "+" and parte != partes_topico[i]:
+            return False
+    return len(partes_filtro) == len(partes_topico)
+
+
+def separar_compartilhada(filtro):
+    """Retorna (grupo, filtro_real) para $share/<grupo>/<filtro> ou (None, filtro)."""
+    if filtro.startswith("$share/"):
+        _, grupo, real = filtro.split("/", 2)
+        return grupo, real
+    return None, filtro
+
+
+def _codificar_tamanho(tamanho):
+    saida = bytearray()
+    while True:
+        byte, tamanho = tamanho % 128, tamanho // 128
+        saida.append(byte | 0x80 if tamanho else byte)
+        if not tamanho:
+            return bytes(saida)
+
+
+def _string(texto):
+    dados = texto.encode("utf-8")
+    return struct.pack("!H", len(dados)) + dados
+
+
+def _ler_string(corpo, pos):
+    tamanho = struct.unpack_from("!H", corpo, pos)[0]
+    return corpo[pos + 2:pos + 2 + tamanho].decode("utf-8"), pos + 2 + tamanho
+
+
+def montar_publish(topico, payload, qos=0, pid=0):
+    """Monta um pacote PUBLISH."""
+    corpo = _string(topico) + (struct.pack("!H", pid) if qos else b"") + payload
+    return bytes([PUBLISH << 4 | qos << 1]) + _codificar_tamanho(len(corpo)) + corpo
+
+
+class _Sessao:
+    """Conexão de um cliente e suas assinaturas."""
+
+    def __init__(self, client_id, writer):
+        self.client_id = client_id
+        self.writer = writer
+        self.assinaturas = {}       # filtro (com $share) -> qos
+        self._pids = itertools.cycle(range(1, 65536))
+
+    def enviar(self, dados):
+        if not self.writer.is_closing():
+            self.writer.write(dados)
+
+    def proximo_pid(self):
+        return next(self._pids)
+
+
+class BrokerLocal:
+    """Broker MQTT em asyncio para testes e benchmarks locais."""
+
+    def __init__(self, host="127.0.0.1", port=1883):
+        self.host = host
+        self.port = port
+        self.sessoes = {}
+        self.publicadas = 0
+        self.entregues = 0
+        self._rodizio = {}          # (grupo, filtro) -> contador para round-robin
+        self._anonimos = itertools.count(1)
+        self._server = None
+        self._tarefas = set()
+
+    async def iniciar(self):
+        """Abre o socket do broker; com port=0 a porta escolhida fica em self.port."""
+        self._server = await asyncio.start_server(self._atender, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def parar(self):
+        if self._server is not None:
+            self._server.close()
+            for tarefa in list(self._tarefas):
+                tarefa.cancel()
+            await asyncio.gather(*self._tarefas, return_exceptions=True)
+            await self._server.wait_closed()
+
+    # ========== PROTOCOLO ==========
+    @staticmethod
+    async def _ler_pacote(reader):
+        cabecalho = await reader.readexactly(1)
+        tamanho, multiplicador = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            tamanho += (byte & 0x7F) * multiplicador
+            if not byte & 0x80:
+                break
+            multiplicador *= 128
+        corpo = await reader.readexactly(tamanho) if tamanho else b""
+        return cabecalho[0] >> 4, cabecalho[0] & 0x0F, corpo
+
+    async def _atender(self, reader, writer):
+        sessao = None
+        tarefa = asyncio.current_task()
+        self._tarefas.add(tarefa)
+        try:
+            tipo, _, corpo = await self._ler_pacote(reader)
+            if tipo != CONNECT:
+                return
+            sessao = self._conectar(corpo, writer)
+            while True:
+                tipo, flags, corpo = await self._ler_pacote(reader)
+                if tipo == PUBLISH:
+                    self._receber_publish(sessao, flags, corpo)
+                elif tipo == SUBSCRIBE:
+                    self._assinar(sessao, corpo)
+                elif tipo == UNSUBSCRIBE:
+                    self._cancelar(sessao, corpo)
+                elif tipo == PUBREL:
+                    sessao.enviar(bytes([PUBCOMP << 4, 2]) + corpo[:2])
+                elif tipo == PINGREQ:
+                    sessao.enviar(bytes([PINGRESP << 4, 0]))
+                elif tipo == DISCONNECT:
+                    break
+                # PUBACK/PUBREC/PUBCOMP dos assinantes não exigem ação
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Conexão encerrada pelo cliente ou broker parando
+            pass
+        finally:
+            if sessao is not None and self.sessoes.get(sessao.client_id) is sessao:
+                del self.sessoes[sessao.client_id]
+            self._tarefas.discard(tarefa)
+            writer.close()
+
+    def _conectar(self, corpo, writer):
+        _, pos = _ler_string(corpo, 0)          # Nome do protocolo ("MQTT")
+        pos += 4                                # Nível, flags e keepalive
+        client_id, _ = _ler_string(corpo, pos)
+        client_id = client_id or f"anonimo-{next(self._anonimos)}"
+        anterior = self.sessoes.get(client_id)
+        if anterior is not None:
+            # Mesmo client id: a sessão anterior é derrubada (como no mosquitto)
+            anterior.writer.close()
+        sessao = _Sessao(client_id, writer)
+        self.sessoes[client_id] = sessao
+        sessao.enviar(bytes([CONNACK << 4, 2, 0, 0]))
+        return sessao
+
+    def _receber_publish(self, sessao, flags, corpo):
+        qos = (flags >> 1) & 0x03
+        topico, pos = _ler_string(corpo, 0)
+        if qos:
+            pid = corpo[pos:pos + 2]
+            pos += 2
+            resposta = PUBACK if qos == 1 else PUBREC
+            sessao.enviar(bytes([resposta << 4, 2]) + pid)
+        self.publicar(topico, corpo[pos:], min(qos, 1))
+
+    def _assinar(self, sessao, corpo):
+        pid, pos = corpo[:2], 2
+        concedidos = bytearray()
+        while pos < len(corpo):
+            filtro, pos = _ler_string(corpo, pos)
+            qos = min(corpo[pos], 1)
+            pos += 1
+            sessao.assinaturas[filtro] = qos
+            concedidos.append(qos)
+        sessao.enviar(bytes([SUBACK << 4]) + _codificar_tamanho(2 + len(concedidos)) + pid + bytes(concedidos))
+
+    def _cancelar(self, sessao, corpo):
+        pid, pos = corpo[:2], 2
+        while pos < len(corpo):
+            filtro, pos = _ler_string(corpo, pos)
+            sessao.assinaturas.pop(filtro, None)
+        sessao.enviar(bytes([UNSUBACK << 4, 2]) + pid)
+
+    # ========== ROTEAMENTO ==========
+    def publicar(self, topico, payload, qos=0):
+        """Entrega a mensagem aos assinantes (um por grupo compartilhado)."""
+        self.publicadas += 1
+        grupos = {}
+        for sessao in self.sessoes.values():
+            melhor = -1
+            for filtro, qos_assinatura in sessao.assinaturas.items():
+                grupo, real = separar_compartilhada(filtro)
+                if not topico_corresponde(real, topico):
+                    continue
+                if grupo is None:
+                    melhor = max(melhor, qos_assinatura)
+                else:
+                    grupos.setdefault((grupo, real), []).append((sessao, qos_assinatura))
+            if melhor >= 0:
+                self._entregar(sessao, topico, payload, min(qos, melhor))
+        for chave, membros in grupos.items():
+            indice = self._rodizio.get(chave, 0)
+            self._rodizio[chave] = indice + 1
+            sessao, qos_assinatura = membros[indice % len(membros)]
+            self._entregar(sessao, topico, payload, min(qos, qos_assinatura))
+
+    def _entregar(self, sessao, topico, payload, qos):
+        sessao.enviar(montar_publish(topico, payload, qos, sessao.proximo_pid() if qos else 0))
+        self.entregues += 1
+
+
+def iniciar_em_thread(host="127.0.0.1", port=0):
+    """Executa o broker em uma thread própria (para scripts síncronos).
+
+    Retorna (broker, parar), onde `parar()` encerra o broker e a thread.
+    """
+    loop = asyncio.new_event_loop()
+    broker = BrokerLocal(host, port)
+    pronto = threading.Event()
+
+    def executar():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(broker.iniciar())
+        pronto.set()
+        loop.run_forever()
+        loop.run_until_complete(broker.parar())
+        loop.close()
+
+    thread = threading.Thread(target=executar, name="broker-local", daemon=True)
+    thread.start()
+    pronto.wait()
+
+    def parar():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+    return broker, parar
+
+
+async def _main(host, port):
+    broker = await BrokerLocal(host, port).iniciar()
+    print(f"📡 Broker local ouvindo em {broker.host}:{broker.port} (Ctrl+C para parar)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Broker MQTT mínimo para testes locais")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n🛑 Broker encerrado")
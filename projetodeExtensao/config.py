@@ -14,16 +14,23 @@ MQTT_CONFIG: dict = {
     "password": None,
     "client_id": "detector_colisao_pc",
     "topic": "vini123/colisao",
+    "transport": "paho",             # paho (broker MQTT real) ou loopback (barramento em processo, sem rede)
+    "shared_group": None,            # Grupo de assinatura compartilhada ($share/<grupo>/<topic>)
     "qos": 1,                        # Quality of Service: 0, 1 ou 2
     "retain": False,                 # Mantém a última mensagem no broker
+    "alert_topic": "vini123/colisao/alertas",         # Publicação dos alertas de taxa (None desativa)
+    "stats_topic": "vini123/colisao/estatisticas",    # Publicação periódica das estatísticas (None desativa)
     "clean_session": True
 }
 
 # ===== CONFIGURAÇÕES DE CONEXÃO =====
 CONNECTION_CONFIG: dict = {
     "timeout": 10,                   # Tempo limite para conectar (segundos)
-    "reconnect_delay": 5,            # Intervalo entre tentativas de reconexão
-    "max_reconnect_attempts": 10,
+    "reconnect_delay": 1,            # Espera antes da 1ª tentativa de reconexão; dobra a cada falha...
+    "reconnect_max_delay": 60,       # ... até este teto (tenta para sempre, sem desistir)
+    "reconnect_backoff_factor": 2,   # Multiplicador da espera entre tentativas
+    "reconnect_jitter": 0.5,         # Sorteia a espera em [teto * (1 - jitter), teto]: detectores não voltam juntos
+    "outbound_buffer_size": 1000,    # Alertas/estatísticas guardados enquanto offline (os mais antigos são descartados)
     "ping_interval": 30              # Intervalo de envio de ping (segundos)
 }
 
@@ -33,7 +40,10 @@ LOGGING_CONFIG: dict = {
     "file": Path("logs/colisao.log"),# Caminho do arquivo de log
     "max_size": 10 * 1024 * 1024,    # 10 MB
     "backup_count": 5,
-    "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    "async": True,                   # Registros enfileirados e gravados por uma thread (não bloqueia a ingestão)
+    "queue_size": 10000,             # Com a fila cheia, registros são descartados e contados
+    "console_max_per_second": 20     # Linhas "Colisão detectada" por segundo; o excedente é resumido
 }
 
 # ===== CONFIGURAÇÕES DE PERSISTÊNCIA =====
@@ -41,7 +51,21 @@ DATA_CONFIG: dict = {
     "save_to_file": True,
     "data_file": Path("data/historico_colisoes.json"),
     "auto_save_interval": 30,        # Salvar automaticamente a cada X segundos
-    "max_history_size": 1000         # Máximo de registros mantidos em memória
+    "max_history_size": 1000,        # Máximo de registros mantidos em memória
+    "storage_backend": "json",       # json (snapshot completo), jsonl (segmentos) ou sqlite (consultável)
+    "segments_dir": Path("data/segmentos"),
+    "segment_max_bytes": 16 * 1024 * 1024,  # Rotaciona o segmento JSONL ao atingir 16 MB
+    "segment_max_age": 3600,         # ... ou após X segundos aberto
+    "fsync_batch": 500,              # fsync a cada X eventos gravados
+    "fsync_interval": 5,             # ... ou a cada X segundos
+    "segment_batch_size": 200,       # Eventos relidos do buffer por vez na retomada após uma restauração
+    "sqlite_file": Path("data/colisoes.db"),
+    "sqlite_batch_size": 200,        # Máximo de inserções por transação
+    "rollups_file": Path("data/rollups.json"),  # Agregados por minuto/hora/dia
+    "recovery": True,                # Snapshot binário + WAL: reinício rápido sem perder o que chegou após o último salvamento
+    "recovery_dir": Path("data/recuperacao"),
+    "snapshot_interval": 60,         # Novo snapshot a cada X segundos (o WAL guarda os eventos posteriores)
+    "wal_fsync_interval": 1          # fsync do WAL e gravação dos eventos pendentes da persistência a cada X segundos
 }
 
 # ===== CONFIGURAÇÕES DE INTERFACE =====
@@ -61,7 +85,119 @@ STATS_CONFIG: dict = {
     "show_rate_per_hour": True,
     "show_peak_hour": True,
     "show_average_interval": True,
-    "alert_threshold": 10             # Alerta se houver mais de X colisões/min
+    "alert_threshold": 10,            # Alerta se houver mais de X colisões/min (soma de todos os sensores; ver ANOMALY_CONFIG)
+    "rate_windows": (60, 300, 3600),  # Janelas deslizantes de contagem (segundos)
+    "stats_interval": 60,             # Exibe as taxas a cada X segundos
+    "peak_hour_days": 30,             # Hora de pico calculada sobre os últimos X dias
+    "rollup_retention": {             # Baldes mantidos por nível de agregação
+        "minuto": 1440,               # 1 dia
+        "hora": 2160,                 # 90 dias
+        "dia": 3650                   # 10 anos
+    },
+    "rollup_max_sensors": 100         # Sensores com contagem própria em cada balde (os mais ativos)
+}
+
+# ===== CONFIGURAÇÕES DO ÍNDICE POR SENSOR =====
+SENSOR_CONFIG: dict = {
+    "max_sensors": 100_000,          # Sensores com estado individual (os vistos há mais tempo saem primeiro)
+    "rate_window": 60,               # Constante de tempo (s) da taxa móvel de cada sensor
+    "top_k": 20,                     # Tamanho do ranking de sensores mais ativos
+    "sketch_width": 4096,            # Count-min sketch: contadores por linha...
+    "sketch_depth": 4,               # ... e linhas (erro ~ total/largura com prob. 1 - e^-profundidade)
+    "decay_interval": 300            # Contagens do ranking caem pela metade a cada X segundos (0 = nunca)
+}
+
+# ===== CONFIGURAÇÕES DA DETECÇÃO DE ANOMALIAS POR SENSOR =====
+ANOMALY_CONFIG: dict = {
+    "enabled": True,                 # EWMA de ritmo e intensidade por sensor + z-score/CUSUM
+    "alpha": 0.01,                   # Peso de cada evento nas médias móveis (~1/alpha eventos de memória)
+    "min_samples": 20,               # Eventos do sensor antes de começar a acusar anomalias
+    "z_threshold": 4.0,              # z-score de intensidade que acusa uma colisão isolada anômala
+    "cusum_k": 0.5,                  # Folga da CUSUM (desvios menores que k desvios-padrão são ignorados)
+    "cusum_h": 10.0,                 # Limiar da CUSUM (menor = detecta antes, com mais falsos alarmes)
+    "min_gap": 0.001,                # Intervalo mínimo entre colisões do mesmo sensor (segundos)
+    "alert_interval": 60,            # No máximo um alerta por sensor a cada X segundos
+    "max_sensors": 100_000           # Sensores com estado (os vistos há mais tempo saem primeiro)
+}
+
+# ===== CONFIGURAÇÕES DO ÍNDICE ESPACIAL (localização x, y) =====
+SPATIAL_CONFIG: dict = {
+    "cell_size": 5,                  # Lado das células da grade (mesma unidade de x/y); ~ raio típico das consultas
+    "retention": 3600,               # Colisões indexadas por X segundos (janela máxima das consultas e do mapa de calor)
+    "max_events": 100_000,           # Máximo de pontos indexados (os mais antigos saem primeiro)
+    "heatmap_bounds": (0, 0, 100, 100),  # Área do mapa de calor: (x_min, y_min, x_max, y_max)
+    "heatmap_resolution": (20, 20)   # Células do mapa de calor: (colunas, linhas)
+}
+
+# ===== CONFIGURAÇÕES DAS ANÁLISES VETORIZADAS (analitica.py, requer NumPy) =====
+ANALYTICS_CONFIG: dict = {
+    "workers": 1,                    # Processos do pool de relatórios (não disputam o GIL com a ingestão)
+    "start_method": "spawn",         # Início dos processos do pool (spawn não herda threads/locks do detector)
+    "timeout": 60,                   # Espera máxima (s) por um relatório na API
+    "percentiles": (50, 90, 95, 99), # Percentis das distribuições
+    "histogram_bins": 20,            # Faixas dos histogramas
+    "max_histogram_bins": 200,       # Máximo de faixas aceito no parâmetro ?faixas= da API
+    "rate_window": 60,               # Janela (s) da taxa móvel...
+    "rate_step": 10                  # ... amostrada a cada X segundos
+}
+
+# ===== CONFIGURAÇÕES DO PIPELINE DE PROCESSAMENTO =====
+PIPELINE_CONFIG: dict = {
+    "queue_size": 10000,             # Profundidade máxima da fila entre o MQTT e os workers
+    "batch_size": 100,               # Máximo de mensagens processadas por lote
+    "workers": 1,                    # Threads que decodificam, armazenam e alertam
+    "json_backend": "auto",          # auto (orjson > ujson > json), orjson, ujson ou json
+    "max_payload_bytes": 64 * 1024   # Payloads maiores são rejeitados
+}
+
+# ===== CONFIGURAÇÕES DE DEDUPLICAÇÃO =====
+DEDUP_CONFIG: dict = {
+    "enabled": True,                 # Descarta reentregas QoS 1 e retransmissões dos sensores
+    "ttl": 600,                      # Chave (sensor, colisao_id) ou hash do payload lembrada por X segundos desde a última vista
+    "max_entries": 100_000,          # Máximo de chaves no LRU (as mais antigas saem primeiro)
+    "bloom": False,                  # Filtro de Bloom rotativo para frotas muito grandes (falsos positivos descartam colisões novas)
+    "bloom_capacity": 1_000_000,     # Chaves por geração do filtro (~1,8 MB por geração com erro de 0,1%)
+    "bloom_error_rate": 0.001,       # Taxa de falsos positivos desejada
+    "bloom_rotation": 3600           # Nova geração a cada X segundos (cada chave é lembrada por 1x a 2x esse tempo)
+}
+
+# ===== CONFIGURAÇÕES DO RUNTIME ASYNCIO (detector_async.py) =====
+ASYNC_CONFIG: dict = {
+    "api_host": "0.0.0.0",
+    "api_port": 5001,                # API HTTP (JSON) servida no próprio event loop
+    "health_interval": 1             # Verificação de taxa/alertas a cada X segundos
+}
+
+# ===== CONFIGURAÇÕES DO SUPERVISOR (supervisor_detector.py) =====
+SUPERVISOR_CONFIG: dict = {
+    "workers": 4,                    # Processos detectores
+    "shared_group": "detectores",    # Grupo $share usado para balancear as mensagens
+    "report_interval": 5,            # Cada worker envia suas estatísticas a cada X segundos
+    "restart_delay": 2,              # Espera inicial antes de reiniciar um worker que caiu
+    "max_restart_delay": 60          # Espera máxima entre reinícios consecutivos
+}
+
+# ===== CONFIGURAÇÕES DO SERVIDOR WEB (web_server.py) =====
+WEB_CONFIG: dict = {
+    "host": "0.0.0.0",
+    "port": 5000,
+    "stream_fps": 4,                 # Quadros por segundo enviados a cada painel (eventos agrupados)
+    "stream_max_eventos": 500,       # Máximo de eventos por quadro
+    "stream_stats_interval": 2,      # Estatísticas agregadas enviadas a cada X segundos
+    "stream_heartbeat": 15,          # Comentário SSE para manter a conexão viva (segundos)
+    "stream_retry_ms": 2000          # Espera sugerida ao navegador antes de reconectar
+}
+
+# ===== CONFIGURAÇÕES DE PERFILAMENTO (perfilador.py) =====
+PROFILING_CONFIG: dict = {
+    "mode": "amostragem",            # amostragem (baixo custo) ou deterministico (cProfile nas threads do pipeline)
+    "duration": 30,                  # Duração padrão da janela (segundos)
+    "max_duration": 600,             # Janela máxima aceita pelo endpoint de administração
+    "sample_interval": 0.005,        # Intervalo entre amostras de pilha (segundos)
+    "memory": False,                 # Também registra tracemalloc durante a janela
+    "tracemalloc_frames": 10,        # Profundidade das pilhas de alocação
+    "signal": "SIGUSR1",             # Sinal que abre/fecha a janela (ignorado onde não existe, ex.: Windows)
+    "admin_token": None              # Token do endpoint /api/admin/perfil; sem token, só aceita localhost
 }
 
 # ===== AGRUPAMENTO GERAL (para facilitar importação) =====
@@ -71,5 +207,15 @@ CONFIG: dict = {
     "logging": LOGGING_CONFIG,
     "data": DATA_CONFIG,
     "ui": UI_CONFIG,
-    "stats": STATS_CONFIG
+    "stats": STATS_CONFIG,
+    "sensores": SENSOR_CONFIG,
+    "anomalias": ANOMALY_CONFIG,
+    "espacial": SPATIAL_CONFIG,
+    "analitica": ANALYTICS_CONFIG,
+    "pipeline": PIPELINE_CONFIG,
+    "dedup": DEDUP_CONFIG,
+    "async": ASYNC_CONFIG,
+    "supervisor": SUPERVISOR_CONFIG,
+    "web": WEB_CONFIG,
+    "profiling": PROFILING_CONFIG
 }
@@ -0,0 +1,209 @@
+"""
+Decodificador e validador dos payloads de colisão.
+
+Normaliza os formatos enviados pelos diferentes produtores em um EventoColisao:
+- simulador_colisoes.py:      "sensor", "colisao_id", "localizacao": {"x", "y"}, intensidade 1-10
+- SimuladorIntegracao / testes: "sensor_id", "numero", "localizacao" textual, intensidade textual
+- simulador web (index.html):  "sensor_id", "distancia", "velocidade"
+"""
+
+import json
+import math
+import time
+from datetime import datetime
+
+from eventos import EventoColisao
+
+# Escala textual de intensidade convertida para a escala numérica 1-10
+INTENSIDADES = {"baixa": 3.0, "media": 5.0, "média": 5.0, "alta": 8.0, "critica": 10.0, "crítica": 10.0}
+
+
+def escolher_backend_json(preferido="auto"):
+    """Retorna (nome, loads) do parser JSON: orjson ou ujson se instalados, senão o stdlib."""
+    candidatos = ("orjson", "ujson", "json") if preferido == "auto" else (preferido,)
+    for nome in candidatos:
+        if nome == "json":
+            return "json", json.loads
+        try:
+            modulo = __import__(nome)
+        except ImportError:
+            continue
+        return nome, modulo.loads
+    return "json", json.loads
+
+
+class PayloadInvalido(ValueError):
+    """Payload rejeitado pelo decodificador; `motivo` identifica o contador incrementado."""
+
+    def __init__(self, motivo, detalhe=""):
+        super().__init__(f"{motivo}: {detalhe}" if detalhe else motivo)
+        self.motivo = motivo
+
+
+def _numero(dados, campo):
+    """Lê um campo numérico opcional; rejeita valores não numéricos ou não finitos (NaN, Infinity, 1e999)."""
+    valor = dados.get(campo)
+    if valor is None:
+        return None
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        raise PayloadInvalido("campo_invalido", campo)
+    valor = float(valor)
+    if not math.isfinite(valor):
+        raise PayloadInvalido("campo_invalido", campo)
+    return valor
+
+
+class Decodificador:
+    """Converte payloads MQTT em EventoColisao, contando rejeições por motivo.
+
+    O custo de cada chamada (decodificação + validação) é medido com
+    perf_counter_ns e acumulado em `tempo_total_ns`.
+    """
+
+    MOTIVOS = (
+        "payload_grande", "utf8_invalido", "json_invalido", "nao_objeto",
+        "tipo_nao_colisao", "campo_invalido",
+    )
+
+    def __init__(self, backend="auto", max_payload_bytes=64 * 1024):
+        self.backend, self._loads = escolher_backend_json(backend)
+        self.max_payload_bytes = max_payload_bytes
+        self.aceitos = 0
+        self.rejeicoes = dict.fromkeys(self.MOTIVOS, 0)
+        self.tempo_total_ns = 0
+        self.tempo_max_ns = 0
+
+    def decodificar(self, payload, recebido_em):
+        """Retorna o EventoColisao normalizado ou levanta PayloadInvalido."""
+        inicio = time.perf_counter_ns()
+        try:
+            evento = self._normalizar(self._carregar(payload), recebido_em, payload)
+        except PayloadInvalido as e:
+            self.rejeicoes[e.motivo] += 1
+            raise
+        finally:
+            custo = time.perf_counter_ns() - inicio
+            self.tempo_total_ns += custo
+            if custo > self.tempo_max_ns:
+                self.tempo_max_ns = custo
+        self.aceitos += 1
+        return evento
+
+    def _carregar(self, payload):
+        if len(payload) > self.max_payload_bytes:
+            raise PayloadInvalido("payload_grande", f"{len(payload)} bytes")
+        # orjson valida o UTF-8 direto dos bytes; os demais recebem str
+        if isinstance(payload, (bytes, bytearray)) and self.backend != "orjson":
+            try:
+                payload = payload.decode("utf-8")
+            except UnicodeDecodeError as e:
+                raise PayloadInvalido("utf8_invalido", str(e))
+        try:
+            return self._loads(payload)
+        except (ValueError, TypeError) as e:
+            raise PayloadInvalido("json_invalido", str(e))
+
+    def normalizar(self, dados, recebido_em):
+        """Normaliza um payload já decodificado (ex.: relido da persistência); levanta PayloadInvalido.
+
+        O registro não guarda o payload (`bruto` None): serve às análises, que só usam os campos.
+        """
+        return self._normalizar(dados, recebido_em)
+
+    def _normalizar(self, dados, recebido_em, bruto=None):
+        if not isinstance(dados, dict):
+            raise PayloadInvalido("nao_objeto", type(dados).__name__)
+        tipo_msg = dados.get("tipo", "colisao")
+        if tipo_msg != "colisao":
+            raise PayloadInvalido("tipo_nao_colisao", str(tipo_msg))
+
+        sensor = dados.get("sensor") or dados.get("sensor_id") or "desconhecido"
+        if not isinstance(sensor, str):
+            raise PayloadInvalido("campo_invalido", "sensor")
+
+        colisao_id = dados.get("colisao_id", dados.get("numero"))
+        if colisao_id is not None and (isinstance(colisao_id, bool) or not isinstance(colisao_id, int)):
+            raise PayloadInvalido("campo_invalido", "colisao_id")
+
+        # Intensidade numérica (1-10) ou textual (baixa/media/alta/critica)
+        intensidade = dados.get("intensidade")
+        if isinstance(intensidade, str):
+            if intensidade.lower() not in INTENSIDADES:
+                raise PayloadInvalido("campo_invalido", "intensidade")
+            intensidade = INTENSIDADES[intensidade.lower()]
+        else:
+            intensidade = _numero(dados, "intensidade")
+
+        # Localização em coordenadas {"x", "y"} ou textual ("frontal", "traseira"...)
+        x = y = local = None
+        localizacao = dados.get("localizacao")
+        if isinstance(localizacao, dict):
+            x, y = _numero(localizacao, "x"), _numero(localizacao, "y")
+        elif isinstance(localizacao, str):
+            local = localizacao
+        elif localizacao is not None:
+            raise PayloadInvalido("campo_invalido", "localizacao")
+
+        tipo = dados.get("tipo_colisao") or local
+        if tipo is not None and not isinstance(tipo, str):
+            raise PayloadInvalido("campo_invalido", "tipo_colisao")
+
+        return EventoColisao(
+            recebido_em,
+            sensor=sensor,
+            tipo=tipo,
+            bruto=bruto,
+            colisao_id=colisao_id,
+            enviado_em=self._instante(dados.get("timestamp")),
+            intensidade=intensidade,
+            velocidade=_numero(dados, "velocidade"),
+            distancia=_numero(dados, "distancia"),
+            x=x,
+            y=y,
+            local=local,
+        )
+
+    @staticmethod
+    def _instante(valor):
+        """Converte o timestamp do produtor (epoch ou ISO 8601) para epoch."""
+        if valor is None:
+            return None
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            return float(valor)
+        if isinstance(valor, str):
+            try:
+                return datetime.fromisoformat(valor.replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                pass
+        raise PayloadInvalido("campo_invalido", "timestamp")
+
+    # ========== ESTATÍSTICAS ==========
+    @property
+    def rejeitados(self):
+        return sum(self.rejeicoes.values())
+
+    def custo_medio_ns(self):
+        """Custo médio por mensagem (aceitas e rejeitadas), em nanossegundos."""
+        total = self.aceitos + self.rejeitados
+        return self.tempo_total_ns / total if total else 0.0
+
+    def estatisticas(self):
+        return self.combinar([self])
+
+    @staticmethod
+    def combinar(decodificadores):
+        """Soma as estatísticas de vários decodificadores (um por worker)."""
+        aceitos = sum(d.aceitos for d in decodificadores)
+        rejeicoes = {motivo: sum(d.rejeicoes[motivo] for d in decodificadores) for motivo in Decodificador.MOTIVOS}
+        rejeitados = sum(rejeicoes.values())
+        tempo_total = sum(d.tempo_total_ns for d in decodificadores)
+        tempo_max = max((d.tempo_max_ns for d in decodificadores), default=0)
+        total = aceitos + rejeitados
+        return {
+            "backend": decodificadores[0].backend if decodificadores else None,
+            "aceitos": aceitos,
+            "rejeitados": rejeitados,
+            "rejeicoes": rejeicoes,
+            "custo_medio_us": round(tempo_total / total / 1000, 2) if total else 0.0,
+            "custo_max_us": round(tempo_max / 1000, 2),
+        }
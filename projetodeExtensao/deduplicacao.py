@@ -0,0 +1,179 @@
+"""
+Supressão de mensagens duplicadas (reentregas QoS 1 e retransmissões dos sensores).
+
+A identidade de uma colisão é (sensor, colisao_id/numero, timestamp do
+produtor) quando o produtor envia a própria sequência: uma reentrega repete o
+timestamp, mas um produtor reiniciado que recomeça a numeração dentro do `ttl`
+não tem suas colisões descartadas. Sem sequência, um hash do payload bruto. As chaves vistas
+ficam num LRU com expiração (`ttl` desde a última vez vista) e tamanho máximo,
+então a memória é limitada independentemente do tráfego. Para frotas muito
+grandes, um filtro de Bloom rotativo opcional lembra muito mais chaves em
+poucos bytes cada, ao custo de uma taxa configurável de falsos positivos
+(colisões novas descartadas como duplicadas).
+"""
+
+import collections
+import hashlib
+import math
+import threading
+import time
+
+
+def chave_evento(evento, payload):
+    """(sensor, colisao_id, enviado_em) se o produtor numera as colisões; senão o hash do payload bruto."""
+    if evento.colisao_id is not None:
+        return evento.sensor, evento.colisao_id, evento.enviado_em
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _bytes_da_chave(chave):
+    if isinstance(chave, bytes):
+        return chave
+    sensor, colisao_id, enviado_em = chave
+    return f"{sensor}\0{colisao_id}\0{enviado_em!r}".encode("utf-8")
+
+
+class CacheLRUExpiravel:
+    """Chaves vistas nos últimos `ttl` segundos, limitadas às `capacidade` mais recentes."""
+
+    def __init__(self, capacidade=100_000, ttl=600.0):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._itens = collections.OrderedDict()    # chave -> instante em que foi vista por último
+
+    def __len__(self):
+        return len(self._itens)
+
+    def verificar(self, chave, agora):
+        """True se a chave foi vista há menos de `ttl`; em todo caso registra/renova a chave."""
+        itens = self._itens
+        visto_em = itens.get(chave)
+        itens[chave] = agora
+        itens.move_to_end(chave)
+        # Ordem do dicionário = ordem de última vista: expirados e excedentes estão no início
+        while itens:
+            primeira, instante = next(iter(itens.items()))
+            if agora - instante < self.ttl and len(itens) <= self.capacidade:
+                break
+            del itens[primeira]
+        return visto_em is not None and agora - visto_em < self.ttl
+
+
+class FiltroBloomRotativo:
+    """Dois filtros de Bloom (atual e anterior); o atual é renovado a cada `rotacao` segundos ou ao encher.
+
+    Uma chave é lembrada por pelo menos uma geração (entre `rotacao` e 2x `rotacao`).
+    """
+
+    def __init__(self, capacidade=1_000_000, taxa_erro=0.001, rotacao=3600.0):
+        self.capacidade = capacidade
+        self.rotacao = rotacao
+        self.bits = max(8, math.ceil(-capacidade * math.log(taxa_erro) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacidade * math.log(2)))
+        self._atual = bytearray((self.bits + 7) // 8)
+        self._anterior = bytearray(len(self._atual))
+        self._inseridas = 0
+        self._inicio = None
+
+    @property
+    def memoria_bytes(self):
+        return len(self._atual) + len(self._anterior)
+
+    def _posicoes(self, chave):
+        # Hashing duplo (Kirsch-Mitzenmacher): k posições a partir de dois hashes de 64 bits
+        resumo = hashlib.blake2b(_bytes_da_chave(chave), digest_size=16).digest()
+        h1 = int.from_bytes(resumo[:8], "little")
+        h2 = int.from_bytes(resumo[8:], "little") | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def _rotacionar(self, agora):
+        if self._inicio is None:
+            self._inicio = agora
+        if agora - self._inicio >= self.rotacao or self._inseridas >= self.capacidade:
+            self._anterior = self._atual
+            self._atual = bytearray(len(self._anterior))
+            self._inseridas = 0
+            self._inicio = agora
+
+    def verificar(self, chave, agora):
+        """True se a chave (provavelmente) já foi vista; registra-a na geração atual."""
+        self._rotacionar(agora)
+        posicoes = self._posicoes(chave)
+        atual = self._atual
+        nova = False
+        # Testa e marca na mesma passada: algum bit apagado = chave nova nesta geração
+        for p in posicoes:
+            byte, bit = p >> 3, 1 << (p & 7)
+            if not atual[byte] & bit:
+                atual[byte] |= bit
+                nova = True
+        if not nova:
+            return True
+        self._inseridas += 1
+        anterior = self._anterior
+        for p in posicoes:
+            if not anterior[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class Deduplicador:
+    """Etapa de deduplicação do pipeline (compartilhada pelos workers)."""
+
+    def __init__(self, capacidade=100_000, ttl=600.0, bloom=False, bloom_capacidade=1_000_000,
+                 bloom_taxa_erro=0.001, bloom_rotacao=3600.0, relogio=time.monotonic):
+        self.lru = CacheLRUExpiravel(capacidade, ttl)
+        self.bloom = FiltroBloomRotativo(bloom_capacidade, bloom_taxa_erro, bloom_rotacao) if bloom else None
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self.duplicadas_lru = 0
+        self.duplicadas_bloom = 0
+
+    @classmethod
+    def de_config(cls, config):
+        """Cria a partir de DEDUP_CONFIG; None se desativado."""
+        if not config["enabled"]:
+            return None
+        return cls(
+            config["max_entries"], config["ttl"], config["bloom"], config["bloom_capacity"],
+            config["bloom_error_rate"], config["bloom_rotation"],
+        )
+
+    @property
+    def duplicadas(self):
+        return self.duplicadas_lru + self.duplicadas_bloom
+
+    def duplicado(self, evento, payload, instante=None):
+        """True se o evento já foi recebido (conta a duplicata); senão registra a chave."""
+        chave = chave_evento(evento, payload)
+        agora = self._relogio() if instante is None else instante
+        with self._lock:
+            if self.lru.verificar(chave, agora):
+                self.duplicadas_lru += 1
+                return True
+            # Fora do LRU (expirada ou despejada): o Bloom ainda pode lembrar a chave
+            if self.bloom is not None and self.bloom.verificar(chave, agora):
+                self.duplicadas_bloom += 1
+                return True
+            return False
+
+    def registrar(self, evento, payload, instante=None):
+        """Registra a chave sem contar duplicata (ex.: eventos reaplicados do WAL)."""
+        chave = chave_evento(evento, payload)
+        agora = self._relogio() if instante is None else instante
+        with self._lock:
+            self.lru.verificar(chave, agora)
+            if self.bloom is not None:
+                self.bloom.verificar(chave, agora)
+
+    def estatisticas(self):
+        return {
+            "duplicadas": self.duplicadas,
+            "duplicadas_lru": self.duplicadas_lru,
+            "duplicadas_bloom": self.duplicadas_bloom,
+            "chaves_lru": len(self.lru),
+            "memoria_bloom_bytes": self.bloom.memoria_bytes if self.bloom else 0,
+        }
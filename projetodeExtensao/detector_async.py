@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Runtime asyncio do Sistema de Detecção de Colisão.
+
+MQTT, processamento, salvamento, monitoramento de taxa, reconexão e a API HTTP
+rodam como tarefas em um único event loop: o número de threads não cresce com
+reconexões nem com a quantidade de tarefas. O que espera o disco (salvamento,
+snapshot, fsync do WAL, lotes do SQLite/JSONL) roda via asyncio.to_thread.
+
+Uso:
+    python detector_async.py                 # broker de MQTT_CONFIG / MQTT_BROKER
+    python detector_async.py --broker-local  # broker em processo (broker_local.py)
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import TimeoutError as TempoEsgotado
+
+import paho.mqtt.client as mqtt
+from colorama import Fore, Style
+
+from config import ASYNC_CONFIG
+from detector_colisao import DetectorColisao
+from broker_local import BrokerLocal
+
+
+class _AdaptadorPahoAsyncio:
+    """Liga o socket do cliente paho ao event loop (add_reader/add_writer)."""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self._misc = None
+        client.on_socket_open = self._socket_aberto
+        client.on_socket_close = self._socket_fechado
+        client.on_socket_register_write = self._registrar_escrita
+        client.on_socket_unregister_write = self._cancelar_escrita
+
+    def _socket_aberto(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc = self.loop.create_task(self._loop_misc())
+
+    def _socket_fechado(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self._misc is not None:
+            self._misc.cancel()
+
+    def _registrar_escrita(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _cancelar_escrita(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _loop_misc(self):
+        """Keepalive e retentativas do paho, uma vez por segundo."""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class DetectorColisaoAsync(DetectorColisao):
+    """Detector de colisões com todas as atividades em tarefas asyncio."""
+
+    def __init__(self):
+        self.async_config = ASYNC_CONFIG.copy()
+        self._reconectar = asyncio.Event()
+        self._parar = asyncio.Event()
+        self._loop = None
+        self._gravacoes = set()     # Gravações em thread ainda em andamento
+        super().__init__()
+
+    # ========== GANCHOS DO DETECTOR ==========
+    def _start_workers(self):
+        """Sem threads: a fila é consumida pela tarefa de processamento."""
+        self._fila = asyncio.Queue(maxsize=self.pipeline_config["queue_size"])
+
+    def _start_auto_save(self):
+        """Sem threads: o salvamento periódico é uma tarefa do loop."""
+
+    def _start_disco(self):
+        """Sem threads: fsync do WAL e lotes da persistência ficam com a tarefa `_tarefa_disco`."""
+
+    def _enfileirar(self, item):
+        """put_nowait na fila (chamar dentro do loop); conta o descarte se estiver cheia."""
+        try:
+            self._fila.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self.mensagens_descartadas += 1
+            return False
+
+    def _on_message(self, client, userdata, msg):
+        """Executado dentro do loop (loop_read): apenas enfileira."""
+        self.mensagens_recebidas += 1
+        self._enfileirar((msg.topic, msg.payload, time.time_ns()))
+
+    def injetar(self, payload, topico=None, bloquear=False, timeout=None):
+        """Enfileira um payload vindo do próprio loop ou de outra thread (ex.: API web, reprodução).
+
+        asyncio.Queue não é thread-safe: de fora do loop, o item é entregue via call_soon_threadsafe
+        (o descarte com a fila cheia é contado no loop) ou, com `bloquear=True`, espera por espaço
+        até `timeout`. Retorna False se o payload foi descartado.
+        """
+        self._m_injetadas.inc()
+        item = (topico or self.mqtt_config["topic"], payload, time.time_ns())
+        try:
+            no_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            no_loop = False
+        if no_loop or self._loop is None:
+            return self._enfileirar(item)
+        try:
+            if not bloquear:
+                self._loop.call_soon_threadsafe(self._enfileirar, item)
+                return True
+            futuro = asyncio.run_coroutine_threadsafe(self._fila.put(item), self._loop)
+        except RuntimeError:            # Loop já encerrado
+            self.mensagens_descartadas += 1
+            return False
+        try:
+            futuro.result(timeout)
+            return True
+        except TempoEsgotado:
+            # Se a inserção concluiu no mesmo instante, o cancelamento falha e o item está na fila
+            if futuro.cancel():
+                self.mensagens_descartadas += 1
+                return False
+            return True
+
+    def _start_reconexao(self):
+        """Sem threads: a reconexão é a tarefa única `_tarefa_reconexao`."""
+
+    def _acordar_reconexao(self):
+        """Sinaliza a tarefa única de reconexão (chamado dentro do loop)."""
+        if not self._stop_event.is_set():
+            self._reconectar.set()
+
+    # ========== TAREFAS ==========
+    async def _tarefa_processamento(self):
+        batch_size = self.pipeline_config["batch_size"]
+        while True:
+            lote = [await self._fila.get()]
+            while len(lote) < batch_size and not self._fila.empty():
+                lote.append(self._fila.get_nowait())
+            # Um lote com erro inesperado não pode encerrar a tarefa consumidora
+            try:
+                self._processar_lote(lote)
+            except Exception as e:
+                self._m_falhas.inc()
+                self.logger.error(f"Erro ao processar lote de {len(lote)} mensagens: {e}")
+            # Cede o loop à rede entre lotes
+            await asyncio.sleep(0)
+
+    async def _em_thread(self, funcao):
+        """asyncio.to_thread protegido do cancelamento: o encerramento espera a gravação em andamento."""
+        tarefa = asyncio.ensure_future(asyncio.to_thread(funcao))
+        self._gravacoes.add(tarefa)
+        tarefa.add_done_callback(self._gravacoes.discard)
+        return await asyncio.shield(tarefa)
+
+    async def _tarefa_salvamento(self):
+        await self._em_thread(self._retomar_persistencia)
+        while True:
+            await asyncio.sleep(self.data_config["auto_save_interval"])
+            await self._em_thread(self._save_data)
+            # Como no auto-save em thread: snapshot a cada snapshot_interval
+            await self._snapshot_periodico_async()
+
+    async def _snapshot_periodico_async(self):
+        """Captura no loop (o lock de estado, threading, nunca é disputado com o processamento) e grava em thread."""
+        if self.recuperacao is None or \
+                time.monotonic() - self._ultimo_snapshot < self.data_config["snapshot_interval"]:
+            return
+        try:
+            capturado = self._capturar_snapshot()
+        except Exception as e:
+            self._ultimo_snapshot = time.monotonic()
+            self.logger.error(f"Erro ao gravar snapshot: {e}")
+            return
+        await self._em_thread(lambda: self._gravar_snapshot(capturado))
+
+    async def _tarefa_disco(self):
+        """fsync do WAL e lotes pendentes da persistência a cada wal_fsync_interval, em thread."""
+        while True:
+            await asyncio.sleep(self.data_config["wal_fsync_interval"])
+            await self._em_thread(self._descarregar_disco)
+
+    async def _tarefa_saude(self):
+        while True:
+            await asyncio.sleep(self.async_config["health_interval"])
+            if self.conectado:
+                self._check_connection_health()
+
+    async def _tarefa_reconexao(self):
+        while True:
+            await self._reconectar.wait()
+            self._reconectar.clear()
+            if self.conectado:
+                self._descarregar_saida()
+                continue
+            await asyncio.sleep(self._proxima_espera())
+            if self.conectado:
+                continue
+            try:
+                self.client.reconnect()
+            except Exception as e:
+                self.logger.error(f"Erro na reconexão: {e}")
+                self._reconectar.set()
+
+    # ========== API HTTP ==========
+    def _rotas_api(self):
+        """Rotas GET da API JSON servida pelo loop."""
+        return {
+            "/api/estatisticas": self.get_estatisticas,
+            "/api/sensores/top": lambda: {"sensores": self.sensores.mais_ativos(time.time())},
+            "/api/espacial/mapa_calor": lambda: self.espacial.mapa_calor(time.time()),
+        }
+
+    async def _tarefa_api(self):
+        servidor = await asyncio.start_server(
+            self._atender_http, self.async_config["api_host"], self.async_config["api_port"]
+        )
+        async with servidor:
+            await servidor.serve_forever()
+
+    async def _atender_http(self, reader, writer):
+        """HTTP/1.0 mínimo: uma requisição GET por conexão, resposta JSON."""
+        try:
+            linha = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            metodo, caminho = (linha[0], linha[1].split("?", 1)[0]) if len(linha) >= 2 else ("", "")
+            rota = self._rotas_api().get(caminho)
+            if metodo != "GET" or rota is None:
+                status, corpo = "404 Not Found", {"erro": "rota não encontrada"}
+            else:
+                try:
+                    status, corpo = "200 OK", rota()
+                except Exception as e:
+                    self.logger.error(f"Erro na API ({caminho}): {e}")
+                    status, corpo = "500 Internal Server Error", {"erro": "erro interno"}
+            dados = json.dumps(corpo, ensure_ascii=False, default=str).encode("utf-8")
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(dados)}\r\n\r\n".encode("latin-1") + dados
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        except Exception as e:
+            # Requisição malformada ou falha inesperada: só esta conexão é encerrada
+            self.logger.error(f"Erro ao atender requisição HTTP: {e}")
+        finally:
+            writer.close()
+
+    # ========== CICLO PRINCIPAL ==========
+    async def executar(self, broker_local=False):
+        """Executa o detector até `parar()` ser chamado (ou Ctrl+C)."""
+        loop = self._loop = asyncio.get_running_loop()
+        if self.mqtt_config["transport"] == "paho":
+            _AdaptadorPahoAsyncio(loop, self.client)
+        # Com o transporte loopback, publique a partir do próprio loop (a fila é um asyncio.Queue)
+
+        broker = None
+        if broker_local:
+            broker = await BrokerLocal("127.0.0.1", 0).iniciar()
+            self.mqtt_config["broker"], self.mqtt_config["port"] = broker.host, broker.port
+
+        self._print(sep=True)
+        self._print("🚀 Iniciando Sistema de Detecção de Colisões (asyncio)", Fore.GREEN, Style.BRIGHT)
+        self._print(sep=True)
+
+        tarefas = [
+            asyncio.create_task(self._tarefa_processamento(), name="processamento"),
+            asyncio.create_task(self._tarefa_salvamento(), name="salvamento"),
+            asyncio.create_task(self._tarefa_disco(), name="disco"),
+            asyncio.create_task(self._tarefa_saude(), name="saude"),
+            asyncio.create_task(self._tarefa_reconexao(), name="reconexao"),
+            asyncio.create_task(self._tarefa_api(), name="api"),
+        ]
+        try:
+            try:
+                self.client.connect(self.mqtt_config["broker"], self.mqtt_config["port"], self.mqtt_config["keepalive"])
+            except OSError as e:
+                self.logger.error(f"Erro ao conectar: {e}")
+                self._attempt_reconnect()
+            await self._parar.wait()
+        finally:
+            await self._encerrar(tarefas)
+            if broker is not None:
+                await broker.parar()
+
+    def parar(self):
+        """Solicita o encerramento (chamar de dentro do loop)."""
+        self._parar.set()
+
+    async def _encerrar(self, tarefas):
+        self._stop_event.set()
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        await asyncio.gather(*self._gravacoes, return_exceptions=True)
+
+        # Processa o que restou na fila antes do último salvamento
+        restante = []
+        while not self._fila.empty():
+            restante.append(self._fila.get_nowait())
+        if restante:
+            self._processar_lote(restante)
+        await asyncio.to_thread(self._save_data)
+        capturado = None
+        if self.recuperacao is not None:
+            try:
+                capturado = self._capturar_snapshot()
+            except Exception as e:     # A thread tenta capturar de novo: sem disputa, nada mais processa
+                self.logger.error(f"Erro ao capturar snapshot final: {e}")
+        await asyncio.to_thread(self._encerrar_recuperacao, capturado)
+        await asyncio.to_thread(self.persistencia.fechar)
+        self._descarregar_saida()
+        self.client.disconnect()
+        self.perfilador.parar()
+        self.logger.info("Sistema finalizado com segurança.")
+        self._parar_logging()
+
+    def run(self, broker_local=False):
+        try:
+            asyncio.run(self.executar(broker_local))
+        except KeyboardInterrupt:
+            self._print("\n🛑 Encerrando sistema...", Fore.YELLOW)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detector de colisões (runtime asyncio)")
+    parser.add_argument("--broker-local", action="store_true", help="usa um broker MQTT em processo")
+    args = parser.parse_args()
+    detector = DetectorColisaoAsync()
+    detector.instalar_sinal_perfil()
+    detector.run(broker_local=args.broker_local)
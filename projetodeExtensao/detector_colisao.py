@@ -1,5 +1,6 @@
 import os
 import json
+import queue
 import time
 import threading
 import logging
@@ -11,7 +12,25 @@ from logging.handlers import RotatingFileHandler
 import paho.mqtt.client as mqtt
 from colorama import Fore, Style, init
 
-from config import MQTT_CONFIG, CONNECTION_CONFIG, LOGGING_CONFIG, DATA_CONFIG, UI_CONFIG, STATS_CONFIG
+from config import (
+    MQTT_CONFIG, CONNECTION_CONFIG, LOGGING_CONFIG, DATA_CONFIG, UI_CONFIG, STATS_CONFIG, PIPELINE_CONFIG,
+    PROFILING_CONFIG, DEDUP_CONFIG, SENSOR_CONFIG, SPATIAL_CONFIG, ANOMALY_CONFIG,
+)
+from janela_deslizante import ContadorJanelaDeslizante
+from eventos import BufferEventos
+from decodificador import Decodificador, PayloadInvalido
+from persistencia import criar_persistencia, exportar_snapshot_json
+from rollups import AgregadorRollups
+from log_assincrono import NOME_TELA, LimitadorConsole, iniciar_listener
+from transporte import criar_cliente
+from metricas import RegistroMetricas, LIMITES_DISCO
+from recuperacao import GerenciadorRecuperacao
+from reconexao import BackoffExponencial, BufferSaida
+from deduplicacao import Deduplicador
+from sensores import IndiceSensores
+from espacial import IndiceEspacial
+from anomalias import DetectorAnomalias
+from perfilador import PerfiladorDetector, instalar_sinal
 
 init(autoreset=True)
 
@@ -34,46 +53,96 @@ class DetectorColisao:
         self.data_config = DATA_CONFIG.copy()
         self.ui_config = UI_CONFIG.copy()
         self.stats_config = STATS_CONFIG.copy()
+        self.pipeline_config = PIPELINE_CONFIG.copy()
+        self.profiling_config = PROFILING_CONFIG.copy()
+        self.dedup_config = DEDUP_CONFIG.copy()
+        self.sensor_config = SENSOR_CONFIG.copy()
+        self.spatial_config = SPATIAL_CONFIG.copy()
+        self.anomaly_config = ANOMALY_CONFIG.copy()
 
         # Substitui host/paths por variáveis de ambiente (para Docker)
         self.mqtt_config["broker"] = os.getenv("MQTT_BROKER", self.mqtt_config["broker"])
         self.mqtt_config["port"] = int(os.getenv("MQTT_PORT", self.mqtt_config["port"]))
-        # Data file: if env var set, use it; otherwise build a sensible path.
-        data_file_env = os.getenv("DATA_FILE")
-        if data_file_env:
-            self.data_config["data_file"] = data_file_env
-        else:
-            cfg_data_path = Path(self.data_config["data_file"])
-            # If the configured path already includes a 'data' parent, avoid duplicating
-            if cfg_data_path.parent.name == "data":
-                self.data_config["data_file"] = str(self.data_dir / cfg_data_path.name)
-            else:
-                self.data_config["data_file"] = str(self.data_dir / cfg_data_path)
-
-        # Log file: if env var set, use it; otherwise build a sensible path.
-        log_file_env = os.getenv("LOG_FILE")
-        if log_file_env:
-            self.log_config["file"] = log_file_env
-        else:
-            cfg_log_path = Path(self.log_config["file"])
-            # If the configured path already includes a 'logs' parent, avoid duplicating
-            if cfg_log_path.parent.name == "logs":
-                self.log_config["file"] = str(self.log_dir / cfg_log_path.name)
-            else:
-                self.log_config["file"] = str(self.log_dir / cfg_log_path)
+        self.mqtt_config["client_id"] = os.getenv("MQTT_CLIENT_ID", self.mqtt_config["client_id"])
+        self.mqtt_config["shared_group"] = os.getenv("MQTT_SHARED_GROUP", self.mqtt_config["shared_group"])
+        self.mqtt_config["transport"] = os.getenv("MQTT_TRANSPORT", self.mqtt_config["transport"])
+        # Arquivos de dados e log: env var se definida; senão, relativos a data/ e logs/
+        for chave, env in (("data_file", "DATA_FILE"), ("segments_dir", "SEGMENTS_DIR"), ("sqlite_file", "SQLITE_FILE"),
+                           ("rollups_file", "ROLLUPS_FILE"), ("recovery_dir", "RECOVERY_DIR")):
+            self.data_config[chave] = self._resolver_caminho(os.getenv(env), self.data_config[chave], self.data_dir, "data")
+        self.log_config["file"] = self._resolver_caminho(os.getenv("LOG_FILE"), self.log_config["file"], self.log_dir, "logs")
 
         # Inicializações
         self.reconnect_attempts = 0
-        self.colisoes = []
+        self._backoff = BackoffExponencial(
+            self.conn_config["reconnect_delay"], self.conn_config["reconnect_max_delay"],
+            self.conn_config["reconnect_backoff_factor"], self.conn_config["reconnect_jitter"],
+        )
+        # Acorda a thread única de reconexão (reconectar ou descarregar o buffer de saída)
+        self._pedido_reconexao = threading.Event()
+        self._saida = BufferSaida(self.conn_config["outbound_buffer_size"])
+        # Reentregas QoS 1 / retransmissões não viram colisões novas (None se desativado)
+        self.deduplicador = Deduplicador.de_config(self.dedup_config)
+        # Estado por sensor e ranking dos mais ativos, atualizados a cada lote
+        self.sensores = IndiceSensores.de_config(self.sensor_config)
+        # Ritmo/intensidade anômalos por sensor (EWMA + z-score/CUSUM; None se desativado)
+        self.anomalias = DetectorAnomalias.de_config(self.anomaly_config)
+        # Colisões recentes por localização (raio, vizinhos, mapa de calor)
+        self.espacial = IndiceEspacial.de_config(self.spatial_config)
+        # Histórico recente em buffer circular limitado a max_history_size
+        self.colisoes = BufferEventos(self.data_config["max_history_size"])
         self.ultimo_evento = None
         self.conectado = False
+        # Janelas de 1 min e 1 h são sempre mantidas (alerta e taxas por minuto/hora)
+        janelas = set(self.stats_config["rate_windows"]) | {60, 3600}
+        self.taxa_colisoes = ContadorJanelaDeslizante(janelas)
+        self._ultima_exibicao_stats = time.monotonic()
+        self._ultimo_alerta = 0.0
+        self.alertas = 0
         self._stop_event = threading.Event()
+        # Armazenamento dos lotes x captura do snapshot: o estado capturado corresponde exatamente ao WAL
+        self._estado_lock = threading.Lock()
+        self.recuperacao = None
+        self._ultimo_snapshot = time.monotonic()
+
+        # Fila entre a thread de rede do MQTT e os workers de processamento
+        self._fila = queue.Queue(maxsize=self.pipeline_config["queue_size"])
+        self._workers = []
+        self._thread_disco = None
+        self.mensagens_recebidas = 0
+        self.mensagens_descartadas = 0
+        # Um decodificador por worker (contadores sem disputa); este atende chamadas diretas
+        self.decodificador = self._novo_decodificador()
+        self._decodificadores = [self.decodificador]
 
         self._setup_logging()
+        self._setup_metricas()
+        # Perfis gravados junto ao arquivo de log; nada roda até uma janela ser aberta
+        self.perfilador = PerfiladorDetector(
+            self, Path(self.log_config["file"]).parent,
+            self.profiling_config["sample_interval"], self.profiling_config["tracemalloc_frames"],
+        )
+        self.persistencia = criar_persistencia(self.data_config, self.ui_config["date_format"])
+        self.rollups = self._carregar_rollups()
+        self._restaurar_estado()
         self._setup_mqtt()
+        self._start_reconexao()
+        self._start_workers()
         self._start_auto_save()
+        self._start_disco()
 
     # ========== CONFIGURAÇÕES ==========
+    @staticmethod
+    def _resolver_caminho(valor_env, configurado, base, nome_pai):
+        """Usa o valor da variável de ambiente, se houver; senão monta o caminho dentro de `base`."""
+        if valor_env:
+            return valor_env
+        caminho = Path(configurado)
+        # If the configured path already includes the parent dir, avoid duplicating
+        if caminho.parent.name == nome_pai:
+            return str(base / caminho.name)
+        return str(base / caminho)
+
     def _setup_logging(self):
         """Configura logging rotativo com saída para arquivo e console."""
         logger = logging.getLogger("detector_colisao")
@@ -87,18 +156,130 @@ class DetectorColisao:
             backupCount=self.log_config["backup_count"],
         )
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
 
         # Console Handler
         console = logging.StreamHandler(sys.stdout)
         console.setFormatter(formatter)
-        logger.addHandler(console)
+
+        # Linhas por evento no console limitadas por segundo (o excedente vira resumo)
+        self._limitador_console = LimitadorConsole(self.log_config["console_max_per_second"])
+        self._log_fila = self._log_listener = self._tela = None
+        if self.log_config["async"]:
+            # Caminho quente só enfileira; a thread do listener formata e grava
+            tela = logging.StreamHandler(sys.stdout)
+            tela.setFormatter(logging.Formatter("%(message)s"))
+            self._log_fila, self._log_listener = iniciar_listener(
+                [file_handler, console], tela, self.log_config["queue_size"]
+            )
+            logger.addHandler(self._log_fila)
+            self._tela = logging.getLogger(NOME_TELA)
+            self._tela.setLevel(logging.INFO)
+            self._tela.propagate = False
+            self._tela.addHandler(self._log_fila)
+        else:
+            logger.addHandler(file_handler)
+            logger.addHandler(console)
 
         self.logger = logger
 
+    def _parar_logging(self):
+        """Esvazia a fila de log e encerra a thread do listener."""
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self.logger.removeHandler(self._log_fila)
+            self._tela.removeHandler(self._log_fila)
+            self._log_listener = None
+
+    def estatisticas_log(self):
+        """Registros de log descartados (fila cheia) e linhas de console suprimidas."""
+        return {
+            "assincrono": self._log_fila is not None,
+            "fila": self._log_fila.queue.qsize() if self._log_fila else 0,
+            "descartados": self._log_fila.descartados if self._log_fila else 0,
+            "console_suprimidas": self._limitador_console.total_suprimidas,
+        }
+
+    def _setup_metricas(self):
+        """Instrumentos expostos em /metrics (contadores e histogramas por thread, sem lock)."""
+        m = self.metricas = RegistroMetricas()
+        recebidas = "Mensagens recebidas (antes da fila)"
+        # on_message roda só na thread de rede: um int simples basta (e custa menos no caminho mais quente)
+        m.contador_funcao("detector_mensagens_recebidas_total", recebidas, lambda: self.mensagens_recebidas, origem="mqtt")
+        self._m_injetadas = m.contador("detector_mensagens_recebidas_total", recebidas, origem="injetada")
+        m.contador_funcao("detector_mensagens_descartadas_total", "Mensagens descartadas com a fila cheia",
+                          lambda: self.mensagens_descartadas)
+        self._m_rejeitadas = {}
+        self._m_falhas = m.contador("detector_mensagens_falhas_total", "Eventos válidos com erro ao armazenar")
+        self._m_alertas = m.contador("detector_alertas_total", "Alertas de alta taxa emitidos")
+        self._m_anomalias = {
+            (sinal, metodo): m.contador("detector_anomalias_total", "Anomalias por sensor detectadas",
+                                        sinal=sinal, metodo=metodo)
+            for sinal, metodo in (("ritmo", "cusum"), ("intensidade", "cusum"), ("intensidade", "zscore"))
+        }
+        etapa = "Latência por etapa do pipeline (segundos)"
+        self._m_espera = m.histograma("detector_etapa_segundos", etapa, etapa="fila")
+        self._m_decodificacao = m.histograma("detector_etapa_segundos", etapa, etapa="decodificacao")
+        self._m_armazenamento = m.histograma("detector_etapa_segundos", etapa, etapa="armazenamento")
+        self._m_alerta = m.histograma("detector_etapa_segundos", etapa, etapa="alerta")
+        self._m_wal = m.histograma("detector_etapa_segundos", etapa, etapa="wal")
+        # Decodificadas/armazenadas = observações dos histogramas das etapas (sem contador extra por lote)
+        m.contador_funcao("detector_mensagens_decodificadas_total", "Payloads decodificados e validados",
+                          lambda: self._m_decodificacao.total)
+        m.contador_funcao("detector_mensagens_armazenadas_total", "Eventos gravados no buffer e na persistência",
+                          lambda: self._m_armazenamento.total)
+        self._m_salvamento = m.histograma("detector_salvamento_segundos", "Duração de _save_data (segundos)", LIMITES_DISCO)
+        self._m_salvamento_bytes = m.contador("detector_salvamento_bytes_total", "Bytes gravados pelos salvamentos")
+        self._m_salvamento_falhas = m.contador("detector_salvamento_falhas_total", "Salvamentos com erro")
+        m.contador_funcao("detector_persistencia_descartados_total", "Eventos que não chegaram à persistência",
+                          lambda: getattr(self.persistencia, "descartados", 0))
+        self._m_snapshot = m.histograma("detector_snapshot_segundos", "Duração da gravação do snapshot (segundos)",
+                                        LIMITES_DISCO)
+        self._m_snapshot_bytes = m.contador("detector_snapshot_bytes_total", "Bytes gravados pelos snapshots")
+        m.contador_funcao("detector_wal_bytes_total", "Bytes anexados ao WAL",
+                          lambda: self.recuperacao.bytes_wal if self.recuperacao else 0)
+        self.restauracao = {}
+        m.medidor("detector_restauracao_segundos", "Duração da restauração na inicialização",
+                  lambda: self.restauracao.get("duracao_s", 0))
+        if self.deduplicador is not None:
+            for origem in ("lru", "bloom"):
+                m.contador_funcao("detector_mensagens_duplicadas_total", "Mensagens descartadas como duplicadas",
+                                  lambda origem=origem: getattr(self.deduplicador, f"duplicadas_{origem}"), origem=origem)
+            m.medidor("detector_dedup_chaves", "Chaves no LRU de deduplicação", lambda: len(self.deduplicador.lru))
+        self._m_desconexoes = m.contador("detector_desconexoes_total", "Quedas da conexão com o broker")
+        self._m_reconexoes = m.contador("detector_reconexoes_total", "Reconexões bem-sucedidas ao broker")
+        m.medidor("detector_reconexao_tentativas", "Tentativas de reconexão desde a última conexão",
+                  lambda: self.reconnect_attempts)
+        m.medidor("detector_saida_pendentes", "Publicações guardadas aguardando conexão", lambda: len(self._saida))
+        m.contador_funcao("detector_saida_descartadas_total", "Publicações descartadas com o buffer de saída cheio",
+                          lambda: self._saida.descartadas)
+        m.medidor("detector_conectado", "1 se conectado ao broker", lambda: int(self.conectado))
+        m.medidor("detector_historico_eventos", "Eventos no histórico em memória", lambda: len(self.colisoes))
+        m.medidor("detector_sensores_indexados", "Sensores com estado no índice por sensor", lambda: len(self.sensores))
+        if self.anomalias is not None:
+            m.medidor("detector_anomalias_sensores", "Sensores com estado na detecção de anomalias",
+                      lambda: len(self.anomalias))
+        m.medidor("detector_espacial_pontos", "Colisões com localização no índice espacial", lambda: len(self.espacial))
+        m.medidor("detector_fila_profundidade", "Mensagens aguardando os workers", lambda: self._fila.qsize())
+        m.medidor("detector_fila_capacidade", "Capacidade da fila de ingestão", lambda: self.pipeline_config["queue_size"])
+        m.medidor("detector_log_fila_profundidade", "Registros aguardando a thread de log",
+                  lambda: self._log_fila.queue.qsize() if self._log_fila else 0)
+        m.medidor("detector_log_descartados", "Registros de log descartados com a fila cheia",
+                  lambda: self._log_fila.descartados if self._log_fila else 0)
+        self._ja_conectou = False
+
+    def instalar_sinal_perfil(self):
+        """Liga o sinal configurado (SIGUSR1) à janela de perfilamento; só na thread principal."""
+        cfg = self.profiling_config
+        if instalar_sinal(self.perfilador, cfg["signal"], cfg["mode"], cfg["duration"], cfg["memory"]):
+            self.logger.info(f"Perfilamento sob demanda: kill -{cfg['signal'][3:]} {os.getpid()}")
+
     def _setup_mqtt(self):
-        """Configura cliente MQTT e callbacks."""
-        self.client = mqtt.Client(client_id=self.mqtt_config["client_id"], clean_session=self.mqtt_config["clean_session"])
+        """Configura o cliente do transporte (paho ou loopback) e callbacks."""
+        # Reconexão só pela thread de reconexão (backoff com jitter), não pelo loop do paho
+        self.client = criar_cliente(
+            self.mqtt_config["transport"], self.mqtt_config["client_id"], self.mqtt_config["clean_session"],
+            reconexao_automatica=False,
+        )
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
@@ -112,69 +293,448 @@ class DetectorColisao:
         if rc == 0:
             self.conectado = True
             self.reconnect_attempts = 0
+            self._backoff.reiniciar()
+            if self._ja_conectou:
+                self._m_reconexoes.inc()
+            self._ja_conectou = True
             self._print("✅ Conectado ao broker MQTT!", Fore.GREEN)
-            self.client.subscribe(self.mqtt_config["topic"], qos=self.mqtt_config["qos"])
+            self.client.subscribe(self._topico_assinatura(), qos=self.mqtt_config["qos"])
+            if len(self._saida):
+                # Publicações guardadas enquanto offline saem fora da thread de rede
+                self._acordar_reconexao()
         else:
             self._print(f"⚠️ Falha na conexão. Código: {rc}", Fore.YELLOW)
             self._attempt_reconnect()
 
+    def _topico_assinatura(self):
+        """Tópico assinado; com shared_group o broker distribui as mensagens entre os detectores."""
+        grupo = self.mqtt_config["shared_group"]
+        if grupo:
+            return f"$share/{grupo}/{self.mqtt_config['topic']}"
+        return self.mqtt_config["topic"]
+
     def _on_disconnect(self, client, userdata, rc):
         """Callback executado ao perder a conexão."""
         self.conectado = False
+        self._m_desconexoes.inc()
         self._print("⚠️ Desconectado do broker MQTT!", Fore.RED)
         self._attempt_reconnect()
 
     def _on_message(self, client, userdata, msg):
-        """Callback executado ao receber mensagem."""
+        """Callback executado ao receber mensagem: apenas enfileira para os workers."""
+        self.mensagens_recebidas += 1
         try:
-            payload = msg.payload.decode("utf-8")
-            data = json.loads(payload)
-            timestamp = datetime.now().strftime(self.ui_config["date_format"])
-            registro = {"timestamp": timestamp, "dados": data}
-            self.colisoes.append(registro)
-            self.ultimo_evento = timestamp
-            self._print(f"💥 Colisão detectada em {timestamp}", Fore.CYAN)
-        except Exception as e:
-            self.logger.error(f"Erro ao processar mensagem: {e}")
+            self._fila.put_nowait((msg.topic, msg.payload, time.time_ns()))
+        except queue.Full:
+            # Não bloqueia a thread de rede (keepalive e acks do QoS 1)
+            self.mensagens_descartadas += 1
+
+    def injetar(self, payload, topico=None, bloquear=False, timeout=None):
+        """Enfileira um payload recebido por outro canal (ex.: simulador web via HTTP, reprodução).
+
+        Passa pelo mesmo pipeline das mensagens MQTT. Retorna False se a fila estiver cheia
+        (com `bloquear=True`, espera por espaço até `timeout`).
+        """
+        self._m_injetadas.inc()
+        try:
+            self._fila.put((topico or self.mqtt_config["topic"], payload, time.time_ns()), bloquear, timeout)
+            return True
+        except queue.Full:
+            self.mensagens_descartadas += 1
+            return False
+
+    # ========== PIPELINE ==========
+    def _novo_decodificador(self):
+        return Decodificador(self.pipeline_config["json_backend"], self.pipeline_config["max_payload_bytes"])
+
+    def _start_workers(self):
+        """Inicia as threads que consomem a fila em lotes."""
+        for i in range(self.pipeline_config["workers"]):
+            worker = threading.Thread(target=self._worker_loop, name=f"detector-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker_loop(self):
+        """Consome a fila em lotes até o encerramento (e a fila esvaziar)."""
+        batch_size = self.pipeline_config["batch_size"]
+        decodificador = self._novo_decodificador()
+        self._decodificadores.append(decodificador)
+        while True:
+            try:
+                lote = [self._fila.get(timeout=0.5)]
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            while len(lote) < batch_size:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            # Um lote com erro inesperado não pode derrubar o worker (a thread morreria em silêncio)
+            try:
+                self._processar_lote(lote, decodificador)
+            except Exception as e:
+                self._m_falhas.inc()
+                self.logger.error(f"Erro ao processar lote de {len(lote)} mensagens: {e}")
+
+    def _processar_lote(self, lote, decodificador=None):
+        """Decodifica, armazena e verifica alertas de um lote de mensagens (topic, payload, receive_ns)."""
+        decodificador = decodificador or self.decodificador
+        deduplicador = self.deduplicador
+        relogio = time.perf_counter
+        inicio_lote_ns = time.time_ns()
+        # Latências acumuladas no lote e registradas nos histogramas de uma vez
+        esperas, decodificacoes, armazenamentos = [], [], []
+        validos = []
+        for topic, payload, recebido_ns in lote:
+            esperas.append((inicio_lote_ns - recebido_ns) / 1e9)
+            inicio = relogio()
+            try:
+                evento = decodificador.decodificar(payload, recebido_ns / 1e9)
+            except PayloadInvalido as e:
+                self._contador_rejeicao(e.motivo).inc()
+                self.logger.debug(f"Mensagem rejeitada em {topic}: {e}")
+                continue
+            decodificacoes.append(relogio() - inicio)
+            if deduplicador is not None and deduplicador.duplicado(evento, payload):
+                continue
+            validos.append((evento, payload, recebido_ns))
+
+        armazenados = []
+        anomalias = ()
+        wal = [] if self.recuperacao is not None else None
+        with self._estado_lock:
+            for evento, payload, recebido_ns in validos:
+                inicio = relogio()
+                try:
+                    self.colisoes.adicionar(evento)
+                    self.persistencia.registrar(evento)
+                    self.rollups.registrar_evento(evento)
+                    if wal is not None:
+                        wal.append((evento.seq, recebido_ns, payload))
+                    armazenamentos.append(relogio() - inicio)
+                    armazenados.append(evento)
+                    timestamp = datetime.fromtimestamp(evento.recebido_em).strftime(self.ui_config["date_format"])
+                    self.ultimo_evento = timestamp
+                    if self._limitador_console.permitir():
+                        self._print(f"💥 Colisão detectada em {timestamp}", Fore.CYAN)
+                except Exception as e:
+                    self._m_falhas.inc()
+                    self.logger.error(f"Erro ao processar mensagem: {e}")
+            processados = len(armazenados)
+            if processados:
+                # Índices derivados: uma falha neles não deve impedir o WAL dos eventos já armazenados
+                try:
+                    self.sensores.registrar_eventos(armazenados)
+                    self.espacial.registrar_eventos(armazenados)
+                    if self.anomalias is not None:
+                        anomalias = self.anomalias.registrar_eventos(armazenados)
+                except Exception as e:
+                    self._m_falhas.inc()
+                    self.logger.error(f"Erro ao indexar lote: {e}")
+            if wal:
+                inicio = relogio()
+                try:
+                    self.recuperacao.anexar(wal)
+                except OSError as e:
+                    self.logger.error(f"Erro ao gravar o WAL: {e}")
+                self._m_wal.observar(relogio() - inicio)
+            if processados:
+                self.taxa_colisoes.registrar(processados)
+        self._m_espera.observar_varios(esperas)
+        if decodificacoes:
+            self._m_decodificacao.observar_varios(decodificacoes)
+        if processados:
+            self._m_armazenamento.observar_varios(armazenamentos)
+            inicio = relogio()
+            self._verificar_alerta()
+            if anomalias:
+                self._alertar_anomalias(anomalias)
+            self._m_alerta.observar(relogio() - inicio)
+
+    def _contador_rejeicao(self, motivo):
+        """Contador de rejeições por motivo (criado no primeiro uso)."""
+        contador = self._m_rejeitadas.get(motivo)
+        if contador is None:
+            contador = self._m_rejeitadas[motivo] = self.metricas.contador(
+                "detector_mensagens_rejeitadas_total", "Payloads rejeitados pelo decodificador", motivo=motivo
+            )
+        return contador
 
     # ========== RECONEXÃO ==========
-    def _attempt_reconnect(self):
-        """Tenta reconectar de forma não bloqueante."""
-        if self.reconnect_attempts >= self.conn_config["max_reconnect_attempts"]:
-            self._print("❌ Máximo de tentativas de reconexão atingido.", Fore.RED)
-            return
+    def _start_reconexao(self):
+        """Thread única de reconexão: nenhum Timer/thread novo por tentativa."""
+        threading.Thread(target=self._reconexao_worker, name="reconexao", daemon=True).start()
 
-        self.reconnect_attempts += 1
-        delay = self.conn_config["reconnect_delay"] * self.reconnect_attempts
-        self.logger.warning(f"Tentativa de reconexão {self.reconnect_attempts} em {delay}s")
-        threading.Timer(delay, self._try_reconnect).start()
+    def _acordar_reconexao(self):
+        if not self._stop_event.is_set():
+            self._pedido_reconexao.set()
+
+    def _attempt_reconnect(self):
+        """Agenda uma tentativa de reconexão (não bloqueia o callback)."""
+        self._acordar_reconexao()
+
+    def _proxima_espera(self):
+        """Espera até a próxima tentativa: exponencial com teto e jitter, sem limite de tentativas."""
+        espera = self._backoff.proximo()
+        self.reconnect_attempts = self._backoff.tentativas
+        self.logger.warning(f"Tentativa de reconexão {self.reconnect_attempts} em {espera:.1f}s")
+        return espera
+
+    def _reconexao_worker(self):
+        while not self._stop_event.is_set():
+            self._pedido_reconexao.wait()
+            self._pedido_reconexao.clear()
+            if self._stop_event.is_set():
+                break
+            if self.conectado:
+                self._descarregar_saida()
+                continue
+            if self._stop_event.wait(self._proxima_espera()) or self.conectado:
+                continue
+            self._try_reconnect()
 
     def _try_reconnect(self):
-        """Executa reconexão MQTT."""
+        """Executa reconexão MQTT (e reinicia a thread de rede, que termina ao perder a conexão)."""
         try:
+            self.client.loop_stop()
             self.client.reconnect()
+            self.client.loop_start()
         except Exception as e:
             self.logger.error(f"Erro na reconexão: {e}")
             self._attempt_reconnect()
 
+    # ========== PUBLICAÇÕES DE SAÍDA ==========
+    def _enviar(self, item):
+        if not self.conectado:
+            return False
+        topico, payload, qos, retain = item
+        return self.client.publish(topico, payload, qos, retain).rc == mqtt.MQTT_ERR_SUCCESS
+
+    def publicar_saida(self, topico, dados):
+        """Publica alertas/estatísticas; offline (ou com pendências) guarda para enviar na reconexão."""
+        if not topico:
+            return False
+        payload = json.dumps(dados, ensure_ascii=False, default=str)
+        return self._saida.publicar((topico, payload, self.mqtt_config["qos"], False), self._enviar)
+
+    def _descarregar_saida(self):
+        enviadas = self._saida.descarregar(self._enviar)
+        if enviadas:
+            self.logger.info(f"{enviadas} mensagens guardadas durante a desconexão foram publicadas.")
+
     # ========== AUTO SAVE ==========
     def _start_auto_save(self):
         """Thread de salvamento automático de dados."""
         def auto_save_worker():
+            self._retomar_persistencia()
             while not self._stop_event.wait(self.data_config["auto_save_interval"]):
                 self._save_data()
+                self._snapshot_periodico()
         threading.Thread(target=auto_save_worker, daemon=True).start()
 
+    def _start_disco(self):
+        """Thread que faz o fsync do WAL e grava os lotes pendentes da persistência, fora do lock de estado."""
+        def disco_worker():
+            while not self._stop_event.wait(self.data_config["wal_fsync_interval"]):
+                self._descarregar_disco()
+        self._thread_disco = threading.Thread(target=disco_worker, name="detector-disco", daemon=True)
+        self._thread_disco.start()
+
+    def _descarregar_disco(self):
+        try:
+            if self.recuperacao is not None:
+                self.recuperacao.sincronizar()
+            self.persistencia.descarregar()
+        except Exception as e:
+            self.logger.error(f"Erro ao gravar em disco: {e}")
+
     def _save_data(self):
-        """Salva histórico de colisões em arquivo JSON."""
+        """Salva histórico de colisões no backend configurado (snapshot JSON ou segmentos JSONL)."""
         if not self.data_config["save_to_file"]:
             return
+        inicio = time.perf_counter()
         try:
-            with open(self.data_config["data_file"], "w", encoding="utf-8") as f:
-                json.dump(self.colisoes[-self.data_config["max_history_size"]:], f, indent=4)
+            gravados = self.persistencia.salvar(self.colisoes) or 0
+            gravados += self.rollups.salvar(self.data_config["rollups_file"])
+            self._m_salvamento_bytes.inc(gravados)
             self.logger.info("Histórico salvo com sucesso.")
         except Exception as e:
+            self._m_salvamento_falhas.inc()
             self.logger.error(f"Erro ao salvar histórico: {e}")
+        finally:
+            self._m_salvamento.observar(time.perf_counter() - inicio)
+
+    def _retomar_persistencia(self):
+        """Grava no backend o que ele ainda não tinha na restauração (relido do buffer, já fora da inicialização)."""
+        if not self.restauracao.get("persistencia_pendente"):
+            return
+        inicio = time.perf_counter()
+        try:
+            gravados = self.persistencia.salvar(self.colisoes) or 0
+            self._m_salvamento_bytes.inc(gravados)
+            self.logger.info(f"Persistência retomada: {self.restauracao['persistencia_pendente']} eventos do buffer "
+                             f"em {(time.perf_counter() - inicio) * 1000:.0f} ms.")
+        except Exception as e:
+            self._m_salvamento_falhas.inc()
+            self.logger.error(f"Erro ao retomar a persistência: {e}")
+
+    # ========== RECUPERAÇÃO (snapshot + WAL) ==========
+    def _restaurar_estado(self):
+        """Mapeia o último snapshot e reaplica só a cauda do WAL (histórico, agregados e janelas de taxa)."""
+        if not self.data_config["recovery"]:
+            return
+        inicio = time.perf_counter()
+        # Sem fsync em `anexar` (chamado sob o lock de estado): a thread de disco chama sincronizar()
+        self.recuperacao = GerenciadorRecuperacao(self.data_config["recovery_dir"], fsync_interval=None)
+        snapshot = self.recuperacao.abrir_snapshot(self.logger.warning)
+        ultimo_seq = persistido = 0
+        if snapshot is not None:
+            meta = snapshot.meta
+            ultimo_seq = snapshot.ultimo_seq
+            persistido = meta["persistido_seq"]
+            self.colisoes.restaurar(snapshot, ultimo_seq)
+            if "rollups" in meta:
+                # Snapshot de versão anterior: agregados nos metadados, exatos até o snapshot
+                self.rollups = AgregadorRollups.de_dict(
+                    meta["rollups"], self.stats_config["rollup_retention"], self.stats_config["rollup_max_sensors"])
+                self.rollups.ultimo_seq = ultimo_seq
+            self.taxa_colisoes.restaurar(meta["janelas"])
+            self.alertas = meta["alertas"]
+            # Índices grandes vêm das seções binárias (colunas), sem passar pelo JSON dos metadados
+            for nome, indice in self._indices_snapshot():
+                dados = snapshot.secao(nome)
+                if dados is not None:
+                    indice.restaurar(dados)
+
+        # Os agregados vêm do próprio arquivo, válidos até rollups.ultimo_seq (sem seq: formato antigo,
+        # tomados como do instante do snapshot); o que o buffer tem além disso é contabilizado de novo
+        agregados_ate = self.rollups.ultimo_seq if self.rollups.ultimo_seq is not None else ultimo_seq
+        for evento in self.colisoes.iterar(agregados_ate + 1, ultimo_seq):
+            self.rollups.registrar_evento(evento)
+
+        # Eventos posteriores ao snapshot: decodificados de novo a partir do payload original
+        reproduzidos = 0
+        deslocamento = time.monotonic() - time.time()
+        for _, recebido_ns, payload in self.recuperacao.registros_wal(
+                snapshot.geracao if snapshot else 0, ultimo_seq):
+            try:
+                evento = self.decodificador.decodificar(payload, recebido_ns / 1e9)
+            except PayloadInvalido:
+                continue
+            self.colisoes.adicionar(evento)
+            if evento.seq > agregados_ate:
+                self.rollups.registrar_evento(evento)
+            self.taxa_colisoes.registrar(1, evento.recebido_em + deslocamento)
+            self.sensores.registrar_eventos((evento,))
+            self.espacial.registrar_eventos((evento,))
+            if self.anomalias is not None:
+                self.anomalias.registrar_eventos((evento,))
+            if self.deduplicador is not None:
+                # Reentregas do que chegou pouco antes da queda continuam sendo reconhecidas
+                self.deduplicador.registrar(evento, payload, evento.recebido_em + deslocamento)
+            reproduzidos += 1
+
+        # O que o backend ainda não tinha gravado (pode repetir eventos gravados após o snapshot) é relido
+        # do buffer pelo primeiro salvamento, em segundo plano: a inicialização não percorre o buffer
+        persistido = min(persistido, self.colisoes.ultimo_seq)
+        self.persistencia.retomar_de(persistido, self.colisoes)
+        # Agregados em dia com o histórico (inclusive se o arquivo estava à frente: a numeração recomeça)
+        self.rollups.ultimo_seq = self.colisoes.ultimo_seq
+        self.recuperacao.iniciar()
+
+        self.restauracao = {
+            "snapshot": snapshot.caminho.name if snapshot else None,
+            "eventos_snapshot": len(snapshot) if snapshot else 0,
+            "eventos_wal": reproduzidos,
+            "persistencia_pendente": self.colisoes.ultimo_seq - persistido,
+            "duracao_s": round(time.perf_counter() - inicio, 4),
+        }
+        if snapshot is not None or reproduzidos:
+            self.logger.info(
+                f"Estado restaurado em {self.restauracao['duracao_s'] * 1000:.0f} ms: "
+                f"{self.restauracao['eventos_snapshot']} eventos do snapshot + {reproduzidos} do WAL"
+            )
+
+    def _gravar_snapshot(self, capturado=None):
+        """Captura o estado (ou usa `capturado`, de `_capturar_snapshot`) e grava o snapshot."""
+        if self.recuperacao is None:
+            return
+        inicio = time.perf_counter()
+        try:
+            self._escrever_snapshot(capturado or self._capturar_snapshot())
+        except Exception as e:
+            self.logger.error(f"Erro ao gravar snapshot: {e}")
+        finally:
+            self._ultimo_snapshot = time.monotonic()
+            self._m_snapshot.observar(time.perf_counter() - inicio)
+
+    def _capturar_snapshot(self):
+        """Cópia barata do estado sob o lock de estado (referências, colunas), trocando a geração do WAL.
+
+        Nada é serializado aqui: a ingestão só espera as cópias.
+        """
+        with self._estado_lock:
+            geracao = self.recuperacao.rotacionar()
+            captura = self.colisoes.capturar()
+            meta = {
+                "persistido_seq": self.persistencia.ultimo_seq_persistido,
+                "janelas": self.taxa_colisoes.exportar(),
+                "alertas": self.alertas,
+            }
+            indices = [(nome, indice, indice.capturar()) for nome, indice in self._indices_snapshot()]
+        return geracao, captura, meta, indices
+
+    def _escrever_snapshot(self, capturado):
+        """Serializa e grava o snapshot capturado (fora do lock de estado)."""
+        geracao, captura, meta, indices = capturado
+        # Agregados ficam no próprio arquivo (só os baldes alterados), não nos metadados do snapshot;
+        # gravados depois da captura, cobrem pelo menos até o seq dela
+        try:
+            self._m_snapshot_bytes.inc(self.rollups.salvar(self.data_config["rollups_file"]))
+        except OSError as e:
+            self.logger.error(f"Erro ao salvar agregados: {e}")
+        secoes = {nome: indice.serializar(capturado_indice) for nome, indice, capturado_indice in indices}
+        snapshot, gravados = self.recuperacao.gravar_snapshot(geracao, captura, meta, secoes)
+        # Leituras de slots ainda não sobrescritos passam a usar o snapshot novo
+        if self.colisoes.base is not None:
+            self.colisoes.trocar_base(snapshot)
+        self._m_snapshot_bytes.inc(gravados)
+        self.logger.info(f"Snapshot {geracao} gravado ({len(snapshot)} eventos, {gravados} bytes).")
+
+    def _indices_snapshot(self):
+        """(nome da seção, índice) dos índices gravados como seções binárias do snapshot."""
+        indices = [("sensores", self.sensores), ("espacial", self.espacial)]
+        if self.anomalias is not None:
+            indices.append(("anomalias", self.anomalias))
+        return indices
+
+    def _snapshot_periodico(self):
+        if time.monotonic() - self._ultimo_snapshot >= self.data_config["snapshot_interval"]:
+            self._gravar_snapshot()
+
+    def _encerrar_recuperacao(self, capturado=None):
+        """Snapshot final (o próximo início não precisa reaplicar o WAL) e fecha o WAL."""
+        if self.recuperacao is not None:
+            self._gravar_snapshot(capturado)
+            self.recuperacao.fechar()
+
+    def _carregar_rollups(self):
+        """Recarrega os agregados por minuto/hora/dia salvos; começa vazio se o arquivo for inválido."""
+        try:
+            return AgregadorRollups.carregar(
+                self.data_config["rollups_file"], self.stats_config["rollup_retention"],
+                self.stats_config["rollup_max_sensors"])
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            self.logger.warning(f"Agregados ignorados ({e}); iniciando vazios.")
+            return AgregadorRollups(self.stats_config["rollup_retention"], self.stats_config["rollup_max_sensors"])
+
+    def exportar_historico(self, destino=None):
+        """Exporta o buffer atual no formato de snapshot JSON original."""
+        destino = destino or self.data_config["data_file"]
+        exportar_snapshot_json(self.colisoes.snapshot(), destino, self.ui_config["date_format"])
+        return destino
 
     # ========== IMPRESSÃO ==========
     def _print(self, msg="", color=Fore.WHITE, style=Style.NORMAL, sep=False, length=None):
@@ -184,10 +744,19 @@ class DetectorColisao:
             length = length or self.ui_config["separator_length"]
             msg = char * length
         if self.ui_config["use_colors"]:
-            print(f"{style}{color}{msg}{Style.RESET_ALL}")
+            msg = f"{style}{color}{msg}{Style.RESET_ALL}"
+        if self._tela is not None:
+            self._tela.info(msg)
         else:
             print(msg)
 
+    def _resumir_console(self):
+        """Exibe quantas colisões deixaram de ser impressas pelo limite do console."""
+        suprimidas = self._limitador_console.coletar()
+        if suprimidas:
+            self._print(f"💥 +{suprimidas} colisões não exibidas (limite de "
+                        f"{self._limitador_console.max_por_segundo}/s no console)", Fore.CYAN)
+
     # ========== CICLO PRINCIPAL ==========
     def run(self):
         """Executa o detector continuamente."""
@@ -196,12 +765,17 @@ class DetectorColisao:
             self._print("🚀 Iniciando Sistema de Detecção de Colisões", Fore.GREEN, Style.BRIGHT)
             self._print(sep=True)
 
-            self.client.connect(
-                self.mqtt_config["broker"],
-                self.mqtt_config["port"],
-                self.mqtt_config["keepalive"]
-            )
-            self.client.loop_start()
+            try:
+                self.client.connect(
+                    self.mqtt_config["broker"],
+                    self.mqtt_config["port"],
+                    self.mqtt_config["keepalive"]
+                )
+                self.client.loop_start()
+            except OSError as e:
+                # Broker fora do ar na partida: a thread de reconexão continua tentando
+                self.logger.error(f"Erro ao conectar: {e}")
+                self._attempt_reconnect()
 
             while not self._stop_event.is_set():
                 if self.conectado:
@@ -215,27 +789,118 @@ class DetectorColisao:
 
     def _check_connection_health(self):
         """Monitora taxa de colisões e emite alertas."""
-        if not self.colisoes:
+        if not self.taxa_colisoes.total:
             return
 
-        intervalo = 60  # segundos
-        agora = datetime.now()
-        recentes = [
-            c for c in self.colisoes
-            if (agora - datetime.strptime(c["timestamp"], self.ui_config["date_format"])).total_seconds() <= intervalo
-        ]
-        if len(recentes) > self.stats_config["alert_threshold"]:
+        self._resumir_console()
+
+        self._verificar_alerta()
+
+        agora = time.monotonic()
+        if agora - self._ultima_exibicao_stats >= self.stats_config["stats_interval"]:
+            self._ultima_exibicao_stats = agora
+            self._exibir_estatisticas()
+
+    def _verificar_alerta(self):
+        """Emite alerta (no máximo um por segundo) se a taxa do último minuto passar do limite."""
+        agora = time.monotonic()
+        if agora - self._ultimo_alerta < 1:
+            return
+        # Contagem da janela de 60s mantida incrementalmente (O(1))
+        if self.taxa_colisoes.contagem(60) > self.stats_config["alert_threshold"]:
+            self._ultimo_alerta = agora
+            self.alertas += 1
+            self._m_alertas.inc()
             self._print("🚨 ALERTA: Alta taxa de colisões detectada!", Fore.RED, Style.BRIGHT)
             self.logger.warning("Alta taxa de colisões detectada.")
+            self.publicar_saida(self.mqtt_config["alert_topic"], {
+                "tipo": "taxa_alta",
+                "instante": time.time(),
+                "colisoes_60s": self.taxa_colisoes.contagem(60),
+                "limite": self.stats_config["alert_threshold"],
+                "detector": self.mqtt_config["client_id"],
+            })
+
+    def _alertar_anomalias(self, anomalias):
+        """Alerta de anomalia por sensor (cada sensor alerta no máximo uma vez por alert_interval)."""
+        for anomalia in anomalias:
+            self._m_anomalias[anomalia["sinal"], anomalia["metodo"]].inc()
+            descricao = "ritmo de colisões acima do normal" if anomalia["sinal"] == "ritmo" else "intensidade acima do normal"
+            self._print(f"🚨 ANOMALIA: {anomalia['sensor']} com {descricao} ({anomalia['metodo']})", Fore.RED, Style.BRIGHT)
+            self.logger.warning(
+                f"Anomalia no sensor {anomalia['sensor']}: {anomalia['sinal']} ({anomalia['metodo']}, z={anomalia['z']})."
+            )
+            self.publicar_saida(self.mqtt_config["alert_topic"], {
+                "tipo": "anomalia_sensor",
+                **anomalia,
+                "detector": self.mqtt_config["client_id"],
+            })
+
+    def get_estatisticas(self):
+        """Retorna as estatísticas de taxa habilitadas em STATS_CONFIG."""
+        contagens = self.taxa_colisoes.contagens()
+        stats = {
+            "total": self.taxa_colisoes.total,
+            "janelas": contagens,
+            "fila": self._fila.qsize(),
+            "descartadas": self.mensagens_descartadas,
+            "duplicadas": self.deduplicador.estatisticas() if self.deduplicador else None,
+            "alertas": self.alertas,
+            "sensores": self.sensores.estatisticas(),
+            "anomalias": self.anomalias.estatisticas() if self.anomalias is not None else None,
+            "espacial": self.espacial.estatisticas(),
+            "decodificacao": Decodificador.combinar(self._decodificadores),
+            "log": self.estatisticas_log(),
+        }
+        if self.stats_config["show_rate_per_minute"]:
+            stats["taxa_por_minuto"] = contagens[60]
+        if self.stats_config["show_rate_per_hour"]:
+            stats["taxa_por_hora"] = contagens[3600]
+        if self.stats_config["show_peak_hour"]:
+            pico = self.rollups.hora_pico(self.stats_config["peak_hour_days"])
+            stats["hora_pico"] = {"inicio": pico.inicio, "contagem": pico.contagem} if pico else None
+        if self.stats_config["show_average_interval"]:
+            stats["intervalo_medio"] = self.rollups.intervalo_medio(time.time() - 3600)
+        return stats
+
+    def _exibir_estatisticas(self):
+        """Exibe as taxas de colisão das janelas deslizantes."""
+        stats = self.get_estatisticas()
+        self.publicar_saida(self.mqtt_config["stats_topic"], {
+            "instante": time.time(), "detector": self.mqtt_config["client_id"], **stats,
+        })
+        if "taxa_por_minuto" in stats:
+            self._print(f"📊 Taxa: {stats['taxa_por_minuto']:.1f} colisões/min", Fore.BLUE)
+        if "taxa_por_hora" in stats:
+            self._print(f"📊 Taxa: {stats['taxa_por_hora']:.1f} colisões/h", Fore.BLUE)
+        if stats.get("hora_pico"):
+            inicio = datetime.fromtimestamp(stats["hora_pico"]["inicio"]).strftime(self.ui_config["date_format"])
+            self._print(f"📊 Hora de pico: {inicio} ({stats['hora_pico']['contagem']} colisões)", Fore.BLUE)
+        if stats.get("intervalo_medio") is not None:
+            self._print(f"📊 Intervalo médio: {stats['intervalo_medio']:.1f}s", Fore.BLUE)
 
     def _cleanup(self):
         """Finaliza corretamente o sistema."""
         self._stop_event.set()
-        self._save_data()
+        self._pedido_reconexao.set()
+        self._descarregar_saida()
         self.client.loop_stop()
+        # Workers terminam de esvaziar a fila antes do último salvamento
+        for worker in self._workers:
+            worker.join(timeout=5)
+        # Sem fsync/lote em andamento quando o WAL e a persistência forem fechados
+        if self._thread_disco is not None:
+            self._thread_disco.join(timeout=5)
+        self._save_data()
+        self._encerrar_recuperacao()
+        self.persistencia.fechar()
         self.client.disconnect()
+        self.perfilador.parar()
         self.logger.info("Sistema finalizado com segurança.")
+        self._parar_logging()
 
 
 if __name__ == "__main__":
-    DetectorColisao().run()
+    detector = DetectorColisao()
+    detector.instalar_sinal_perfil()
+    detector.run()
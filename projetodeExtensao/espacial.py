@@ -0,0 +1,261 @@
+"""
+Índice espacial das colisões com localização {x, y}.
+
+Grade uniforme de células `tamanho_celula` x `tamanho_celula`; cada célula guarda
+seus pontos em ordem de chegada (deque), então:
+- inserir é O(1) e a expiração (mais antigos que `retencao` segundos ou além de
+  `max_eventos`) remove sempre do início das filas;
+- "colisões a até r de (x, y) nos últimos N minutos" visita só as células que
+  cruzam o quadrado do raio, e em cada uma para no primeiro ponto antigo;
+- k vizinhos mais próximos expandem anéis de células em volta do ponto até o
+  k-ésimo candidato ficar mais perto que o próximo anel.
+O mapa de calor (área e resolução fixas) é mantido junto com a grade: cada
+inserção/expiração soma/subtrai 1 na célula do mapa, e a leitura custa
+largura x altura, independentemente do volume de eventos.
+"""
+
+import collections
+import heapq
+import math
+import threading
+from array import array
+
+from recuperacao import desempacotar_partes, desempacotar_textos, empacotar_partes, empacotar_textos, ler_coluna
+
+
+class IndiceEspacial:
+    """Pontos (instante, x, y, seq, sensor) recentes em grade uniforme + mapa de calor incremental."""
+
+    def __init__(self, tamanho_celula=5.0, retencao=3600.0, max_eventos=100_000,
+                 limites_mapa=(0.0, 0.0, 100.0, 100.0), resolucao_mapa=(20, 20)):
+        self.tamanho_celula = float(tamanho_celula)
+        self.retencao = retencao
+        self.max_eventos = max_eventos
+        self.limites_mapa = tuple(float(v) for v in limites_mapa)
+        self.resolucao_mapa = tuple(int(v) for v in resolucao_mapa)
+        self._celulas = {}                      # (cx, cy) -> deque[(instante, x, y, seq, sensor)]
+        self._ordem = collections.deque()       # (instante, celula) na ordem de chegada, para expirar
+        largura, altura = self.resolucao_mapa
+        self._mapa = [[0] * largura for _ in range(altura)]
+        self.fora_do_mapa = 0
+        self.descartados = 0                    # Pontos com coordenada não finita
+        self._lock = threading.Lock()
+
+    @classmethod
+    def de_config(cls, config):
+        return cls(
+            config["cell_size"], config["retention"], config["max_events"],
+            config["heatmap_bounds"], config["heatmap_resolution"],
+        )
+
+    def __len__(self):
+        return len(self._ordem)
+
+    def _celula(self, x, y):
+        return int(math.floor(x / self.tamanho_celula)), int(math.floor(y / self.tamanho_celula))
+
+    def _posicao_mapa(self, x, y):
+        """(linha, coluna) no mapa de calor ou None fora da área."""
+        x0, y0, x1, y1 = self.limites_mapa
+        if not (x0 <= x <= x1 and y0 <= y <= y1):
+            return None
+        largura, altura = self.resolucao_mapa
+        coluna = min(largura - 1, int((x - x0) / (x1 - x0) * largura))
+        linha = min(altura - 1, int((y - y0) / (y1 - y0) * altura))
+        return linha, coluna
+
+    def _ajustar_mapa(self, x, y, delta):
+        posicao = self._posicao_mapa(x, y)
+        if posicao is None:
+            self.fora_do_mapa += delta
+        else:
+            self._mapa[posicao[0]][posicao[1]] += delta
+
+    # ========== REGISTRO ==========
+    def registrar(self, instante, x, y, seq=0, sensor=None):
+        with self._lock:
+            if self._inserir(instante, x, y, seq, sensor):
+                self._expirar(instante)
+
+    def registrar_eventos(self, eventos):
+        """Indexa os EventoColisao com coordenadas finitas (os demais são ignorados)."""
+        ultimo = None
+        with self._lock:
+            for evento in eventos:
+                if evento.x is None or evento.y is None:
+                    continue
+                if self._inserir(evento.recebido_em, evento.x, evento.y, evento.seq, evento.sensor):
+                    ultimo = evento.recebido_em
+            if ultimo is not None:
+                self._expirar(ultimo)
+
+    def _inserir(self, instante, x, y, seq, sensor):
+        """Insere o ponto; False (e nada muda) se x ou y não for finito (sem célula na grade)."""
+        if not (math.isfinite(x) and math.isfinite(y)):
+            self.descartados += 1
+            return False
+        celula = self._celula(x, y)
+        pontos = self._celulas.get(celula)
+        if pontos is None:
+            pontos = self._celulas[celula] = collections.deque()
+        pontos.append((instante, x, y, seq, sensor))
+        self._ordem.append((instante, celula))
+        self._ajustar_mapa(x, y, 1)
+        return True
+
+    def _expirar(self, agora):
+        """Remove os pontos mais antigos que a retenção ou além de max_eventos (chamar com o lock)."""
+        ordem, celulas = self._ordem, self._celulas
+        limite = agora - self.retencao
+        while ordem and (ordem[0][0] < limite or len(ordem) > self.max_eventos):
+            _, celula = ordem.popleft()
+            pontos = celulas[celula]
+            _, x, y, _, _ = pontos.popleft()
+            if not pontos:
+                del celulas[celula]
+            self._ajustar_mapa(x, y, -1)
+
+    # ========== CONSULTAS ==========
+    @staticmethod
+    def _ponto_dict(ponto, distancia):
+        instante, x, y, seq, sensor = ponto
+        return {"seq": seq, "recebido_em": instante, "x": x, "y": y, "sensor": sensor,
+                "distancia": round(distancia, 6)}
+
+    def no_raio(self, x, y, raio, desde=None, limite=None, agora=None):
+        """Pontos a até `raio` de (x, y) recebidos a partir de `desde` (epoch), do mais perto ao mais longe."""
+        desde = float("-inf") if desde is None else desde
+        raio2 = raio * raio
+        encontrados = []
+        with self._lock:
+            if agora is not None:
+                self._expirar(agora)
+            cx0, cy0 = self._celula(x - raio, y - raio)
+            cx1, cy1 = self._celula(x + raio, y + raio)
+            celulas = self._celulas
+            # Poucas células ocupadas (raio grande): percorre só as existentes
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(celulas):
+                candidatas = [c for c in celulas if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+            else:
+                candidatas = [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+            for celula in candidatas:
+                pontos = celulas.get(celula)
+                if not pontos:
+                    continue
+                for ponto in reversed(pontos):
+                    if ponto[0] < desde:
+                        break
+                    d2 = (ponto[1] - x) ** 2 + (ponto[2] - y) ** 2
+                    if d2 <= raio2:
+                        encontrados.append((d2, ponto))
+        encontrados.sort(key=lambda par: par[0])
+        if limite is not None:
+            encontrados = encontrados[:limite]
+        return [self._ponto_dict(ponto, math.sqrt(d2)) for d2, ponto in encontrados]
+
+    def vizinhos(self, x, y, k=10, desde=None, agora=None):
+        """Os k pontos mais próximos de (x, y) recebidos a partir de `desde`, do mais perto ao mais longe."""
+        desde = float("-inf") if desde is None else desde
+        melhores = []       # heap máximo via distância negativa: [(-d2, desempate, ponto)]
+        with self._lock:
+            if agora is not None:
+                self._expirar(agora)
+            celulas = self._celulas
+            if not celulas or k <= 0:
+                return []
+            cx, cy = self._celula(x, y)
+            # Anel máximo: até cobrir todas as células ocupadas
+            alcance = max(max(abs(c[0] - cx), abs(c[1] - cy)) for c in celulas)
+            desempate = 0
+            for anel in range(alcance + 1):
+                # Células do anel d estão a pelo menos (d - 1) * tamanho_celula do ponto
+                if len(melhores) == k and -melhores[0][0] < ((anel - 1) * self.tamanho_celula) ** 2:
+                    break
+                for celula in self._anel(cx, cy, anel):
+                    pontos = celulas.get(celula)
+                    if not pontos:
+                        continue
+                    for ponto in reversed(pontos):
+                        if ponto[0] < desde:
+                            break
+                        d2 = (ponto[1] - x) ** 2 + (ponto[2] - y) ** 2
+                        desempate += 1
+                        if len(melhores) < k:
+                            heapq.heappush(melhores, (-d2, desempate, ponto))
+                        elif d2 < -melhores[0][0]:
+                            heapq.heapreplace(melhores, (-d2, desempate, ponto))
+        ordenados = sorted(((-d2, ponto) for d2, _, ponto in melhores), key=lambda par: par[0])
+        return [self._ponto_dict(ponto, math.sqrt(d2)) for d2, ponto in ordenados]
+
+    @staticmethod
+    def _anel(cx, cy, d):
+        """Células à distância de Chebyshev exatamente d de (cx, cy)."""
+        if d == 0:
+            yield cx, cy
+            return
+        for i in range(-d, d + 1):
+            yield cx + i, cy - d
+            yield cx + i, cy + d
+        for j in range(-d + 1, d):
+            yield cx - d, cy + j
+            yield cx + d, cy + j
+
+    def mapa_calor(self, agora=None):
+        """Contagens por célula do mapa (linhas de y, colunas de x) na janela de retenção."""
+        with self._lock:
+            if agora is not None:
+                self._expirar(agora)
+            contagens = [list(linha) for linha in self._mapa]
+            fora = self.fora_do_mapa
+            total = len(self._ordem)
+        return {
+            "limites": list(self.limites_mapa),
+            "resolucao": list(self.resolucao_mapa),
+            "janela_s": self.retencao,
+            "contagens": contagens,
+            "maximo": max((max(linha) for linha in contagens), default=0),
+            "total": total,
+            "fora_da_area": fora,
+        }
+
+    def estatisticas(self):
+        return {
+            "pontos": len(self._ordem),
+            "celulas_ocupadas": len(self._celulas),
+            "tamanho_celula": self.tamanho_celula,
+            "retencao_s": self.retencao,
+            "descartados": self.descartados,
+        }
+
+    # ========== SNAPSHOT ==========
+    def capturar(self):
+        """Cópia das filas de cada célula (sob o lock, só referências aos pontos); ver `serializar`."""
+        with self._lock:
+            return [list(pontos) for pontos in self._celulas.values()]
+
+    @staticmethod
+    def serializar(captura):
+        """Pontos em ordem de chegada, em colunas (instante, x, y, seq, sensor), em bytes para a seção do snapshot."""
+        # Cada célula já está em ordem de chegada: basta intercalar as filas pelo instante
+        pontos = list(heapq.merge(*captura, key=lambda p: p[0]))
+        instantes, xs, ys, seqs, sensores = zip(*pontos) if pontos else ((),) * 5
+        return empacotar_partes([
+            array("d", instantes).tobytes(),
+            array("d", xs).tobytes(),
+            array("d", ys).tobytes(),
+            array("q", seqs).tobytes(),
+            empacotar_textos(sensores),
+        ])
+
+    def exportar(self):
+        return self.serializar(self.capturar())
+
+    def restaurar(self, dados):
+        partes = desempacotar_partes(dados)
+        pontos = zip(ler_coluna("d", partes[0]), ler_coluna("d", partes[1]), ler_coluna("d", partes[2]),
+                     ler_coluna("q", partes[3]), desempacotar_textos(partes[4]))
+        with self._lock:
+            for instante, x, y, seq, sensor in pontos:
+                self._inserir(instante, x, y, seq, sensor)
+            if self._ordem:
+                self._expirar(self._ordem[-1][0])
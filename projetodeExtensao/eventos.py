@@ -0,0 +1,286 @@
+"""
+Estruturas em memória para o histórico recente de colisões.
+Registros compactos (__slots__) guardados num buffer circular de capacidade fixa.
+"""
+
+import json
+import sys
+import threading
+from datetime import datetime
+
+
+def _intern(valor):
+    """Interna strings repetidas (sensor, tipo) para compartilhar a mesma instância."""
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
+class EventoColisao:
+    """Registro compacto e normalizado de uma colisão recebida.
+
+    Os campos numéricos são None quando o produtor não os envia. Do payload
+    guarda-se só o JSON original em bytes (`bruto`), não o dict decodificado:
+    `dados` o decodifica sob demanda (histórico JSON, consultas).
+    """
+
+    __slots__ = (
+        "seq", "recebido_em", "sensor", "tipo", "colisao_id", "enviado_em",
+        "intensidade", "velocidade", "distancia", "x", "y", "local", "bruto",
+    )
+
+    def __init__(self, recebido_em, sensor=None, tipo=None, dados=None, seq=0, colisao_id=None,
+                 enviado_em=None, intensidade=None, velocidade=None, distancia=None,
+                 x=None, y=None, local=None, bruto=None):
+        self.seq = seq                      # Número de sequência atribuído pelo buffer
+        self.recebido_em = recebido_em      # Epoch (segundos, float) do recebimento
+        self.sensor = _intern(sensor)
+        self.tipo = _intern(tipo)           # Tipo da colisão (ex.: "colisão frontal")
+        self.colisao_id = colisao_id        # Sequência do produtor (colisao_id / numero)
+        self.enviado_em = enviado_em        # Epoch informado pelo produtor
+        self.intensidade = intensidade      # Escala 1-10
+        self.velocidade = velocidade
+        self.distancia = distancia
+        self.x = x
+        self.y = y
+        self.local = _intern(local)         # Localização textual (ex.: "frontal")
+        # Payload original em bytes JSON (como recebido); sem `bruto`, serializa `dados`, se houver
+        if bruto is None and dados is not None:
+            bruto = json.dumps(dados, ensure_ascii=False, separators=(",", ":"))
+        if isinstance(bruto, str):
+            bruto = bruto.encode("utf-8")
+        elif bruto is not None and not isinstance(bruto, bytes):
+            bruto = bytes(bruto)            # bytearray / memoryview (ex.: registro do snapshot mapeado)
+        self.bruto = bruto
+
+    @property
+    def dados(self):
+        """Payload original decodificado (recriado a cada acesso; None se o registro não o tem)."""
+        return None if self.bruto is None else json.loads(self.bruto)
+
+    def bruto_em_linha(self):
+        """Payload em bytes JSON numa única linha (para JSONL).
+
+        Quebras de linha só podem estar fora das strings num JSON válido (dentro delas vêm
+        escapadas), então trocá-las por espaço não altera o conteúdo.
+        """
+        bruto = self.bruto
+        if bruto is None:
+            return b"null"
+        if b"\n" in bruto or b"\r" in bruto:
+            bruto = bruto.replace(b"\r", b" ").replace(b"\n", b" ")
+        return bruto
+
+    @classmethod
+    def de_payload(cls, dados, recebido_em):
+        """Cria o registro a partir do payload JSON já decodificado, sem validação."""
+        sensor = tipo = None
+        if isinstance(dados, dict):
+            sensor = dados.get("sensor") or dados.get("sensor_id")
+            tipo = dados.get("tipo_colisao") or dados.get("tipo")
+        return cls(recebido_em, sensor, tipo, dados)
+
+    def para_dict(self, date_format):
+        """Converte para o formato de histórico salvo em JSON ({"timestamp", "dados"})."""
+        return {
+            "timestamp": datetime.fromtimestamp(self.recebido_em).strftime(date_format),
+            "dados": self.dados,
+        }
+
+    def campos(self):
+        """Retorna os campos normalizados (sem o payload original)."""
+        return {nome: getattr(self, nome) for nome in self.__slots__ if nome != "bruto"}
+
+    def __repr__(self):
+        return f"EventoColisao(seq={self.seq}, sensor={self.sensor!r}, tipo={self.tipo!r})"
+
+
+class VisaoBuffer:
+    """Visão imutável de um intervalo de sequências do buffer, sem copiar os registros.
+
+    Itens sobrescritos pelo buffer depois da criação da visão são simplesmente pulados.
+    """
+
+    __slots__ = ("_buffer", "inicio", "fim")
+
+    def __init__(self, buffer, inicio, fim):
+        self._buffer = buffer
+        self.inicio = inicio    # Primeira sequência incluída
+        self.fim = fim          # Última sequência incluída
+
+    def __len__(self):
+        return max(0, self.fim - self.inicio + 1)
+
+    def __iter__(self):
+        return self._buffer.iterar(self.inicio, self.fim)
+
+    def __reversed__(self):
+        obter = self._buffer.obter
+        for seq in range(self.fim, self.inicio - 1, -1):
+            evento = obter(seq)
+            if evento is not None:
+                yield evento
+
+
+class BufferEventos:
+    """Buffer circular de capacidade fixa com sequência monotônica.
+
+    A escrita é protegida por lock; leituras acessam o slot `seq % capacidade`
+    e confirmam a sequência do registro, sem bloquear quem está gravando.
+    `recebido_em` nunca diminui com a sequência (ver `adicionar`), o que permite
+    a busca binária de `buscar_seq`.
+
+    Após um reinício, `restaurar` liga o buffer a uma base (snapshot mapeado em
+    memória): as sequências ainda não sobrescritas são lidas dela sob demanda,
+    sem recriar os registros na inicialização.
+    """
+
+    def __init__(self, capacidade):
+        if capacidade <= 0:
+            raise ValueError("A capacidade do buffer deve ser positiva.")
+        self.capacidade = int(capacidade)
+        self._itens = [None] * self.capacidade
+        self._proximo_seq = 1
+        self._ultimo_recebido = None    # recebido_em do evento mais recente
+        self._base = None
+        self._lock = threading.Lock()
+        self._novos = threading.Condition(self._lock)
+
+    def adicionar(self, evento):
+        """Armazena o evento, sobrescrevendo o mais antigo se cheio. Retorna a sequência.
+
+        Com vários workers, um lote recebido antes pode ser armazenado depois de outro: sequência e
+        instante são atribuídos juntos, e `recebido_em` é elevado ao do evento anterior se for menor.
+        """
+        with self._lock:
+            if self._ultimo_recebido is not None and evento.recebido_em < self._ultimo_recebido:
+                evento.recebido_em = self._ultimo_recebido
+            self._ultimo_recebido = evento.recebido_em
+            seq = self._proximo_seq
+            evento.seq = seq
+            self._itens[seq % self.capacidade] = evento
+            self._proximo_seq = seq + 1
+            self._novos.notify_all()
+        return seq
+
+    def aguardar(self, apos_seq, timeout=None):
+        """Bloqueia até existir evento com sequência maior que `apos_seq` (ou timeout).
+
+        Retorna True se há eventos novos.
+        """
+        with self._novos:
+            return self._novos.wait_for(lambda: self._proximo_seq - 1 > apos_seq, timeout)
+
+    @property
+    def ultimo_seq(self):
+        """Sequência do evento mais recente (0 se vazio)."""
+        return self._proximo_seq - 1
+
+    @property
+    def primeiro_seq(self):
+        """Sequência do evento mais antigo ainda retido."""
+        return max(1, self._proximo_seq - self.capacidade)
+
+    def __len__(self):
+        return min(self._proximo_seq - 1, self.capacidade)
+
+    def __bool__(self):
+        return self._proximo_seq > 1
+
+    def __iter__(self):
+        return self.iterar()
+
+    def obter(self, seq):
+        """Retorna o evento da sequência informada ou None se já foi descartado."""
+        evento = self._itens[seq % self.capacidade]
+        if evento is None or evento.seq != seq:
+            base = self._base
+            if base is not None and base.primeiro_seq <= seq <= base.ultimo_seq and seq >= self.primeiro_seq:
+                return base.obter(seq)
+            return None
+        return evento
+
+    # ========== RESTAURAÇÃO ==========
+    def restaurar(self, base, ultimo_seq):
+        """Continua a numeração após `ultimo_seq`, lendo da `base` o que ainda não foi sobrescrito.
+
+        `base` expõe primeiro_seq, ultimo_seq e obter(seq) (ex.: SnapshotMapeado).
+        """
+        with self._lock:
+            self._base = base
+            self._proximo_seq = max(self._proximo_seq, ultimo_seq + 1)
+            ultimo = base.obter(ultimo_seq) if base is not None else None
+            if ultimo is not None:
+                self._ultimo_recebido = ultimo.recebido_em
+
+    def trocar_base(self, base):
+        """Substitui a base (ex.: pelo snapshot mais novo); libera-a se já foi toda sobrescrita."""
+        with self._lock:
+            if base is None or base.ultimo_seq < self.primeiro_seq:
+                self._base = None
+            else:
+                self._base = base
+
+    @property
+    def base(self):
+        return self._base
+
+    def capturar(self):
+        """(primeiro_seq, ultimo_seq, cópia dos slots, base) para gravar um snapshot.
+
+        Slots cuja sequência não confere devem ser lidos da base.
+        """
+        with self._lock:
+            return self.primeiro_seq, self.ultimo_seq, list(self._itens), self._base
+
+    def iterar(self, desde_seq=None, ate_seq=None):
+        """Itera em ordem de chegada entre as sequências informadas (inclusive)."""
+        ultimo = self.ultimo_seq if ate_seq is None else min(ate_seq, self.ultimo_seq)
+        inicio = self.primeiro_seq if desde_seq is None else max(desde_seq, self.primeiro_seq)
+        obter = self.obter
+        for seq in range(inicio, ultimo + 1):
+            evento = obter(seq)
+            if evento is not None:
+                yield evento
+
+    def snapshot(self):
+        """Retorna uma visão do conteúdo atual sem copiar os registros."""
+        with self._lock:
+            return VisaoBuffer(self, self.primeiro_seq, self.ultimo_seq)
+
+    def recentes(self, limite, antes_de=None, filtro=None):
+        """Eventos do mais novo para o mais antigo, com sequência menor que `antes_de`.
+
+        `filtro` (opcional) é aplicado a cada evento; a varredura nunca passa da
+        capacidade do buffer.
+        """
+        fim = self.ultimo_seq if antes_de is None else min(antes_de - 1, self.ultimo_seq)
+        inicio = self.primeiro_seq
+        obter = self.obter
+        pagina = []
+        for seq in range(fim, inicio - 1, -1):
+            evento = obter(seq)
+            if evento is not None and (filtro is None or filtro(evento)):
+                pagina.append(evento)
+                if len(pagina) >= limite:
+                    break
+        return pagina
+
+    def buscar_seq(self, instante):
+        """Primeira sequência com recebido_em >= instante (busca binária).
+
+        `recebido_em` não diminui com a sequência (garantido por `adicionar`); se o
+        slot for sobrescrito durante a busca, ele é tratado como mais antigo.
+        """
+        baixo, alto = self.primeiro_seq, self.ultimo_seq + 1
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            evento = self.obter(meio)
+            if evento is None or evento.recebido_em < instante:
+                baixo = meio + 1
+            else:
+                alto = meio
+        return baixo
+
+    def ultimos(self, quantidade):
+        """Retorna os `quantidade` eventos mais recentes, do mais antigo ao mais novo."""
+        ultimo = self.ultimo_seq
+        return list(self.iterar(ultimo - quantidade + 1, ultimo))
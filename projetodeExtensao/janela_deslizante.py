@@ -0,0 +1,107 @@
+"""
+Contador de colisões em janelas deslizantes de tempo.
+Mantém a contagem de eventos dos últimos N segundos sem reprocessar o histórico.
+"""
+
+import threading
+import time
+
+
+class ContadorJanelaDeslizante:
+    """Contador incremental de eventos para várias janelas de tempo (ex.: 1 min, 5 min, 1 h).
+
+    Os eventos são agrupados em baldes de `resolucao` segundos num anel de tamanho fixo,
+    usando o relógio monotônico. Cada janela mantém sua soma corrente, que é ajustada
+    apenas quando o tempo avança; por isso registrar e consultar custam O(1) amortizado,
+    independentemente do tamanho do histórico.
+    """
+
+    def __init__(self, janelas=(60, 300, 3600), resolucao=1.0, relogio=time.monotonic):
+        if not janelas:
+            raise ValueError("Informe ao menos uma janela de tempo.")
+        self.resolucao = float(resolucao)
+        self.janelas = tuple(sorted(set(int(j) for j in janelas)))
+        self._relogio = relogio
+
+        # Quantidade de baldes coberta por cada janela
+        self._baldes_por_janela = {j: max(1, int(round(j / self.resolucao))) for j in self.janelas}
+        self._tamanho = max(self._baldes_por_janela.values())
+        self._anel = [0] * self._tamanho
+        self._somas = {j: 0 for j in self.janelas}
+        self._balde_atual = int(self._relogio() / self.resolucao)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _avancar(self, balde):
+        """Descarta os baldes que saíram de cada janela até o balde informado."""
+        atraso = balde - self._balde_atual
+        if atraso <= 0:
+            return
+        if atraso >= self._tamanho:
+            # Passou mais tempo que a maior janela: tudo expirou
+            self._anel = [0] * self._tamanho
+            self._somas = {j: 0 for j in self.janelas}
+        else:
+            anel, tamanho = self._anel, self._tamanho
+            for b in range(self._balde_atual + 1, balde + 1):
+                for janela, n in self._baldes_por_janela.items():
+                    self._somas[janela] -= anel[(b - n) % tamanho]
+                anel[b % tamanho] = 0
+        self._balde_atual = balde
+
+    def registrar(self, quantidade=1, instante=None):
+        """Registra `quantidade` eventos no instante monotônico informado (ou agora)."""
+        instante = self._relogio() if instante is None else instante
+        balde = int(instante / self.resolucao)
+        with self._lock:
+            self._avancar(balde)
+            # Eventos atrasados ainda dentro do anel caem no balde correto
+            idade = self._balde_atual - balde
+            if idade >= self._tamanho:
+                return
+            self._anel[balde % self._tamanho] += quantidade
+            for janela, n in self._baldes_por_janela.items():
+                if idade < n:
+                    self._somas[janela] += quantidade
+            self._total += quantidade
+
+    def contagem(self, janela=60):
+        """Retorna quantos eventos ocorreram na janela (em segundos)."""
+        if janela not in self._somas:
+            raise KeyError(f"Janela de {janela}s não configurada. Disponíveis: {self.janelas}")
+        with self._lock:
+            self._avancar(int(self._relogio() / self.resolucao))
+            return self._somas[janela]
+
+    def contagens(self):
+        """Retorna as contagens de todas as janelas configuradas."""
+        with self._lock:
+            self._avancar(int(self._relogio() / self.resolucao))
+            return dict(self._somas)
+
+    def taxa(self, janela=60, por=60):
+        """Taxa média de eventos na janela, expressa em eventos a cada `por` segundos."""
+        return self.contagem(janela) * por / janela
+
+    def exportar(self):
+        """Estado serializável: idade (em baldes) e contagem dos baldes não vazios, no relógio de parede."""
+        with self._lock:
+            self._avancar(int(self._relogio() / self.resolucao))
+            anel, tamanho, atual = self._anel, self._tamanho, self._balde_atual
+            baldes = [[idade, anel[(atual - idade) % tamanho]] for idade in range(tamanho)
+                      if anel[(atual - idade) % tamanho]]
+            return {"instante": time.time(), "resolucao": self.resolucao, "total": self._total, "baldes": baldes}
+
+    def restaurar(self, estado):
+        """Recoloca os baldes exportados descontando o tempo decorrido desde a exportação."""
+        decorrido = max(0.0, time.time() - estado["instante"])
+        agora = self._relogio()
+        for idade, quantidade in estado["baldes"]:
+            self.registrar(quantidade, agora - decorrido - idade * estado["resolucao"])
+        with self._lock:
+            self._total = estado["total"]
+
+    @property
+    def total(self):
+        """Total de eventos registrados desde a criação."""
+        return self._total
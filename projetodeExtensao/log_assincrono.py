@@ -0,0 +1,88 @@
+"""
+Logging sem bloqueio para o caminho quente do detector.
+
+O caminho quente apenas enfileira registros (ManipuladorFila); uma thread
+QueueListener formata e grava em arquivo/console. Com a fila cheia o registro
+é descartado e contado, em vez de travar a ingestão. LimitadorConsole limita
+as linhas por evento exibidas por segundo e acumula o excedente para um resumo.
+"""
+
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Logger das linhas de tela (_print): vão para o stdout sem o formato do log
+NOME_TELA = "detector_colisao.tela"
+
+
+class ManipuladorFila(QueueHandler):
+    """QueueHandler que nunca bloqueia: com a fila cheia o registro é descartado e contado."""
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class _SomenteTela(logging.Filter):
+    def __init__(self, tela):
+        super().__init__()
+        self.tela = tela
+
+    def filter(self, record):
+        return (record.name == NOME_TELA) == self.tela
+
+
+def iniciar_listener(handlers_log, handler_tela, tamanho_fila):
+    """Cria a fila, o ManipuladorFila e inicia o QueueListener.
+
+    `handlers_log` recebem os registros do logger; `handler_tela` recebe só as
+    linhas do logger NOME_TELA. Retorna (manipulador, listener).
+    """
+    for handler in handlers_log:
+        handler.addFilter(_SomenteTela(False))
+    handler_tela.addFilter(_SomenteTela(True))
+    fila = queue.Queue(maxsize=tamanho_fila)
+    listener = QueueListener(fila, *handlers_log, handler_tela, respect_handler_level=True)
+    listener.start()
+    return ManipuladorFila(fila), listener
+
+
+class LimitadorConsole:
+    """Permite até `max_por_segundo` linhas por segundo; conta as suprimidas."""
+
+    def __init__(self, max_por_segundo, relogio=time.monotonic):
+        self.max_por_segundo = max_por_segundo
+        self.total_suprimidas = 0
+        self._relogio = relogio
+        self._inicio = relogio()
+        self._exibidas = 0
+        self._suprimidas = 0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """True se a linha pode ser exibida neste segundo."""
+        with self._lock:
+            agora = self._relogio()
+            if agora - self._inicio >= 1.0:
+                self._inicio = agora
+                self._exibidas = 0
+            if self._exibidas < self.max_por_segundo:
+                self._exibidas += 1
+                return True
+            self._suprimidas += 1
+            self.total_suprimidas += 1
+            return False
+
+    def coletar(self):
+        """Retorna e zera a quantidade de linhas suprimidas desde a última coleta."""
+        with self._lock:
+            suprimidas, self._suprimidas = self._suprimidas, 0
+            return suprimidas
@@ -0,0 +1,191 @@
+"""
+Métricas do detector no formato texto do Prometheus.
+
+Os instrumentos são baratos o bastante para ficarem sempre ligados: cada
+thread incrementa a própria fatia (shard) de um contador/histograma, sem
+lock no caminho quente; a leitura (/metrics) soma as fatias. Histogramas usam
+limites fixos (bisect sobre uma tupla). Medidores são funções avaliadas só na
+coleta (ex.: profundidade da fila, tamanho do histórico).
+"""
+
+import bisect
+import threading
+
+# Limites (segundos) para latências de etapas por mensagem: 1 µs .. 1 s
+LIMITES_LATENCIA = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0,
+)
+# Limites (segundos) para operações de disco (salvamentos): 1 ms .. 10 s
+LIMITES_DISCO = (1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(rotulos, extra=None):
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in pares) + "}"
+
+
+def _formatar_numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer() and abs(valor) < 1e15:
+        return str(int(valor))
+    return repr(valor)
+
+
+class _Fatiado:
+    """Base dos instrumentos com uma fatia por thread (só a dona escreve nela)."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._fatias = []
+        self._lock = threading.Lock()    # Só na criação de fatias e na leitura
+
+    def _nova_fatia(self):
+        fatia = self._fatia_vazia()
+        with self._lock:
+            self._fatias.append(fatia)
+        self._local.fatia = fatia
+        return fatia
+
+    def _fatia(self):
+        try:
+            return self._local.fatia
+        except AttributeError:
+            return self._nova_fatia()
+
+
+class Contador(_Fatiado):
+    """Contador monotônico."""
+
+    tipo = "counter"
+
+    def _fatia_vazia(self):
+        return [0]
+
+    def inc(self, n=1):
+        self._fatia()[0] += n
+
+    @property
+    def valor(self):
+        with self._lock:
+            return sum(fatia[0] for fatia in self._fatias)
+
+    def amostras(self, nome, rotulos):
+        return [(nome, _formatar_rotulos(rotulos), self.valor)]
+
+
+class Histograma(_Fatiado):
+    """Histograma de limites fixos; fatia = [contagem por balde..., +Inf, soma]."""
+
+    tipo = "histogram"
+
+    def __init__(self, limites=LIMITES_LATENCIA):
+        super().__init__()
+        self.limites = tuple(sorted(limites))
+
+    def _fatia_vazia(self):
+        return [0] * (len(self.limites) + 1) + [0.0]
+
+    def observar(self, valor):
+        fatia = self._fatia()
+        fatia[bisect.bisect_left(self.limites, valor)] += 1
+        fatia[-1] += valor
+
+    def observar_varios(self, valores):
+        """Registra vários valores com uma única busca da fatia (laços por lote)."""
+        fatia, limites, posicao = self._fatia(), self.limites, bisect.bisect_left
+        for valor in valores:
+            fatia[posicao(limites, valor)] += 1
+        fatia[-1] += sum(valores)
+
+    def totais(self):
+        """(contagens por balde incluindo +Inf, soma)."""
+        with self._lock:
+            fatias = [list(f) for f in self._fatias]
+        contagens = [sum(f[i] for f in fatias) for i in range(len(self.limites) + 1)]
+        return contagens, sum(f[-1] for f in fatias)
+
+    @property
+    def total(self):
+        """Quantidade de observações."""
+        with self._lock:
+            return sum(sum(f[:-1]) for f in self._fatias)
+
+    def amostras(self, nome, rotulos):
+        contagens, soma = self.totais()
+        linhas, acumulado = [], 0
+        for limite, contagem in zip(self.limites + (float("inf"),), contagens):
+            acumulado += contagem
+            linhas.append((f"{nome}_bucket", _formatar_rotulos(rotulos, ("le", _formatar_numero(limite))), acumulado))
+        linhas.append((f"{nome}_sum", _formatar_rotulos(rotulos), soma))
+        linhas.append((f"{nome}_count", _formatar_rotulos(rotulos), acumulado))
+        return linhas
+
+
+class Medidor:
+    """Valor instantâneo calculado por `funcao` no momento da coleta."""
+
+    tipo = "gauge"
+
+    def __init__(self, funcao):
+        self.funcao = funcao
+
+    def amostras(self, nome, rotulos):
+        return [(nome, _formatar_rotulos(rotulos), self.funcao())]
+
+
+class ContadorFuncao(Medidor):
+    """Contador mantido fora do registro (ex.: atributo escrito por uma única thread), lido por `funcao`."""
+
+    tipo = "counter"
+
+
+class RegistroMetricas:
+    """Famílias de métricas (nome, ajuda, tipo) com um instrumento por conjunto de rótulos."""
+
+    def __init__(self):
+        self._familias = {}     # nome -> [ajuda, tipo, {rotulos: instrumento}]
+        self._lock = threading.Lock()
+
+    def _registrar(self, nome, ajuda, instrumento, rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            familia = self._familias.setdefault(nome, [ajuda, instrumento.tipo, {}])
+            if familia[1] != instrumento.tipo:
+                raise ValueError(f"Métrica {nome} já registrada como {familia[1]}")
+            return familia[2].setdefault(chave, instrumento)
+
+    def contador(self, nome, ajuda, **rotulos):
+        return self._registrar(nome, ajuda, Contador(), rotulos)
+
+    def histograma(self, nome, ajuda, limites=LIMITES_LATENCIA, **rotulos):
+        return self._registrar(nome, ajuda, Histograma(limites), rotulos)
+
+    def medidor(self, nome, ajuda, funcao, **rotulos):
+        return self._registrar(nome, ajuda, Medidor(funcao), rotulos)
+
+    def contador_funcao(self, nome, ajuda, funcao, **rotulos):
+        return self._registrar(nome, ajuda, ContadorFuncao(funcao), rotulos)
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            familias = [(nome, ajuda, tipo, list(instrumentos.items()))
+                        for nome, (ajuda, tipo, instrumentos) in self._familias.items()]
+        linhas = []
+        for nome, ajuda, tipo, instrumentos in familias:
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for rotulos, instrumento in instrumentos:
+                for amostra, texto_rotulos, valor in instrumento.amostras(nome, rotulos):
+                    linhas.append(f"{amostra}{texto_rotulos} {_formatar_numero(valor)}")
+        return "\n".join(linhas) + "\n"
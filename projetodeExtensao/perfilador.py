@@ -0,0 +1,282 @@
+"""
+Perfilamento sob demanda do detector em execução.
+
+Uma janela de perfilamento é aberta por sinal (SIGUSR1) ou pelo endpoint de
+administração e fecha sozinha após `duracao` segundos, gravando o resultado em
+logs/ para análise offline:
+- amostragem: uma thread lê as pilhas de todas as threads (sys._current_frames)
+  a cada `intervalo` e grava pilhas agregadas (formato "folded", aceito por
+  flamegraph.pl/speedscope) + resumo das funções mais amostradas.
+- deterministico: cProfile nas threads do pipeline. Os métodos quentes do
+  detector são trocados, só nesta instância e só durante a janela, por versões
+  que ativam o Profile da thread; grava .prof (pstats) + resumo em texto.
+- memoria (opcional, com qualquer modo): tracemalloc durante a janela; grava o
+  snapshot (.tracemalloc) e um resumo com as maiores alocações e o tamanho das
+  estruturas do DetectorColisao.
+
+Desativado não há custo: nenhum gancho, verificação ou thread extra.
+"""
+
+import cProfile
+import collections
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+MODOS = ("amostragem", "deterministico")
+
+# Métodos do detector envolvidos pelo modo determinístico (não chamam uns aos outros)
+METODOS_PERFILADOS = ("_processar_lote", "_check_connection_health", "_save_data")
+
+
+class PerfilEmAndamento(RuntimeError):
+    """Já existe uma janela de perfilamento aberta."""
+
+
+class PerfiladorDetector:
+    """Controla janelas de perfilamento de um DetectorColisao."""
+
+    def __init__(self, detector, diretorio, intervalo=0.005, frames_memoria=10):
+        self.detector = detector
+        self.diretorio = Path(diretorio)
+        self.intervalo = intervalo
+        self.frames_memoria = frames_memoria
+        self.ultimos_arquivos = []
+        self._lock = threading.Lock()
+        self._sessao = None
+
+    # ========== CONTROLE ==========
+    def iniciar(self, modo="amostragem", duracao=30, memoria=False):
+        """Abre uma janela de `duracao` segundos. Retorna o estado; PerfilEmAndamento se já houver uma."""
+        if modo not in MODOS:
+            raise ValueError(f"Modo desconhecido: {modo!r} (use {', '.join(MODOS)})")
+        with self._lock:
+            if self._sessao is not None:
+                raise PerfilEmAndamento("perfilamento já em andamento")
+            sessao = self._sessao = {
+                "modo": modo,
+                "memoria": memoria,
+                "inicio": time.time(),
+                "duracao": duracao,
+                "parar": threading.Event(),
+            }
+        if memoria and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames_memoria)
+            sessao["tracemalloc_proprio"] = True
+        if modo == "amostragem":
+            sessao["pilhas"] = collections.Counter()
+            sessao["thread"] = threading.Thread(
+                target=self._amostrar, args=(sessao,), name="perfilador-amostragem", daemon=True
+            )
+            sessao["thread"].start()
+        else:
+            self._envolver_metodos(sessao)
+        sessao["temporizador"] = threading.Timer(duracao, self.parar)
+        sessao["temporizador"].daemon = True
+        sessao["temporizador"].start()
+        self.detector.logger.warning(f"Perfilamento iniciado ({modo}, {duracao}s, memória={memoria})")
+        return self.estado()
+
+    def parar(self):
+        """Fecha a janela atual (antes do prazo, se necessário) e grava os arquivos. Retorna os caminhos."""
+        with self._lock:
+            sessao, self._sessao = self._sessao, None
+        if sessao is None:
+            return []
+        sessao["temporizador"].cancel()
+        sessao["parar"].set()
+        prefixo = self.diretorio / f"perfil_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        if sessao["modo"] == "amostragem":
+            sessao["thread"].join()
+            arquivos = self._gravar_amostragem(sessao, prefixo)
+        else:
+            self._restaurar_metodos(sessao)
+            arquivos = self._gravar_deterministico(sessao, prefixo)
+        if sessao["memoria"] and tracemalloc.is_tracing():
+            snapshot, memoria = tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()
+            # Para o rastreamento antes de analisar o snapshot (o resumo pode levar alguns segundos)
+            if sessao.get("tracemalloc_proprio"):
+                tracemalloc.stop()
+            arquivos += self._gravar_memoria(prefixo, snapshot, memoria)
+        self.ultimos_arquivos = [str(a) for a in arquivos]
+        self.detector.logger.warning(f"Perfilamento concluído: {', '.join(self.ultimos_arquivos)}")
+        return self.ultimos_arquivos
+
+    def alternar(self, modo="amostragem", duracao=30, memoria=False):
+        """Inicia uma janela ou, se houver uma aberta, encerra-a (usado pelo sinal)."""
+        try:
+            return self.iniciar(modo, duracao, memoria)
+        except PerfilEmAndamento:
+            self.parar()
+            return self.estado()
+
+    def estado(self):
+        with self._lock:
+            sessao = self._sessao
+        if sessao is None:
+            return {"ativo": False, "ultimos_arquivos": self.ultimos_arquivos}
+        return {
+            "ativo": True,
+            "modo": sessao["modo"],
+            "memoria": sessao["memoria"],
+            "inicio": sessao["inicio"],
+            "restante_s": round(max(0.0, sessao["inicio"] + sessao["duracao"] - time.time()), 1),
+            "ultimos_arquivos": self.ultimos_arquivos,
+        }
+
+    # ========== AMOSTRAGEM ==========
+    def _amostrar(self, sessao):
+        pilhas, proprio = sessao["pilhas"], threading.get_ident()
+        sessao["amostras"] = 0
+        while not sessao["parar"].wait(self.intervalo):
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                pilha = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                pilha.append(nomes.get(ident, str(ident)))
+                pilhas[";".join(reversed(pilha))] += 1
+            sessao["amostras"] += 1
+
+    def _gravar_amostragem(self, sessao, prefixo):
+        pilhas = sessao["pilhas"]
+        folded = prefixo.with_suffix(".folded")
+        with open(folded, "w", encoding="utf-8") as f:
+            for pilha, contagem in pilhas.most_common():
+                f.write(f"{pilha} {contagem}\n")
+        # Resumo: funções no topo da pilha (tempo próprio) e em qualquer nível (tempo total)
+        proprio, total = collections.Counter(), collections.Counter()
+        for pilha, contagem in pilhas.items():
+            funcoes = pilha.split(";")[1:]
+            if funcoes:
+                proprio[funcoes[-1]] += contagem
+            for funcao in set(funcoes):
+                total[funcao] += contagem
+        resumo = prefixo.with_suffix(".txt")
+        with open(resumo, "w", encoding="utf-8") as f:
+            f.write(f"Amostragem: {sessao['amostras']} rodadas a cada {self.intervalo * 1000:.1f} ms\n\n")
+            for titulo, contador in (("Tempo próprio", proprio), ("Tempo total", total)):
+                f.write(f"== {titulo} (amostras) ==\n")
+                for funcao, contagem in contador.most_common(30):
+                    f.write(f"{contagem:8d}  {funcao}\n")
+                f.write("\n")
+        return [folded, resumo]
+
+    # ========== DETERMINÍSTICO ==========
+    def _envolver_metodos(self, sessao):
+        """Troca os métodos quentes (atributos da instância) por versões com cProfile por thread."""
+        perfis, lock, local = {}, threading.Lock(), threading.local()
+        sessao["perfis"] = perfis
+        sessao["em_andamento"] = em_andamento = [0]
+
+        def perfil_da_thread():
+            perfil = perfis.get(threading.get_ident())
+            if perfil is None:
+                with lock:
+                    perfil = perfis.setdefault(threading.get_ident(), cProfile.Profile())
+            return perfil
+
+        def envolver(original):
+            def perfilado(*args, **kwargs):
+                if getattr(local, "ativo", False):
+                    return original(*args, **kwargs)
+                local.ativo = True
+                perfil = perfil_da_thread()
+                with lock:
+                    em_andamento[0] += 1
+                perfil.enable()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    perfil.disable()
+                    local.ativo = False
+                    with lock:
+                        em_andamento[0] -= 1
+            return perfilado
+
+        for nome in METODOS_PERFILADOS:
+            setattr(self.detector, nome, envolver(getattr(self.detector, nome)))
+
+    def _restaurar_metodos(self, sessao, espera_maxima=5.0):
+        """Volta aos métodos da classe e espera as chamadas perfiladas em curso terminarem."""
+        for nome in METODOS_PERFILADOS:
+            self.detector.__dict__.pop(nome, None)
+        limite = time.monotonic() + espera_maxima
+        while sessao["em_andamento"][0] and time.monotonic() < limite:
+            time.sleep(0.01)
+
+    def _gravar_deterministico(self, sessao, prefixo):
+        perfis = [p for p in sessao["perfis"].values() if p.getstats()]
+        resumo = prefixo.with_suffix(".txt")
+        if not perfis:
+            resumo.write_text("Nenhuma chamada perfilada na janela.\n", encoding="utf-8")
+            return [resumo]
+        saida = io.StringIO()
+        estatisticas = pstats.Stats(*perfis, stream=saida)
+        arquivo = prefixo.with_suffix(".prof")
+        estatisticas.dump_stats(arquivo)
+        estatisticas.sort_stats("cumulative").print_stats(40)
+        estatisticas.sort_stats("tottime").print_stats(40)
+        resumo.write_text(saida.getvalue(), encoding="utf-8")
+        return [arquivo, resumo]
+
+    # ========== MEMÓRIA ==========
+    def _gravar_memoria(self, prefixo, snapshot, memoria):
+        arquivo = prefixo.with_suffix(".tracemalloc")
+        snapshot.dump(str(arquivo))
+        atual, pico = memoria
+        resumo = prefixo.with_name(prefixo.name + "_memoria.txt")
+        with open(resumo, "w", encoding="utf-8") as f:
+            f.write(f"Memória rastreada: atual {atual / 1024:.1f} KiB, pico {pico / 1024:.1f} KiB\n\n")
+            f.write("== Estado do DetectorColisao ==\n")
+            for chave, valor in self._estado_detector().items():
+                f.write(f"{chave}: {valor}\n")
+            f.write("\n== Maiores alocações por linha ==\n")
+            filtrado = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            for estatistica in filtrado.statistics("lineno")[:30]:
+                f.write(f"{estatistica}\n")
+            f.write("\n== Por arquivo ==\n")
+            for estatistica in filtrado.statistics("filename")[:15]:
+                f.write(f"{estatistica}\n")
+        return [arquivo, resumo]
+
+    def _estado_detector(self):
+        """Tamanho das principais estruturas em memória do detector."""
+        detector = self.detector
+        return {
+            "historico_eventos": len(detector.colisoes),
+            "fila": detector._fila.qsize(),
+            "baldes_rollups": {nivel: len(baldes) for nivel, baldes in detector.rollups._baldes.items()},
+            "log": detector.estatisticas_log(),
+        }
+
+
+def instalar_sinal(perfilador, nome_sinal="SIGUSR1", modo="amostragem", duracao=30, memoria=False):
+    """Liga o sinal à alternância do perfilamento. Retorna False se indisponível (Windows, thread secundária)."""
+    numero = getattr(signal, nome_sinal, None) if nome_sinal else None
+    if numero is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def tratador(signum, frame):
+        # Fora do tratador: gravar arquivos e iniciar threads não deve interromper a thread principal
+        threading.Thread(
+            target=perfilador.alternar, args=(modo, duracao, memoria), name="perfilador-sinal", daemon=True
+        ).start()
+
+    signal.signal(numero, tratador)
+    return True
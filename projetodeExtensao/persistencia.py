@@ -0,0 +1,510 @@
+"""
+Backends de persistência do histórico de colisões.
+
+- json:  reescreve o arquivo completo a cada salvamento (formato original).
+- jsonl: anexa apenas os eventos novos em segmentos JSONL rotacionados,
+         com um manifesto registrando os limites de cada segmento.
+- sqlite: banco SQLite (WAL) indexado, com consultas por sensor, período e tipo.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from eventos import EventoColisao
+
+
+def _gravar_atomico(caminho, conteudo):
+    """Grava o arquivo via arquivo temporário + os.replace (nunca fica pela metade)."""
+    caminho = Path(caminho)
+    tmp = caminho.with_name(caminho.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, caminho)
+
+
+def _ler_retomada(retomada, limite=None):
+    """Próximos eventos de uma retomada (buffer, inicio, fim), até `limite` deles.
+
+    Retorna (eventos, perdidos, retomada restante ou None); `perdidos` são os já sobrescritos no buffer.
+    """
+    buffer, inicio, fim = retomada
+    ate = fim if limite is None else min(fim, inicio + limite - 1)
+    eventos = list(buffer.iterar(inicio, ate))
+    return eventos, ate - inicio + 1 - len(eventos), (buffer, ate + 1, fim) if ate < fim else None
+
+
+def exportar_snapshot_json(eventos, destino, date_format):
+    """Exporta eventos no formato de snapshot original ([{"timestamp", "dados"}]). Retorna bytes gravados."""
+    registros = [evento.para_dict(date_format) for evento in eventos]
+    conteudo = json.dumps(registros, indent=4)
+    with open(destino, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+    return len(conteudo.encode("utf-8"))
+
+
+class PersistenciaJSON:
+    """Snapshot completo do buffer em um único arquivo JSON (comportamento original)."""
+
+    def __init__(self, data_file, date_format):
+        self.data_file = data_file
+        self.date_format = date_format
+        self.ultimo_seq_persistido = 0
+
+    def registrar(self, evento):
+        pass
+
+    def descarregar(self):
+        pass
+
+    def retomar_de(self, seq, buffer=None):
+        """Após restaurar o estado do detector: eventos até `seq` já foram persistidos."""
+        self.ultimo_seq_persistido = seq
+
+    def salvar(self, buffer):
+        """Reescreve o arquivo com o conteúdo atual do buffer. Retorna bytes gravados."""
+        visao = buffer.snapshot()
+        gravados = exportar_snapshot_json(visao, self.data_file, self.date_format)
+        self.ultimo_seq_persistido = visao.fim
+        return gravados
+
+    def fechar(self):
+        pass
+
+
+class PersistenciaJSONL:
+    """Persistência incremental em segmentos JSONL (append-only).
+
+    O caminho de ingestão (`registrar`) só guarda a referência do evento; a
+    serialização, a escrita no segmento atual, a rotação e o fsync ficam com
+    `descarregar` (chamado periodicamente pela thread de disco do detector) e
+    `salvar`, sob um lock de escrita próprio, então `registrar` nunca espera o
+    disco. Como não dependem do buffer circular, nenhum evento se perde se o
+    buffer der a volta entre dois salvamentos. Após uma restauração, os eventos
+    que ainda faltavam são relidos do buffer pelo `salvar`, em partes de
+    `batch_size`, antes dos registrados depois. As linhas passam por um buffer de
+    escrita e o fsync é feito em grupo (a cada `fsync_batch` eventos ou
+    `fsync_interval` segundos). Um novo segmento é aberto ao atingir
+    `segment_max_bytes` ou `segment_max_age` segundos.
+    """
+
+    MANIFESTO = "manifest.json"
+
+    def __init__(self, diretorio, date_format, segment_max_bytes=16 * 1024 * 1024,
+                 segment_max_age=3600, fsync_batch=500, fsync_interval=5, batch_size=200):
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.date_format = date_format
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+
+        self.manifesto_path = self.diretorio / self.MANIFESTO
+        self.manifesto = self._carregar_manifesto()
+        self.descartados = 0            # Eventos que não chegaram aos segmentos (lacunas de sequência)
+        self._ultimo_seq = 0            # Última sequência aceita por `registrar` (nesta execução)
+        self._ultimo_gravado = 0        # Última sequência escrita no segmento
+        self._pendentes = []            # Eventos ainda não escritos no segmento
+        self._retomada = None           # (buffer, inicio, fim): eventos a reler do buffer antes dos pendentes
+        self._arquivo = None
+        self._segmento = None
+        self._aberto_em = 0.0
+        self._nao_sincronizados = 0     # Linhas escritas desde o último fsync
+        self._ultimo_fsync = time.monotonic()
+        self._lock = threading.Lock()           # Pendentes (registrar x descarregar)
+        self._lock_escrita = threading.Lock()   # Segmento, manifesto e retomada
+
+    # ========== MANIFESTO ==========
+    def _carregar_manifesto(self):
+        if self.manifesto_path.exists():
+            with open(self.manifesto_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"versao": 1, "segmentos": []}
+
+    def _salvar_manifesto(self):
+        _gravar_atomico(self.manifesto_path, json.dumps(self.manifesto, indent=2))
+
+    # ========== SEGMENTOS ==========
+    def _abrir_segmento(self, recebido_em):
+        """Abre um novo segmento a partir do instante do primeiro evento."""
+        nome = f"segmento_{datetime.fromtimestamp(recebido_em):%Y%m%d_%H%M%S}_{len(self.manifesto['segmentos']):06d}.jsonl"
+        self._arquivo = open(self.diretorio / nome, "ab", buffering=1024 * 1024)
+        self._aberto_em = time.monotonic()
+        self._segmento = {
+            "arquivo": nome,
+            "inicio": recebido_em,
+            "fim": recebido_em,
+            "eventos": 0,
+            "bytes": 0,
+            "fechado": False,
+        }
+        self.manifesto["segmentos"].append(self._segmento)
+
+    def _fechar_segmento(self):
+        if self._arquivo is None:
+            return
+        self._sincronizar(forcar=True)
+        self._arquivo.close()
+        self._arquivo = None
+        self._segmento["fechado"] = True
+        self._segmento = None
+        self._salvar_manifesto()
+
+    def _precisa_rotacionar(self):
+        return (
+            self._segmento["bytes"] >= self.segment_max_bytes
+            or time.monotonic() - self._aberto_em >= self.segment_max_age
+        )
+
+    def _sincronizar(self, forcar=False):
+        """Descarrega o buffer de escrita e faz fsync se o grupo estiver completo."""
+        if self._arquivo is None or not self._nao_sincronizados:
+            return
+        self._arquivo.flush()
+        if not forcar and self._nao_sincronizados < self.fsync_batch \
+                and time.monotonic() - self._ultimo_fsync < self.fsync_interval:
+            return
+        os.fsync(self._arquivo.fileno())
+        self._nao_sincronizados = 0
+        self._ultimo_fsync = time.monotonic()
+
+    @staticmethod
+    def _linha(evento):
+        # O payload original entra como está (já é JSON): sem decodificar nem serializar de novo
+        cabecalho = json.dumps({"seq": evento.seq, "recebido_em": evento.recebido_em}, separators=(",", ":"))
+        return b"".join((cabecalho[:-1].encode("utf-8"), b',"dados":', evento.bruto_em_linha(), b"}\n"))
+
+    def _escrever(self, evento):
+        """Escreve o evento no segmento atual, rotacionando se preciso (chamar com o lock de escrita)."""
+        if self._arquivo is None or self._precisa_rotacionar():
+            self._fechar_segmento()
+            self._abrir_segmento(evento.recebido_em)
+        linha = self._linha(evento)
+        self._arquivo.write(linha)
+        self._segmento["bytes"] += len(linha)
+        self._segmento["eventos"] += 1
+        self._segmento["fim"] = evento.recebido_em
+        self._nao_sincronizados += 1
+        self._ultimo_gravado = evento.seq
+        return len(linha)
+
+    def _retomar(self, limite=None):
+        """Relê do buffer e escreve até `limite` eventos da retomada pendente (chamar com o lock de escrita)."""
+        eventos, perdidos, self._retomada = _ler_retomada(self._retomada, limite)
+        self.descartados += perdidos
+        return sum(self._escrever(evento) for evento in eventos)
+
+    def _escrever_pendentes(self):
+        """Conclui a retomada, se houver, e escreve os eventos pendentes (chamar com o lock de escrita)."""
+        gravados = self._retomar() if self._retomada is not None else 0
+        with self._lock:
+            lote, self._pendentes = self._pendentes, []
+        for evento in lote:
+            gravados += self._escrever(evento)
+        return gravados
+
+    # ========== API ==========
+    def registrar(self, evento):
+        """Guarda o evento para o próximo `descarregar`/`salvar` (sem serializar nem tocar no disco)."""
+        with self._lock:
+            if evento.seq <= self._ultimo_seq:
+                return
+            if self._ultimo_seq and evento.seq > self._ultimo_seq + 1:
+                self.descartados += evento.seq - self._ultimo_seq - 1
+            self._pendentes.append(evento)
+            self._ultimo_seq = evento.seq
+
+    @property
+    def ultimo_seq_persistido(self):
+        return self._ultimo_gravado
+
+    def retomar_de(self, seq, buffer=None):
+        """Após restaurar o estado do detector: eventos até `seq` já estão nos segmentos.
+
+        Os eventos do `buffer` posteriores a `seq` são relidos e gravados pelo próximo `salvar`.
+        """
+        with self._lock_escrita, self._lock:
+            self._ultimo_seq = self._ultimo_gravado = seq
+            if buffer is not None and buffer.ultimo_seq > seq:
+                self._retomada = (buffer, seq + 1, buffer.ultimo_seq)
+                self._ultimo_seq = buffer.ultimo_seq
+
+    def descarregar(self):
+        """Escreve os eventos pendentes e faz o fsync do grupo, se devido. Retorna bytes gravados.
+
+        Com retomada pendente não escreve nada: `salvar` a conclui em partes antes.
+        """
+        with self._lock_escrita:
+            if self._retomada is not None:
+                return 0
+            gravados = self._escrever_pendentes()
+            self._sincronizar()
+            return gravados
+
+    def salvar(self, buffer=None):
+        """Escreve o que estiver pendente, faz o fsync do grupo e atualiza o manifesto. Retorna bytes gravados."""
+        gravados = 0
+        # Retomada em partes: uma leitura concorrente (ler_eventos) nunca espera a retomada inteira
+        while self._retomada is not None:
+            with self._lock_escrita:
+                if self._retomada is not None:
+                    gravados += self._retomar(self.batch_size)
+        gravados += self.descarregar()
+        if gravados:
+            with self._lock_escrita:
+                self._salvar_manifesto()
+        return gravados
+
+    def ler_eventos(self):
+        """Itera (recebido_em, dados) de todos os segmentos, lendo linha a linha."""
+        with self._lock_escrita:
+            self._escrever_pendentes()
+            if self._arquivo is not None:
+                self._arquivo.flush()
+        for segmento in self.manifesto["segmentos"]:
+            caminho = self.diretorio / segmento["arquivo"]
+            if not caminho.exists():
+                continue
+            with open(caminho, "r", encoding="utf-8") as f:
+                for linha in f:
+                    if linha.strip():
+                        registro = json.loads(linha)
+                        yield registro["recebido_em"], registro["dados"]
+
+    def exportar_json(self, destino, limite=None):
+        """Exporta os segmentos no formato de snapshot original. Retorna bytes gravados."""
+        eventos = (EventoColisao(recebido_em, dados=dados) for recebido_em, dados in self.ler_eventos())
+        if limite:
+            eventos = deque(eventos, maxlen=limite)
+        return exportar_snapshot_json(eventos, destino, self.date_format)
+
+    def fechar(self):
+        with self._lock_escrita:
+            self._escrever_pendentes()
+            self._fechar_segmento()
+
+
+class PersistenciaSQLite:
+    """Armazenamento consultável em SQLite no modo WAL.
+
+    O caminho de ingestão (`registrar`) só guarda a referência do evento; a
+    gravação, em transações de até `batch_size` eventos, fica com `descarregar`
+    (chamado periodicamente pela thread de disco do detector) e `salvar`, sob um
+    lock de escrita próprio. Após uma restauração, os eventos que
+    ainda faltavam são relidos do buffer pelo `salvar`, em lotes, antes dos
+    registrados depois. Além da tabela de eventos, uma tabela de
+    contagens por hora e tipo é atualizada a cada lote, de modo que relatórios
+    agregados não precisam varrer milhões de linhas.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS eventos (
+            id          INTEGER PRIMARY KEY,
+            recebido_em REAL NOT NULL,
+            sensor      TEXT,
+            tipo        TEXT,
+            dados       TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_eventos_recebido ON eventos (recebido_em);
+        CREATE INDEX IF NOT EXISTS idx_eventos_sensor ON eventos (sensor, recebido_em);
+        CREATE INDEX IF NOT EXISTS idx_eventos_tipo ON eventos (tipo, recebido_em);
+        CREATE TABLE IF NOT EXISTS contagens_hora (
+            hora  INTEGER NOT NULL,
+            tipo  TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (hora, tipo)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, arquivo, date_format, batch_size=200):
+        self.arquivo = str(arquivo)
+        self.date_format = date_format
+        self.batch_size = batch_size
+        self._pendentes = []            # Eventos ainda não gravados
+        self.ultimo_seq_persistido = 0
+        self.descartados = 0            # Eventos sobrescritos no buffer antes de a retomada gravá-los
+        self._retomada = None           # (buffer, inicio, fim): eventos a reler do buffer antes dos pendentes
+        self._lock = threading.Lock()           # Pendentes (registrar x descarregar)
+        self._lock_escrita = threading.Lock()   # Conexão de escrita e retomada
+
+        self._conn = sqlite3.connect(self.arquivo, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        # Consultas numa conexão somente leitura própria: no modo WAL não esperam nem bloqueiam as gravações
+        # URI montada por Path.as_uri(): caminhos com espaço, "?" ou "#" não quebram o parâmetro mode=ro
+        uri = Path(self.arquivo).resolve().as_uri() + "?mode=ro"
+        self._leitura = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock_leitura = threading.Lock()
+
+    # ========== ESCRITA ==========
+    @staticmethod
+    def _linha(evento):
+        return (evento.recebido_em, evento.sensor, evento.tipo,
+                evento.bruto.decode("utf-8") if evento.bruto is not None else "null")
+
+    def registrar(self, evento):
+        """Guarda o evento para o próximo lote (`descarregar`/`salvar`), sem tocar no banco."""
+        with self._lock:
+            self._pendentes.append(evento)
+
+    def retomar_de(self, seq, buffer=None):
+        """Após restaurar o estado do detector: eventos até `seq` já estão no banco.
+
+        Os eventos do `buffer` posteriores a `seq` são relidos e gravados pelo próximo `salvar`.
+        """
+        with self._lock_escrita:
+            self.ultimo_seq_persistido = seq
+            if buffer is not None and buffer.ultimo_seq > seq:
+                self._retomada = (buffer, seq + 1, buffer.ultimo_seq)
+
+    def _retomar(self, limite=None):
+        """Relê do buffer e grava até `limite` eventos da retomada pendente (chamar com o lock de escrita)."""
+        fim = self._retomada[2]
+        eventos, perdidos, restante = _ler_retomada(self._retomada, limite)
+        gravados = self._inserir([self._linha(evento) for evento in eventos])
+        # Só avança depois do commit: uma transação que falhou é relida na próxima tentativa
+        self._retomada = restante
+        self.descartados += perdidos
+        self.ultimo_seq_persistido = fim if self._retomada is None else self._retomada[1] - 1
+        return gravados
+
+    def _gravar_lote(self):
+        """Conclui a retomada, se houver, e grava os eventos pendentes em transações de até `batch_size`.
+
+        Chamar com o lock de escrita. Se uma transação falhar, ela e as seguintes voltam para o início dos
+        pendentes (antes dos registrados nesse meio-tempo) e são regravadas no próximo lote.
+        """
+        gravados = self._retomar() if self._retomada is not None else 0
+        with self._lock:
+            lote, self._pendentes = self._pendentes, []
+        for inicio in range(0, len(lote), self.batch_size):
+            parte = lote[inicio:inicio + self.batch_size]
+            try:
+                gravados += self._inserir([self._linha(evento) for evento in parte])
+            except sqlite3.Error:
+                with self._lock:
+                    self._pendentes[:0] = lote[inicio:]
+                raise
+            self.ultimo_seq_persistido = parte[-1].seq
+        return gravados
+
+    def _inserir(self, lote):
+        """Insere as linhas e atualiza as contagens por hora numa transação (chamar com o lock de escrita)."""
+        if not lote:
+            return 0
+        contagens = {}
+        for recebido_em, _, tipo, _ in lote:
+            chave = (int(recebido_em // 3600) * 3600, tipo or "")
+            contagens[chave] = contagens.get(chave, 0) + 1
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO eventos (recebido_em, sensor, tipo, dados) VALUES (?, ?, ?, ?)", lote
+            )
+            self._conn.executemany(
+                "INSERT INTO contagens_hora (hora, tipo, total) VALUES (?, ?, ?) "
+                "ON CONFLICT (hora, tipo) DO UPDATE SET total = total + excluded.total",
+                [(hora, tipo, total) for (hora, tipo), total in contagens.items()],
+            )
+        return sum(len(linha[3]) for linha in lote)
+
+    def salvar(self, buffer=None):
+        """Grava o que estiver pendente (o buffer só é relido numa retomada). Retorna bytes gravados."""
+        gravados = 0
+        # Retomada em partes: cada transação é curta
+        while self._retomada is not None:
+            with self._lock_escrita:
+                if self._retomada is not None:
+                    gravados += self._retomar(self.batch_size)
+        return gravados + self.descarregar()
+
+    def descarregar(self):
+        """Grava os eventos pendentes (nada com retomada pendente). Retorna bytes gravados."""
+        with self._lock_escrita:
+            if self._retomada is not None:
+                return 0
+            return self._gravar_lote()
+
+    # ========== CONSULTAS ==========
+    def eventos_por_sensor(self, sensor, inicio, fim, limite=None):
+        """Eventos do sensor entre os instantes `inicio` e `fim` (epoch), em ordem de chegada."""
+        sql = ("SELECT recebido_em, sensor, tipo, dados FROM eventos "
+               "WHERE sensor = ? AND recebido_em BETWEEN ? AND ? ORDER BY recebido_em")
+        parametros = [sensor, inicio, fim]
+        if limite:
+            sql += " LIMIT ?"
+            parametros.append(limite)
+        with self._lock_leitura:
+            linhas = self._leitura.execute(sql, parametros).fetchall()
+        return [
+            {"recebido_em": recebido_em, "sensor": sensor, "tipo": tipo, "dados": json.loads(dados)}
+            for recebido_em, sensor, tipo, dados in linhas
+        ]
+
+    def contagem_por_tipo_por_hora(self, inicio, fim):
+        """Lista (hora, tipo, total) entre `inicio` e `fim` (epoch), a partir da tabela agregada."""
+        with self._lock_leitura:
+            return self._leitura.execute(
+                "SELECT hora, tipo, total FROM contagens_hora "
+                "WHERE hora BETWEEN ? AND ? ORDER BY hora, tipo",
+                (int(inicio // 3600) * 3600, fim),
+            ).fetchall()
+
+    def total_eventos(self):
+        with self._lock_leitura:
+            return self._leitura.execute("SELECT COUNT(*) FROM eventos").fetchone()[0]
+
+    def fechar(self):
+        with self._lock_escrita:
+            self._gravar_lote()
+            self._conn.close()
+        with self._lock_leitura:
+            self._leitura.close()
+
+
+def criar_persistencia(data_config, date_format):
+    """Cria o backend de persistência selecionado em DATA_CONFIG["storage_backend"]."""
+    backend = data_config.get("storage_backend", "json")
+    if backend == "json":
+        return PersistenciaJSON(data_config["data_file"], date_format)
+    if backend == "jsonl":
+        return PersistenciaJSONL(
+            data_config["segments_dir"],
+            date_format,
+            segment_max_bytes=data_config["segment_max_bytes"],
+            segment_max_age=data_config["segment_max_age"],
+            fsync_batch=data_config["fsync_batch"],
+            fsync_interval=data_config["fsync_interval"],
+            batch_size=data_config["segment_batch_size"],
+        )
+    if backend == "sqlite":
+        return PersistenciaSQLite(
+            data_config["sqlite_file"],
+            date_format,
+            batch_size=data_config["sqlite_batch_size"],
+        )
+    raise ValueError(f"Backend de persistência desconhecido: {backend}")
+
+
+if __name__ == "__main__":
+    # Uso: python persistencia.py <diretorio_segmentos> <destino.json> [limite]
+    if len(sys.argv) < 3:
+        print("Uso: python persistencia.py <diretorio_segmentos> <destino.json> [limite]")
+        sys.exit(1)
+    from config import UI_CONFIG
+
+    persistencia = PersistenciaJSONL(sys.argv[1], UI_CONFIG["date_format"])
+    limite = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    total = persistencia.exportar_json(sys.argv[2], limite)
+    print(f"✅ Exportados {total} bytes para {sys.argv[2]}")
@@ -0,0 +1,94 @@
+"""
+Reconexão ao broker e mensagens de saída enquanto offline.
+
+- BackoffExponencial: espera entre tentativas dobrando até um teto, com jitter
+  (cada detector sorteia um ponto do intervalo [teto * (1 - jitter), teto]).
+  Assim, quando o broker reinicia, uma frota de detectores não volta em
+  sincronia; não há limite de tentativas.
+- BufferSaida: mensagens produzidas localmente (alertas, estatísticas) ficam
+  guardadas enquanto não há conexão, em ordem e com capacidade limitada (as
+  mais antigas são descartadas e contadas), e são publicadas em bloco na
+  reconexão.
+"""
+
+import collections
+import random
+import threading
+
+
+class BackoffExponencial:
+    """Esperas base, base*fator, base*fator², ... limitadas a `maximo`, com jitter."""
+
+    def __init__(self, base=1.0, maximo=60.0, fator=2.0, jitter=0.5, aleatorio=random.random):
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter deve estar entre 0 e 1")
+        self.base = float(base)
+        self.maximo = float(maximo)
+        self.fator = float(fator)
+        self.jitter = float(jitter)
+        self._aleatorio = aleatorio
+        self.tentativas = 0
+
+    def teto(self):
+        """Espera máxima da próxima tentativa (sem jitter)."""
+        # Expoente limitado: evita overflow depois de muitas tentativas no teto
+        expoente = min(self.tentativas, 64)
+        return min(self.maximo, self.base * self.fator ** expoente)
+
+    def proximo(self):
+        """Conta uma tentativa e retorna quantos segundos esperar antes dela."""
+        teto = self.teto()
+        self.tentativas += 1
+        return teto * (1 - self.jitter * self._aleatorio())
+
+    def reiniciar(self):
+        self.tentativas = 0
+
+
+class BufferSaida:
+    """Fila limitada de publicações (topico, payload, qos, retain) pendentes."""
+
+    def __init__(self, capacidade=1000):
+        self._itens = collections.deque(maxlen=capacidade)
+        self._lock = threading.Lock()
+        self._descarregando = False
+        self.descartadas = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    def _guardar(self, item):
+        if len(self._itens) == self._itens.maxlen:
+            self.descartadas += 1
+        self._itens.append(item)
+
+    def publicar(self, item, enviar):
+        """Envia já se nada estiver pendente; senão (ou se `enviar` falhar) guarda. True se enviou."""
+        with self._lock:
+            # Com pendências (ou descarga em curso) a mensagem entra no fim da fila: preserva a ordem
+            if not self._itens and not self._descarregando and enviar(item):
+                return True
+            self._guardar(item)
+            return False
+
+    def descarregar(self, enviar):
+        """Envia os pendentes em ordem até esvaziar ou `enviar` falhar. Retorna quantos enviou."""
+        with self._lock:
+            if self._descarregando:
+                return 0
+            self._descarregando = True
+        enviadas = 0
+        while True:
+            with self._lock:
+                if not self._itens:
+                    self._descarregando = False
+                    return enviadas
+                item = self._itens.popleft()
+            if not enviar(item):
+                with self._lock:
+                    if len(self._itens) == self._itens.maxlen:
+                        self.descartadas += 1     # Devolver no início descarta a mais nova
+                    self._itens.appendleft(item)
+                    self._descarregando = False
+                return enviadas
+            enviadas += 1
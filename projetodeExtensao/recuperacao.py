@@ -0,0 +1,453 @@
+"""
+Snapshot binário + write-ahead log (WAL) do estado do detector.
+
+- WAL: cada lote processado anexa (seq, recebido_ns, payload original) a
+  wal_<geracao>.log, com CRC32 por registro. O flush ocorre a cada lote
+  (sobrevive à queda do processo); o fsync, em `sincronizar`, que o detector
+  chama periodicamente de fora do lock de estado (ou a cada `fsync_interval`
+  segundos dentro de `anexar`, se configurado).
+- Snapshot: snapshot_<geracao>.bin guarda o buffer de histórico em registros de
+  tamanho fixo (campos normalizados + payload JSON), seções binárias com os
+  índices grandes (estado por sensor, índice espacial, anomalias: colunas
+  `array` e tabelas de textos, sem passar por JSON) e um bloco JSON pequeno com
+  as janelas de taxa e contadores (os rollups ficam no próprio arquivo, que
+  registra até que seq contabilizou). Na inicialização o
+  arquivo é mapeado com mmap e os eventos são lidos sob demanda
+  (BufferEventos.restaurar), então o custo de abrir não depende da quantidade
+  de eventos retidos.
+
+Ao criar o snapshot N, o WAL passa para a geração N no mesmo instante (sob o
+lock de estado do detector, que só copia referências): o snapshot N mais o WAL N
+em diante reconstituem o estado. A serialização e o fsync do WAL anterior
+acontecem depois, fora do lock. Gerações anteriores só são apagadas depois que o snapshot N estiver no
+disco; um snapshot incompleto nunca recebe o nome final (tmp + rename).
+
+Layout do snapshot (little-endian; seções na ordem nativa de bytes de `array`):
+    cabeçalho | payloads JSON | registros (REGISTRO * n) | seções | metadados JSON | FIM
+Os metadados indicam onde começa cada seção ("secoes": {nome: [offset, tamanho]}).
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+from pathlib import Path
+
+from eventos import EventoColisao
+
+MAGICO_SNAPSHOT = b"DCSNAP01"
+MAGICO_FIM = b"DCSNAPOK"
+MAGICO_WAL = b"DCWAL001"
+VERSAO = 1
+
+# magico, versao, geracao, criado_em, primeiro_seq, ultimo_seq, off_dados, off_registros, off_meta, tam_meta
+CABECALHO = struct.Struct("<8sIIdqqQQQQ")
+# seq, recebido_em, enviado_em, intensidade, velocidade, distancia, x, y, colisao_id,
+# sensor, tipo, local (índices na tabela de textos), off_dados, tam_dados
+REGISTRO = struct.Struct("<qdddddddqiiiQI")
+# tamanho do payload, crc32, seq, recebido_ns
+REGISTRO_WAL = struct.Struct("<IIqq")
+
+SEM_ID = -(2 ** 63)                 # colisao_id ausente (ou fora de 64 bits)
+NAN = float("nan")
+
+_ARQUIVO_SNAPSHOT = re.compile(r"^snapshot_(\d{8})\.bin$")
+_ARQUIVO_WAL = re.compile(r"^wal_(\d{8})\.log$")
+
+
+def _real(valor):
+    return NAN if valor is None else float(valor)
+
+
+def _opcional(valor):
+    return None if valor != valor else valor   # NaN -> None
+
+
+def _fsync_diretorio(diretorio):
+    """Garante o rename no disco (não suportado no Windows, onde é ignorado)."""
+    try:
+        fd = os.open(diretorio, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# ========== SEÇÕES BINÁRIAS ==========
+def empacotar_partes(partes):
+    """Junta blocos de bytes em um só: quantidade, tamanhos (uint64) e os blocos, nessa ordem."""
+    tamanhos = array("Q", [len(parte) for parte in partes])
+    return b"".join([struct.pack("<I", len(partes)), tamanhos.tobytes(), *partes])
+
+
+def desempacotar_partes(dados):
+    """Inverso de empacotar_partes: lista de memoryviews sobre `dados` (sem cópia)."""
+    dados = memoryview(dados)
+    (quantidade,) = struct.unpack_from("<I", dados, 0)
+    tamanhos = array("Q")
+    tamanhos.frombytes(dados[4:4 + quantidade * tamanhos.itemsize])
+    posicao = 4 + quantidade * tamanhos.itemsize
+    partes = []
+    for tamanho in tamanhos:
+        partes.append(dados[posicao:posicao + tamanho])
+        posicao += tamanho
+    return partes
+
+
+def empacotar_textos(textos):
+    """Lista de str/None em bytes: índices int32 (-1 = None) numa tabela de textos únicos + a tabela."""
+    tabela, posicoes = [], {}
+    indices = array("i")
+    for texto in textos:
+        if texto is None:
+            indices.append(-1)
+            continue
+        posicao = posicoes.get(texto)
+        if posicao is None:
+            posicao = posicoes[texto] = len(tabela)
+            tabela.append(texto.encode("utf-8", "surrogatepass"))
+        indices.append(posicao)
+    return empacotar_partes([indices.tobytes(), array("I", [len(t) for t in tabela]).tobytes(), b"".join(tabela)])
+
+
+def desempacotar_textos(dados):
+    """Inverso de empacotar_textos."""
+    parte_indices, parte_tamanhos, conteudo = desempacotar_partes(dados)
+    indices, tamanhos = array("i"), array("I")
+    indices.frombytes(parte_indices)
+    tamanhos.frombytes(parte_tamanhos)
+    conteudo = bytes(conteudo)
+    tabela, posicao = [], 0
+    for tamanho in tamanhos:
+        tabela.append(conteudo[posicao:posicao + tamanho].decode("utf-8", "surrogatepass"))
+        posicao += tamanho
+    return [None if indice < 0 else tabela[indice] for indice in indices]
+
+
+def ler_coluna(tipo, dados):
+    """array(`tipo`) com o conteúdo de um bloco de bytes."""
+    valores = array(tipo)
+    valores.frombytes(dados)
+    return valores
+
+
+# ========== SNAPSHOT ==========
+class SnapshotInvalido(ValueError):
+    """Arquivo de snapshot truncado, corrompido ou de outra versão."""
+
+
+class SnapshotMapeado:
+    """Snapshot aberto via mmap; `obter(seq)` recria o EventoColisao sob demanda."""
+
+    def __init__(self, caminho):
+        self.caminho = Path(caminho)
+        with open(self.caminho, "rb") as f:
+            tamanho = os.fstat(f.fileno()).st_size
+            if tamanho < CABECALHO.size + len(MAGICO_FIM):
+                raise SnapshotInvalido(f"{self.caminho.name}: arquivo truncado")
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magico, versao, self.geracao, self.criado_em, self.primeiro_seq, self.ultimo_seq,
+         self._off_dados, self._off_registros, off_meta, tam_meta) = CABECALHO.unpack_from(self._mapa, 0)
+        if magico != MAGICO_SNAPSHOT or versao != VERSAO:
+            raise SnapshotInvalido(f"{self.caminho.name}: formato desconhecido")
+        if self._mapa[-len(MAGICO_FIM):] != MAGICO_FIM or off_meta + tam_meta + len(MAGICO_FIM) != tamanho:
+            raise SnapshotInvalido(f"{self.caminho.name}: arquivo incompleto")
+        self.meta = json.loads(self._mapa[off_meta:off_meta + tam_meta])
+        self._textos = self.meta.pop("textos")
+        self._secoes = self.meta.pop("secoes", {})
+
+    def __len__(self):
+        return max(0, self.ultimo_seq - self.primeiro_seq + 1)
+
+    def registro(self, seq):
+        """Campos brutos do registro (REGISTRO) e os bytes do payload."""
+        campos = REGISTRO.unpack_from(self._mapa, self._off_registros + (seq - self.primeiro_seq) * REGISTRO.size)
+        inicio = self._off_dados + campos[12]
+        return campos, self._mapa[inicio:inicio + campos[13]]
+
+    def texto(self, indice):
+        return None if indice < 0 else self._textos[indice]
+
+    def secao(self, nome):
+        """Bytes da seção binária `nome` (ou None se o snapshot não a tiver)."""
+        posicao = self._secoes.get(nome)
+        if posicao is None:
+            return None
+        inicio, tamanho = posicao
+        return self._mapa[inicio:inicio + tamanho]
+
+    def obter(self, seq):
+        if not self.primeiro_seq <= seq <= self.ultimo_seq:
+            return None
+        (seq, recebido_em, enviado_em, intensidade, velocidade, distancia, x, y, colisao_id,
+         sensor, tipo, local, _, _), dados = self.registro(seq)
+        return EventoColisao(
+            recebido_em,
+            sensor=self.texto(sensor),
+            tipo=self.texto(tipo),
+            bruto=dados,
+            seq=seq,
+            colisao_id=None if colisao_id == SEM_ID else colisao_id,
+            enviado_em=_opcional(enviado_em),
+            intensidade=_opcional(intensidade),
+            velocidade=_opcional(velocidade),
+            distancia=_opcional(distancia),
+            x=_opcional(x),
+            y=_opcional(y),
+            local=self.texto(local),
+        )
+
+
+def gravar_snapshot(caminho, geracao, captura, meta, secoes=None):
+    """Grava o snapshot de uma captura do buffer (BufferEventos.capturar()). Retorna bytes gravados.
+
+    Slots já sobrescritos na captura são copiados da base (snapshot anterior) sem decodificar o JSON.
+    `secoes` ({nome: bytes}) são gravadas como estão e lidas com SnapshotMapeado.secao(nome).
+    """
+    primeiro, ultimo, itens, base = captura
+    capacidade = len(itens)
+    caminho = Path(caminho)
+    tmp = caminho.with_name(caminho.name + ".tmp")
+    textos, indices = [], {}
+
+    def indice(texto):
+        if texto is None:
+            return -1
+        posicao = indices.get(texto)
+        if posicao is None:
+            posicao = indices[texto] = len(textos)
+            textos.append(texto)
+        return posicao
+
+    quantidade = max(0, ultimo - primeiro + 1)
+    registros = bytearray(quantidade * REGISTRO.size)
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * CABECALHO.size)
+        off_dados = f.tell()
+        posicao_dados = 0
+        for i, seq in enumerate(range(primeiro, ultimo + 1)):
+            evento = itens[seq % capacidade]
+            if evento is not None and evento.seq == seq:
+                dados = evento.bruto or b"null"
+                colisao_id = evento.colisao_id
+                if colisao_id is None or not -(2 ** 63) < colisao_id < 2 ** 63:
+                    colisao_id = SEM_ID
+                campos = (
+                    seq, evento.recebido_em, _real(evento.enviado_em), _real(evento.intensidade),
+                    _real(evento.velocidade), _real(evento.distancia), _real(evento.x), _real(evento.y),
+                    colisao_id, indice(evento.sensor), indice(evento.tipo), indice(evento.local),
+                )
+            elif base is not None and base.primeiro_seq <= seq <= base.ultimo_seq:
+                antigos, dados = base.registro(seq)
+                campos = antigos[:9] + (indice(base.texto(antigos[9])), indice(base.texto(antigos[10])),
+                                        indice(base.texto(antigos[11])))
+            else:
+                raise ValueError(f"Sequência {seq} ausente do buffer e da base")
+            REGISTRO.pack_into(registros, i * REGISTRO.size, *campos, posicao_dados, len(dados))
+            f.write(dados)
+            posicao_dados += len(dados)
+        off_registros = f.tell()
+        f.write(registros)
+        posicoes = {}
+        for nome, conteudo in (secoes or {}).items():
+            posicoes[nome] = [f.tell(), len(conteudo)]
+            f.write(conteudo)
+        off_meta = f.tell()
+        conteudo_meta = json.dumps({**meta, "textos": textos, "secoes": posicoes},
+                                   ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        f.write(conteudo_meta)
+        f.write(MAGICO_FIM)
+        total = f.tell()
+        f.seek(0)
+        f.write(CABECALHO.pack(MAGICO_SNAPSHOT, VERSAO, geracao, time.time(), primeiro, ultimo,
+                               off_dados, off_registros, off_meta, len(conteudo_meta)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, caminho)
+    _fsync_diretorio(caminho.parent)
+    return total
+
+
+# ========== WAL ==========
+def ler_wal(caminho, acima_de=0):
+    """Itera (seq, recebido_ns, payload) de um arquivo de WAL; para no primeiro registro truncado/corrompido."""
+    with open(caminho, "rb") as f:
+        if f.read(len(MAGICO_WAL)) != MAGICO_WAL:
+            return
+        while True:
+            cabecalho = f.read(REGISTRO_WAL.size)
+            if len(cabecalho) < REGISTRO_WAL.size:
+                return
+            tamanho, crc, seq, recebido_ns = REGISTRO_WAL.unpack(cabecalho)
+            payload = f.read(tamanho)
+            if len(payload) < tamanho or zlib.crc32(payload, zlib.crc32(cabecalho[8:])) != crc:
+                return
+            if seq > acima_de:
+                yield seq, recebido_ns, payload
+
+
+class GerenciadorRecuperacao:
+    """Arquivos de snapshot e WAL de um detector (um diretório por instância).
+
+    Com `fsync_interval=None`, `anexar` nunca faz fsync: fica a cargo de quem chama `sincronizar`.
+    """
+
+    def __init__(self, diretorio, fsync_interval=1.0):
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.fsync_interval = fsync_interval
+        self.geracao = 0
+        self.bytes_wal = 0
+        self._arquivo = None
+        self._anteriores = []           # WALs rotacionados, fechados (com fsync) por gravar_snapshot
+        self._sujo = False
+        self._ultimo_fsync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _geracoes(self, padrao):
+        encontradas = []
+        for arquivo in self.diretorio.iterdir():
+            correspondencia = padrao.match(arquivo.name)
+            if correspondencia:
+                encontradas.append((int(correspondencia.group(1)), arquivo))
+        return sorted(encontradas)
+
+    def _caminho_snapshot(self, geracao):
+        return self.diretorio / f"snapshot_{geracao:08d}.bin"
+
+    def _caminho_wal(self, geracao):
+        return self.diretorio / f"wal_{geracao:08d}.log"
+
+    # ========== RECUPERAÇÃO ==========
+    def abrir_snapshot(self, avisar=None):
+        """Snapshot válido mais recente (ou None). Arquivos inválidos são pulados."""
+        for _, arquivo in reversed(self._geracoes(_ARQUIVO_SNAPSHOT)):
+            try:
+                return SnapshotMapeado(arquivo)
+            except (OSError, ValueError) as e:
+                if avisar:
+                    avisar(f"Snapshot ignorado ({e})")
+        return None
+
+    def registros_wal(self, desde_geracao=0, acima_de=0):
+        """Itera (seq, recebido_ns, payload) dos WALs da geração informada em diante, em ordem."""
+        for geracao, arquivo in self._geracoes(_ARQUIVO_WAL):
+            if geracao >= desde_geracao:
+                yield from ler_wal(arquivo, acima_de)
+
+    def iniciar(self):
+        """Abre o WAL de uma geração nova (maior que qualquer arquivo existente)."""
+        existentes = [g for g, _ in self._geracoes(_ARQUIVO_SNAPSHOT) + self._geracoes(_ARQUIVO_WAL)]
+        with self._lock:
+            self._abrir_wal(max(existentes, default=0) + 1)
+
+    # ========== WAL ==========
+    def _abrir_wal(self, geracao):
+        """Fecha o WAL atual e abre o da geração informada (chamar com o lock)."""
+        self._fechar_wal()
+        self.geracao = geracao
+        self._arquivo = open(self._caminho_wal(geracao), "ab", buffering=1024 * 1024)
+        if self._arquivo.tell() == 0:
+            self._arquivo.write(MAGICO_WAL)
+        self._sujo = True
+
+    def _fechar_wal(self):
+        if self._arquivo is not None:
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self._arquivo.close()
+            self._arquivo = None
+
+    def anexar(self, registros):
+        """Grava um lote de (seq, recebido_ns, payload) e descarrega no SO. Retorna bytes gravados."""
+        partes = []
+        for seq, recebido_ns, payload in registros:
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            cauda = struct.pack("<qq", seq, recebido_ns)
+            crc = zlib.crc32(payload, zlib.crc32(cauda))
+            partes.append(struct.pack("<II", len(payload), crc) + cauda)
+            partes.append(payload)
+        conteudo = b"".join(partes)
+        with self._lock:
+            if self._arquivo is None:
+                return 0
+            self._arquivo.write(conteudo)
+            self._arquivo.flush()
+            self._sujo = True
+            if self.fsync_interval is not None and time.monotonic() - self._ultimo_fsync >= self.fsync_interval:
+                self._sincronizar()
+        self.bytes_wal += len(conteudo)
+        return len(conteudo)
+
+    def _sincronizar(self):
+        if self._arquivo is not None and self._sujo:
+            os.fsync(self._arquivo.fileno())
+            self._sujo = False
+        self._ultimo_fsync = time.monotonic()
+
+    def sincronizar(self):
+        """fsync do WAL; o lock só cobre o flush, então `anexar` não espera o disco."""
+        with self._lock:
+            if self._arquivo is None or not self._sujo:
+                self._ultimo_fsync = time.monotonic()
+                return
+            self._arquivo.flush()
+            # Descritor duplicado: continua válido mesmo se o WAL for rotacionado durante o fsync
+            descritor = os.dup(self._arquivo.fileno())
+            self._sujo = False
+            self._ultimo_fsync = time.monotonic()
+        try:
+            os.fsync(descritor)
+        finally:
+            os.close(descritor)
+
+    # ========== SNAPSHOT ==========
+    def rotacionar(self):
+        """Passa o WAL para a próxima geração; retorna-a (use-a no snapshot capturado neste instante).
+
+        O WAL anterior só é descarregado e fechado por `gravar_snapshot`, fora do lock de estado.
+        """
+        with self._lock:
+            if self._arquivo is not None:
+                self._arquivo.flush()
+                self._anteriores.append(self._arquivo)
+                self._arquivo = None
+            self._abrir_wal(self.geracao + 1)
+            return self.geracao
+
+    def _fechar_anteriores(self):
+        with self._lock:
+            anteriores, self._anteriores = self._anteriores, []
+        for arquivo in anteriores:
+            os.fsync(arquivo.fileno())
+            arquivo.close()
+
+    def gravar_snapshot(self, geracao, captura, meta, secoes=None):
+        """Grava o snapshot da geração, abre-o via mmap e apaga as gerações anteriores. Retorna (snapshot, bytes)."""
+        self._fechar_anteriores()
+        caminho = self._caminho_snapshot(geracao)
+        gravados = gravar_snapshot(caminho, geracao, captura, meta, secoes)
+        snapshot = SnapshotMapeado(caminho)
+        for padrao in (_ARQUIVO_SNAPSHOT, _ARQUIVO_WAL):
+            for antiga, arquivo in self._geracoes(padrao):
+                if antiga < geracao:
+                    try:
+                        arquivo.unlink()
+                    except OSError:
+                        pass    # Ainda mapeado (Windows): removido no próximo snapshot
+        return snapshot, gravados
+
+    def fechar(self):
+        self._fechar_anteriores()
+        with self._lock:
+            self._fechar_wal()
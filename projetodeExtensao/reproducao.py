@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Reprodução (replay) de históricos e logs gravados pelo pipeline do detector.
+
+Lê as capturas em streaming (nunca carrega o arquivo inteiro) e reinjeta os
+eventos respeitando os intervalos originais, com fator de velocidade (1x,
+10x, ... ou "max" para o mais rápido possível). Fontes aceitas:
+- JSON: historico_colisoes.json / historico_simulacao.json ({"historico": [...]})
+  e o snapshot do detector ([{"timestamp", "dados"}])
+- JSONL: segmentos da persistência (arquivo .jsonl ou diretório com manifest.json)
+- Log: linhas "Colisão #N detectada: ..." do logs/colisao.log (UTF-8 ou cp1252)
+
+Uso:
+    python reproducao.py historico_simulacao.json --velocidade 10
+    python reproducao.py data/segmentos logs/colisao.log --velocidade max
+    python reproducao.py historico_colisoes.json --destino mqtt --broker localhost
+
+No destino local, histórico, agregados, segmentos, banco e log do detector vão
+para um diretório próprio (--saida; por padrão, um diretório temporário novo) e
+a recuperação (snapshot + WAL) fica desligada: a reprodução nunca toca nos
+arquivos de produção.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from config import DATA_CONFIG, MQTT_CONFIG, UI_CONFIG
+
+TAMANHO_BLOCO = 64 * 1024
+
+# 2025-10-21 13:40:10,964 - __main__ - INFO - Colisão #1 detectada: <mensagem>
+_LINHA_LOG = re.compile(
+    r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) - \S+ - \w+ - Colis\S* #(\d+) detectada:?\s*(.*)$"
+)
+_SENSOR_MENSAGEM = re.compile(r"\b(?:no|pelo)\s+(?:sensor\s+)?(\w+)\s*$")
+
+
+# ========== LEITORES (streaming) ==========
+def _itens_array_json(caminho, chave="historico"):
+    """Itera os itens do array JSON de topo (ou de `chave`, se o topo for objeto) lendo em blocos."""
+    decoder = json.JSONDecoder()
+    with open(caminho, "r", encoding="utf-8") as f:
+        buffer, pos, eof = "", 0, False
+
+        def ler():
+            nonlocal buffer, pos, eof
+            bloco = f.read(TAMANHO_BLOCO)
+            eof = not bloco
+            buffer, pos = buffer[pos:] + bloco, 0
+
+        def pular_espacos():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                ler()
+
+        # Localiza o início do array
+        ler()
+        pular_espacos()
+        if buffer[pos:pos + 1] == "{":
+            marcador = re.compile(r'"%s"\s*:\s*\[' % re.escape(chave))
+            while True:
+                encontrado = marcador.search(buffer, pos)
+                if encontrado:
+                    pos = encontrado.end()
+                    break
+                if eof:
+                    return
+                # Mantém o fim do buffer (o marcador pode estar dividido entre blocos)
+                pos = max(pos, len(buffer) - 64)
+                ler()
+        elif buffer[pos:pos + 1] == "[":
+            pos += 1
+        else:
+            raise ValueError(f"{caminho}: esperado array JSON ou objeto com '{chave}'")
+
+        while True:
+            pular_espacos()
+            if pos >= len(buffer) or buffer[pos] == "]":
+                return
+            try:
+                item, fim = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                ler()                   # Item incompleto: lê mais um bloco
+                continue
+            pos = fim
+            yield item
+
+
+def _instante_iso_ou_epoch(valor):
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return float(valor)
+    if isinstance(valor, str):
+        try:
+            return datetime.fromisoformat(valor.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def ler_json(caminho, date_format=UI_CONFIG["date_format"]):
+    """(instante, dados) de um histórico JSON ({"historico": [...]} ou snapshot [{"timestamp", "dados"}])."""
+    for item in _itens_array_json(caminho):
+        if not isinstance(item, dict):
+            continue
+        if "dados" in item and isinstance(item["dados"], dict):
+            # Snapshot do detector: timestamp de recebimento no formato da interface
+            dados = item["dados"]
+            try:
+                instante = datetime.strptime(item["timestamp"], date_format).timestamp()
+            except (KeyError, TypeError, ValueError):
+                instante = _instante_iso_ou_epoch(dados.get("timestamp"))
+        else:
+            dados = item
+            instante = _instante_iso_ou_epoch(item.get("timestamp"))
+        if instante is not None:
+            yield instante, dados
+
+
+def ler_jsonl(caminho):
+    """(recebido_em, dados) de um segmento .jsonl ou de um diretório de segmentos (ordem do manifesto)."""
+    caminho = Path(caminho)
+    if caminho.is_dir():
+        manifesto = caminho / "manifest.json"
+        if manifesto.exists():
+            with open(manifesto, "r", encoding="utf-8") as f:
+                arquivos = [caminho / s["arquivo"] for s in json.load(f)["segmentos"]]
+        else:
+            arquivos = sorted(caminho.glob("*.jsonl"))
+    else:
+        arquivos = [caminho]
+    for arquivo in arquivos:
+        if not arquivo.exists():
+            continue
+        with open(arquivo, "r", encoding="utf-8") as f:
+            for linha in f:
+                if linha.strip():
+                    registro = json.loads(linha)
+                    yield registro["recebido_em"], registro["dados"]
+
+
+def _decodificar_linha(linha):
+    """Logs antigos foram gravados em cp1252/latin-1; os atuais em UTF-8."""
+    try:
+        return linha.decode("utf-8")
+    except UnicodeDecodeError:
+        return linha.decode("cp1252", errors="replace")
+
+
+def ler_log(caminho):
+    """(instante, dados) das linhas de colisão do log do detector."""
+    with open(caminho, "rb") as f:
+        for bruta in f:
+            encontrado = _LINHA_LOG.match(_decodificar_linha(bruta).rstrip("\r\n"))
+            if not encontrado:
+                continue
+            data, ms, numero, mensagem = encontrado.groups()
+            instante = datetime.strptime(data, "%Y-%m-%d %H:%M:%S").timestamp() + int(ms) / 1000
+            dados = {"tipo": "colisao", "colisao_id": int(numero), "mensagem": mensagem, "timestamp": instante}
+            sensor = _SENSOR_MENSAGEM.search(mensagem)
+            if sensor:
+                dados["sensor_id"] = sensor.group(1)
+            yield instante, dados
+
+
+def detectar_formato(caminho):
+    caminho = Path(caminho)
+    if caminho.is_dir() or caminho.suffix == ".jsonl":
+        return "jsonl"
+    if caminho.suffix == ".log" or ".log." in caminho.name:
+        return "log"
+    return "json"
+
+
+def abrir_fontes(caminhos, formato="auto"):
+    """Itera (instante, dados) de todas as fontes, intercaladas por instante (heapq.merge)."""
+    leitores = {"json": ler_json, "jsonl": ler_jsonl, "log": ler_log}
+    fontes = [leitores[detectar_formato(c) if formato == "auto" else formato](c) for c in caminhos]
+    if len(fontes) == 1:
+        return fontes[0]
+    return heapq.merge(*fontes, key=lambda registro: registro[0])
+
+
+# ========== REPRODUÇÃO ==========
+class Reprodutor:
+    """Reinjeta eventos respeitando os intervalos originais divididos por `velocidade`.
+
+    `velocidade=None` reproduz o mais rápido possível. `max_intervalo` limita as
+    pausas longas da captura (em segundos do tempo original).
+    """
+
+    def __init__(self, eventos, enviar, velocidade=1.0, max_intervalo=None):
+        self.eventos = eventos
+        self.enviar = enviar
+        self.velocidade = velocidade
+        self.max_intervalo = max_intervalo
+        self.enviados = 0
+        self.falhas = 0
+        self._parar = threading.Event()
+
+    def parar(self):
+        self._parar.set()
+
+    def executar(self):
+        """Reproduz até o fim das fontes (ou `parar()`). Retorna o resumo."""
+        inicio_real = time.monotonic()
+        relogio_captura = None      # Tempo "de captura" decorrido (com pausas limitadas)
+        anterior = None
+        for instante, dados in self.eventos:
+            if self._parar.is_set():
+                break
+            if anterior is None:
+                relogio_captura = 0.0
+            else:
+                intervalo = max(0.0, instante - anterior)
+                if self.max_intervalo is not None:
+                    intervalo = min(intervalo, self.max_intervalo)
+                relogio_captura += intervalo
+            anterior = instante if anterior is None else max(anterior, instante)
+
+            if self.velocidade:
+                espera = inicio_real + relogio_captura / self.velocidade - time.monotonic()
+                if espera > 0 and self._parar.wait(espera):
+                    break
+            payload = json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            if self.enviar(payload):
+                self.enviados += 1
+            else:
+                self.falhas += 1
+
+        decorrido = time.monotonic() - inicio_real
+        return {
+            "enviados": self.enviados,
+            "falhas": self.falhas,
+            "duracao_s": round(decorrido, 3),
+            "duracao_captura_s": round(relogio_captura or 0.0, 3),
+            "taxa_por_s": round(self.enviados / decorrido, 1) if decorrido else 0.0,
+        }
+
+
+def _velocidade(texto):
+    if texto.lower() in ("max", "inf", "0"):
+        return None
+    return float(texto.rstrip("xX"))
+
+
+def _reproduzir_local(args, eventos):
+    """Detector neste processo (transporte loopback): reprodução pela fila de ingestão."""
+    os.environ.setdefault("MQTT_TRANSPORT", "loopback")
+    # Arquivos próprios da reprodução; sem recuperação (não restaura nem grava o estado de produção)
+    saida = Path(args.saida or tempfile.mkdtemp(prefix="reproducao_"))
+    saida.mkdir(parents=True, exist_ok=True)
+    os.environ.update(
+        DATA_FILE=str(saida / "historico_colisoes.json"), SEGMENTS_DIR=str(saida / "segmentos"),
+        SQLITE_FILE=str(saida / "colisoes.db"), ROLLUPS_FILE=str(saida / "rollups.json"),
+        RECOVERY_DIR=str(saida / "recuperacao"), LOG_FILE=str(saida / "colisao.log"),
+    )
+    DATA_CONFIG.update(recovery=False)
+    print(f"📁 Arquivos da reprodução em {saida}")
+    from detector_colisao import DetectorColisao
+
+    detector = DetectorColisao()
+    executor = threading.Thread(target=detector.run, name="detector", daemon=True)
+    executor.start()
+    # No modo "max" a fila cheia faz a reprodução esperar (sem descartar)
+    bloquear = args.velocidade is None
+    reprodutor = Reprodutor(
+        eventos, lambda payload: detector.injetar(payload, bloquear=bloquear), args.velocidade, args.max_intervalo
+    )
+    try:
+        resumo = reprodutor.executar()
+    except KeyboardInterrupt:
+        reprodutor.parar()
+        resumo = {"enviados": reprodutor.enviados, "falhas": reprodutor.falhas}
+    # _cleanup espera os workers esvaziarem a fila antes do último salvamento
+    detector._stop_event.set()
+    executor.join(timeout=30)
+    resumo["detector"] = detector.get_estatisticas()
+    resumo["saida"] = str(saida)
+    return resumo
+
+
+def _reproduzir_mqtt(args, eventos):
+    """Publica os eventos num broker MQTT (detectores remotos)."""
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="reproducao_colisoes")
+    client.max_inflight_messages_set(1000)
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    def publicar(payload):
+        return client.publish(args.topic, payload, qos=args.qos).rc == mqtt.MQTT_ERR_SUCCESS
+
+    reprodutor = Reprodutor(eventos, publicar, args.velocidade, args.max_intervalo)
+    try:
+        return reprodutor.executar()
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz históricos/logs gravados pelo pipeline do detector")
+    parser.add_argument("arquivos", nargs="+", help="JSON, JSONL (arquivo ou diretório de segmentos) ou log")
+    parser.add_argument("--formato", choices=("auto", "json", "jsonl", "log"), default="auto")
+    parser.add_argument("--velocidade", type=_velocidade, default=1.0, help="fator (1, 10, 100...) ou 'max'")
+    parser.add_argument("--max-intervalo", type=float, default=None,
+                        help="limita pausas da captura a X segundos (tempo original)")
+    parser.add_argument("--destino", choices=("local", "mqtt"), default="local",
+                        help="local: detector neste processo; mqtt: publica no broker")
+    parser.add_argument("--saida", default=None,
+                        help="diretório dos arquivos do detector local (padrão: diretório temporário novo)")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--topic", default=MQTT_CONFIG["topic"])
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=1)
+    args = parser.parse_args()
+
+    eventos = abrir_fontes(args.arquivos, args.formato)
+    velocidade = "máxima" if args.velocidade is None else f"{args.velocidade:g}x"
+    print(f"⏯️  Reproduzindo {', '.join(args.arquivos)} (velocidade {velocidade}, destino {args.destino})")
+    resumo = (_reproduzir_local if args.destino == "local" else _reproduzir_mqtt)(args, eventos)
+    print("=" * 60)
+    print(json.dumps(resumo, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Agregados de colisões por minuto, hora e dia (rollups).
+
+Cada evento atualiza incrementalmente um balde por resolução; consultas como
+"hora de pico dos últimos 30 dias" percorrem algumas centenas de baldes em vez
+do histórico completo.
+
+O arquivo é append-only (uma linha JSON por balde, em listas posicionais): cada
+salvamento anexa só os baldes alterados desde o anterior, seguidos de uma linha
+["fim", {...}] que confirma o grupo (um grupo sem ela, de uma gravação
+interrompida, é ignorado na leitura) e registra o último seq contabilizado, de
+onde a recuperação retoma. Baldes repetidos valem pela última linha.
+Quando o arquivo acumula linhas demais em relação aos baldes vivos, ele é
+reescrito por inteiro (compactação atômica). O formato antigo (um único objeto
+JSON) ainda é lido e convertido no primeiro salvamento.
+"""
+
+import heapq
+import json
+import os
+import threading
+from pathlib import Path
+
+from persistencia import _gravar_atomico
+
+# Resolução (segundos) de cada nível de agregação
+RESOLUCOES = {"minuto": 60, "hora": 3600, "dia": 86400}
+
+# Quantidade de baldes mantidos por nível (1 dia de minutos, 90 dias de horas, 10 anos de dias)
+RETENCAO_PADRAO = {"minuto": 1440, "hora": 2160, "dia": 3650}
+
+# Sensores com contagem própria em cada balde (os menos ativos são podados em bloco)
+MAX_SENSORES_PADRAO = 100
+
+_VERSAO_ARQUIVO = 1
+
+
+class Medida:
+    """Soma, quantidade, mínimo e máximo de uma grandeza numérica."""
+
+    __slots__ = ("soma", "n", "minimo", "maximo")
+
+    def __init__(self, soma=0.0, n=0, minimo=None, maximo=None):
+        self.soma = soma
+        self.n = n
+        self.minimo = minimo
+        self.maximo = maximo
+
+    def registrar(self, valor):
+        self.soma += valor
+        self.n += 1
+        if self.minimo is None or valor < self.minimo:
+            self.minimo = valor
+        if self.maximo is None or valor > self.maximo:
+            self.maximo = valor
+
+    def combinar(self, outra):
+        self.soma += outra.soma
+        self.n += outra.n
+        if outra.minimo is not None and (self.minimo is None or outra.minimo < self.minimo):
+            self.minimo = outra.minimo
+        if outra.maximo is not None and (self.maximo is None or outra.maximo > self.maximo):
+            self.maximo = outra.maximo
+
+    @property
+    def media(self):
+        return self.soma / self.n if self.n else None
+
+    def para_lista(self):
+        return [self.soma, self.n, self.minimo, self.maximo]
+
+    def para_dict(self):
+        return {"media": self.media, "minimo": self.minimo, "maximo": self.maximo, "n": self.n}
+
+
+class Balde:
+    """Agregado de um intervalo [inicio, inicio + resolução).
+
+    `por_sensor` é limitado: ao passar de 2 * `max_sensores` sensores, ficam só os
+    `max_sensores` mais ativos (custo amortizado O(1) por evento). As contagens dos
+    mais ativos são exatas desde a última poda em que sobreviveram; `contagem`
+    continua contando todos.
+    """
+
+    __slots__ = ("inicio", "contagem", "por_sensor", "por_tipo", "intensidade", "velocidade", "intervalo",
+                 "max_sensores")
+
+    def __init__(self, inicio, max_sensores=MAX_SENSORES_PADRAO):
+        self.inicio = inicio
+        self.contagem = 0
+        self.por_sensor = {}
+        self.por_tipo = {}
+        self.intensidade = Medida()
+        self.velocidade = Medida()
+        self.intervalo = Medida()       # Tempo desde a colisão anterior (segundos)
+        self.max_sensores = max_sensores
+
+    def registrar(self, sensor, tipo, intensidade, velocidade, intervalo):
+        self.contagem += 1
+        if sensor is not None:
+            self.por_sensor[sensor] = self.por_sensor.get(sensor, 0) + 1
+            if len(self.por_sensor) > 2 * self.max_sensores:
+                self._podar_sensores()
+        if tipo is not None:
+            self.por_tipo[tipo] = self.por_tipo.get(tipo, 0) + 1
+        if intensidade is not None:
+            self.intensidade.registrar(intensidade)
+        if velocidade is not None:
+            self.velocidade.registrar(velocidade)
+        if intervalo is not None:
+            self.intervalo.registrar(intervalo)
+
+    def combinar(self, outro):
+        self.contagem += outro.contagem
+        for chave, n in outro.por_sensor.items():
+            self.por_sensor[chave] = self.por_sensor.get(chave, 0) + n
+        for chave, n in outro.por_tipo.items():
+            self.por_tipo[chave] = self.por_tipo.get(chave, 0) + n
+        self.intensidade.combinar(outro.intensidade)
+        self.velocidade.combinar(outro.velocidade)
+        self.intervalo.combinar(outro.intervalo)
+
+    def _podar_sensores(self):
+        mais_ativos = heapq.nlargest(self.max_sensores, self.por_sensor.items(), key=lambda par: par[1])
+        self.por_sensor = dict(mais_ativos)
+
+    def para_lista(self):
+        """Forma compacta usada no arquivo: [inicio, contagem, sensores, tipos, intensidade, velocidade, intervalo]."""
+        return [
+            self.inicio, self.contagem, self.por_sensor, self.por_tipo,
+            self.intensidade.para_lista(), self.velocidade.para_lista(), self.intervalo.para_lista(),
+        ]
+
+    @classmethod
+    def de_lista(cls, dados, max_sensores=MAX_SENSORES_PADRAO):
+        balde = cls(dados[0], max_sensores)
+        balde.contagem = dados[1]
+        balde.por_sensor = dict(dados[2])
+        if len(balde.por_sensor) > 2 * max_sensores:
+            balde._podar_sensores()
+        balde.por_tipo = dict(dados[3])
+        balde.intensidade = Medida(*dados[4])
+        balde.velocidade = Medida(*dados[5])
+        balde.intervalo = Medida(*dados[6])
+        return balde
+
+    def para_dict(self):
+        return {
+            "inicio": self.inicio,
+            "contagem": self.contagem,
+            "por_sensor": dict(self.por_sensor),
+            "por_tipo": dict(self.por_tipo),
+            "intensidade": self.intensidade.para_dict(),
+            "velocidade": self.velocidade.para_dict(),
+            "intervalo": self.intervalo.para_dict(),
+        }
+
+
+class AgregadorRollups:
+    """Mantém baldes por minuto, hora e dia, atualizados a cada colisão.
+
+    Os instantes são epoch (segundos). Baldes mais antigos que a retenção de
+    cada nível são descartados conforme o tempo avança.
+    """
+
+    def __init__(self, retencao=None, max_sensores=MAX_SENSORES_PADRAO):
+        self.retencao = {**RETENCAO_PADRAO, **(retencao or {})}
+        self.max_sensores = max_sensores
+        self._baldes = {nivel: {} for nivel in RESOLUCOES}    # nivel -> inicio -> Balde
+        self._ultimo_instante = None
+        self.ultimo_seq = None          # Seq do último evento contabilizado (None: desconhecido)
+        self._alterados = set()         # (nivel, inicio) alterados desde o último salvamento
+        self._linhas_arquivo = 0        # Linhas de balde no arquivo (vivas + substituídas)
+        self._compactar = True          # Próximo salvamento reescreve o arquivo inteiro
+        self._lock = threading.Lock()
+        self._lock_arquivo = threading.Lock()   # Um salvamento por vez: os grupos entram no arquivo em ordem
+
+    # ========== REGISTRO ==========
+    def registrar(self, instante, sensor=None, tipo=None, intensidade=None, velocidade=None, seq=None):
+        """Contabiliza uma colisão ocorrida no instante (epoch) informado."""
+        with self._lock:
+            if seq is not None:
+                self.ultimo_seq = seq
+            intervalo = None
+            if self._ultimo_instante is not None and instante >= self._ultimo_instante:
+                intervalo = instante - self._ultimo_instante
+            if self._ultimo_instante is None or instante > self._ultimo_instante:
+                self._ultimo_instante = instante
+            for nivel, resolucao in RESOLUCOES.items():
+                inicio = int(instante // resolucao) * resolucao
+                baldes = self._baldes[nivel]
+                balde = baldes.get(inicio)
+                if balde is None:
+                    if inicio < self._limite(nivel):
+                        continue
+                    balde = baldes[inicio] = Balde(inicio, self.max_sensores)
+                    self._podar(nivel)
+                balde.registrar(sensor, tipo, intensidade, velocidade, intervalo)
+                self._alterados.add((nivel, inicio))
+
+    def registrar_evento(self, evento):
+        """Contabiliza um EventoColisao pelo instante de recebimento."""
+        self.registrar(evento.recebido_em, evento.sensor, evento.tipo, evento.intensidade, evento.velocidade,
+                       evento.seq)
+
+    def _limite(self, nivel):
+        """Início do balde mais antigo mantido no nível."""
+        if self._ultimo_instante is None:
+            return float("-inf")
+        resolucao = RESOLUCOES[nivel]
+        return (int(self._ultimo_instante // resolucao) - self.retencao[nivel] + 1) * resolucao
+
+    def _podar(self, nivel):
+        baldes = self._baldes[nivel]
+        if len(baldes) <= self.retencao[nivel]:
+            return
+        limite = self._limite(nivel)
+        for inicio in [i for i in baldes if i < limite]:
+            del baldes[inicio]
+
+    # ========== CONSULTAS ==========
+    def baldes(self, nivel="hora", inicio=None, fim=None):
+        """Baldes do nível com início em [inicio, fim), em ordem cronológica."""
+        with self._lock:
+            selecionados = [
+                b for b in self._baldes[nivel].values()
+                if (inicio is None or b.inicio >= inicio) and (fim is None or b.inicio < fim)
+            ]
+        selecionados.sort(key=lambda b: b.inicio)
+        return selecionados
+
+    def resumo(self, inicio=None, fim=None, nivel="minuto"):
+        """Combina os baldes do período em um único Balde (contagens, médias e extremos)."""
+        total = Balde(inicio)
+        for balde in self.baldes(nivel, inicio, fim):
+            total.combinar(balde)
+        return total
+
+    def hora_pico(self, dias=30, agora=None):
+        """Balde horário com mais colisões nos últimos `dias` (None se não houver colisões)."""
+        agora = self._ultimo_instante if agora is None else agora
+        if agora is None:
+            return None
+        baldes = self.baldes("hora", agora - dias * 86400)
+        return max(baldes, key=lambda b: b.contagem, default=None)
+
+    def intervalo_medio(self, inicio=None, fim=None, nivel="hora"):
+        """Intervalo médio entre colisões no período (segundos), ou None."""
+        return self.resumo(inicio, fim, nivel).intervalo.media
+
+    def __len__(self):
+        return sum(len(baldes) for baldes in self._baldes.values())
+
+    # ========== PERSISTÊNCIA ==========
+    def para_dict(self):
+        """Estado completo em formato compacto serializável em JSON."""
+        with self._lock:
+            return {
+                "versao": _VERSAO_ARQUIVO,
+                "ultimo_instante": self._ultimo_instante,
+                "niveis": {
+                    nivel: [b.para_lista() for b in baldes.values()]
+                    for nivel, baldes in self._baldes.items()
+                },
+            }
+
+    @classmethod
+    def de_dict(cls, dados, retencao=None, max_sensores=MAX_SENSORES_PADRAO):
+        """Recria o agregador a partir de `para_dict()`."""
+        agregador = cls(retencao, max_sensores)
+        agregador._ultimo_instante = dados.get("ultimo_instante")
+        for nivel, baldes in dados.get("niveis", {}).items():
+            if nivel in RESOLUCOES:
+                agregador._baldes[nivel] = {b[0]: Balde.de_lista(b, max_sensores) for b in baldes}
+                agregador._podar(nivel)
+        return agregador
+
+    def salvar(self, arquivo):
+        """Anexa ao arquivo os baldes alterados desde o último salvamento (ou compacta). Retorna bytes gravados."""
+        with self._lock_arquivo:
+            return self._salvar(Path(arquivo))
+
+    def _salvar(self, arquivo):
+        with self._lock:
+            compactar = self._compactar or self._linhas_arquivo > max(1000, 2 * len(self))
+            if compactar:
+                chaves = [(nivel, inicio) for nivel, baldes in self._baldes.items() for inicio in baldes]
+            else:
+                chaves = [chave for chave in self._alterados if chave[1] in self._baldes[chave[0]]]
+            linhas = [[nivel, self._baldes[nivel][inicio].para_lista()] for nivel, inicio in chaves]
+            self._alterados.clear()
+            fim = ["fim", {"versao": _VERSAO_ARQUIVO, "ultimo_instante": self._ultimo_instante,
+                           "seq": self.ultimo_seq}]
+        if not linhas and not compactar:
+            return 0
+        conteudo = "".join(json.dumps(linha, ensure_ascii=False, separators=(",", ":")) + "\n"
+                           for linha in (*linhas, fim))
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if compactar:
+                _gravar_atomico(arquivo, conteudo)
+            else:
+                with open(arquivo, "a", encoding="utf-8") as f:
+                    f.write(conteudo)
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError:
+            # Um anexo pela metade deixaria o arquivo com um grupo truncado: o próximo salvamento o reescreve
+            with self._lock:
+                self._compactar = True
+            raise
+        with self._lock:
+            self._linhas_arquivo = len(linhas) if compactar else self._linhas_arquivo + len(linhas)
+            if compactar:
+                self._compactar = False
+        return len(conteudo.encode("utf-8"))
+
+    @classmethod
+    def carregar(cls, arquivo, retencao=None, max_sensores=MAX_SENSORES_PADRAO):
+        """Recria o agregador a partir do arquivo (vazio se o arquivo não existir)."""
+        arquivo = Path(arquivo)
+        if not arquivo.exists():
+            return cls(retencao, max_sensores)
+        with open(arquivo, "r", encoding="utf-8") as f:
+            conteudo = f.read()
+        if conteudo.lstrip().startswith("{"):
+            # Formato antigo: um único objeto com todos os níveis (reescrito no próximo salvamento)
+            return cls.de_dict(json.loads(conteudo), retencao, max_sensores)
+        agregador = cls(retencao, max_sensores)
+        grupo, linhas, completo = [], 0, True
+        for texto in conteudo.splitlines():
+            try:
+                tipo, dados = json.loads(texto)
+            except ValueError:
+                grupo, completo = [], False     # Linha truncada: o grupo dela é descartado
+                continue
+            if tipo != "fim":
+                grupo.append((tipo, dados))
+                continue
+            for nivel, lista in grupo:
+                if nivel in RESOLUCOES:
+                    agregador._baldes[nivel][lista[0]] = Balde.de_lista(lista, max_sensores)
+            linhas += len(grupo)
+            agregador._ultimo_instante = dados.get("ultimo_instante")
+            agregador.ultimo_seq = dados.get("seq")
+            grupo, completo = [], True
+        for nivel in RESOLUCOES:
+            agregador._podar(nivel)
+        agregador._linhas_arquivo = linhas
+        # Sobra de um grupo sem "fim" no final: reescreve o arquivo antes de anexar de novo
+        agregador._compactar = bool(grupo) or not completo
+        return agregador
@@ -0,0 +1,301 @@
+"""
+Índice em memória do estado de cada sensor e ranking dos sensores mais ativos.
+
+- IndiceSensores: sensor -> EstadoSensor (última vista, contagem, última
+  intensidade, taxa móvel), atualizado em O(1) por evento. O número de
+  sensores com estado individual é limitado (os vistos há mais tempo saem
+  primeiro), então ids aleatórios/adversários não fazem a memória crescer.
+- ContagemMinima (count-min sketch): contagem aproximada de qualquer sensor em
+  memória fixa (largura x profundidade), inclusive dos que saíram do índice;
+  nunca subestima.
+- TopK: heap mínimo com os K sensores de maior contagem estimada. As
+  contagens do sketch e do ranking caem pela metade a cada `intervalo_decaimento`
+  segundos, então o ranking reflete os sensores "quentes" agora, e não os de
+  maior total desde a partida.
+"""
+
+import collections
+import heapq
+import itertools
+import math
+import random
+import struct
+import threading
+from array import array
+
+from recuperacao import desempacotar_partes, desempacotar_textos, empacotar_partes, empacotar_textos, ler_coluna
+
+NAN = float("nan")
+
+
+class EstadoSensor:
+    """Estado agregado de um sensor."""
+
+    __slots__ = ("sensor", "primeiro_visto", "ultimo_visto", "total", "ultima_intensidade", "_taxa")
+
+    def __init__(self, sensor, instante):
+        self.sensor = sensor
+        self.primeiro_visto = instante     # Epoch
+        self.ultimo_visto = instante
+        self.total = 0
+        self.ultima_intensidade = None
+        self._taxa = 0.0                   # Eventos/s com decaimento exponencial, no instante ultimo_visto
+
+    def registrar(self, instante, intensidade, constante_tempo):
+        # Taxa móvel: decai exp(-dt/tau) desde o último evento e soma 1/tau
+        decorrido = instante - self.ultimo_visto
+        if decorrido > 0:
+            self._taxa *= math.exp(-decorrido / constante_tempo)
+            self.ultimo_visto = instante
+        self._taxa += 1.0 / constante_tempo
+        self.total += 1
+        if intensidade is not None:
+            self.ultima_intensidade = intensidade
+
+    def taxa(self, agora, constante_tempo):
+        """Eventos por segundo (média móvel exponencial) vista no instante `agora`."""
+        return self._taxa * math.exp(-max(0.0, agora - self.ultimo_visto) / constante_tempo)
+
+    def para_dict(self, agora, constante_tempo):
+        return {
+            "sensor": self.sensor,
+            "primeiro_visto": self.primeiro_visto,
+            "ultimo_visto": self.ultimo_visto,
+            "total": self.total,
+            "ultima_intensidade": self.ultima_intensidade,
+            "taxa_por_minuto": round(self.taxa(agora, constante_tempo) * 60, 3),
+        }
+
+    def para_lista(self):
+        return [self.sensor, self.primeiro_visto, self.ultimo_visto, self.total, self.ultima_intensidade, self._taxa]
+
+    @classmethod
+    def de_lista(cls, dados):
+        estado = cls(dados[0], dados[1])
+        estado.ultimo_visto, estado.total, estado.ultima_intensidade, estado._taxa = dados[2:6]
+        return estado
+
+
+class ContagemMinima:
+    """Count-min sketch: `profundidade` linhas de `largura` contadores, uma função de hash por linha."""
+
+    def __init__(self, largura=4096, profundidade=4, semente=None):
+        self.largura = largura
+        self.profundidade = profundidade
+        sorteio = random.Random(semente)
+        self._sementes = [sorteio.getrandbits(64) for _ in range(profundidade)]
+        self._linhas = [[0] * largura for _ in range(profundidade)]
+
+    def adicionar(self, chave, n=1):
+        """Soma `n` à chave e retorna a nova estimativa (mínimo entre as linhas)."""
+        largura, estimativa = self.largura, None
+        for semente, linha in zip(self._sementes, self._linhas):
+            i = hash((semente, chave)) % largura
+            valor = linha[i] + n
+            linha[i] = valor
+            if estimativa is None or valor < estimativa:
+                estimativa = valor
+        return estimativa
+
+    def estimar(self, chave):
+        largura = self.largura
+        return min(linha[hash((semente, chave)) % largura] for semente, linha in zip(self._sementes, self._linhas))
+
+    def dividir(self, divisor=2):
+        """Envelhece todas as contagens (divisão inteira)."""
+        for linha in self._linhas:
+            linha[:] = [valor // divisor for valor in linha]
+
+
+class TopK:
+    """Os K itens de maior contagem, em heap mínimo com entradas obsoletas descartadas sob demanda."""
+
+    def __init__(self, k=20):
+        self.k = k
+        self._contagens = {}    # item -> contagem atual (só itens no ranking)
+        self._heap = []         # (contagem, item); entradas cuja contagem mudou ficam obsoletas
+
+    def __len__(self):
+        return len(self._contagens)
+
+    def _limpar_topo(self):
+        heap, contagens = self._heap, self._contagens
+        while heap and contagens.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def atualizar(self, item, contagem):
+        """Informa a contagem (estimada) atual do item; entra no ranking se superar o menor."""
+        contagens = self._contagens
+        if item not in contagens:
+            if len(contagens) >= self.k:
+                self._limpar_topo()
+                if contagem <= self._heap[0][0]:
+                    return
+                _, saiu = heapq.heappop(self._heap)
+                del contagens[saiu]
+        contagens[item] = contagem
+        heapq.heappush(self._heap, (contagem, item))
+        # Limita o acúmulo de entradas obsoletas
+        if len(self._heap) > 4 * self.k + 64:
+            self._heap = [(c, i) for i, c in contagens.items()]
+            heapq.heapify(self._heap)
+
+    def dividir(self, divisor=2):
+        self._contagens = {item: c // divisor for item, c in self._contagens.items()}
+        self._heap = [(c, i) for i, c in self._contagens.items()]
+        heapq.heapify(self._heap)
+
+    def itens(self):
+        """[(item, contagem)] do maior para o menor."""
+        return sorted(self._contagens.items(), key=lambda par: par[1], reverse=True)
+
+
+class IndiceSensores:
+    """Estado por sensor + ranking dos mais ativos (thread-safe)."""
+
+    def __init__(self, max_sensores=100_000, constante_tempo=60.0, k=20, largura_sketch=4096,
+                 profundidade_sketch=4, intervalo_decaimento=300.0):
+        self.max_sensores = max_sensores
+        self.constante_tempo = float(constante_tempo)
+        self.intervalo_decaimento = intervalo_decaimento
+        self._estados = collections.OrderedDict()     # Ordem = última vista (os mais antigos saem primeiro)
+        self.sketch = ContagemMinima(largura_sketch, profundidade_sketch)
+        self.top = TopK(k)
+        self._ultimo_decaimento = None
+        self._lock = threading.Lock()
+        self.removidos = 0
+
+    @classmethod
+    def de_config(cls, config):
+        return cls(
+            config["max_sensors"], config["rate_window"], config["top_k"], config["sketch_width"],
+            config["sketch_depth"], config["decay_interval"],
+        )
+
+    def __len__(self):
+        return len(self._estados)
+
+    # ========== REGISTRO ==========
+    def registrar_eventos(self, eventos):
+        """Atualiza o índice com um lote de EventoColisao (um lock por lote)."""
+        estados, tau = self._estados, self.constante_tempo
+        with self._lock:
+            for evento in eventos:
+                sensor, instante = evento.sensor, evento.recebido_em
+                self._decair(instante)
+                estado = estados.get(sensor)
+                if estado is None:
+                    estado = estados[sensor] = EstadoSensor(sensor, instante)
+                    if len(estados) > self.max_sensores:
+                        estados.popitem(last=False)
+                        self.removidos += 1
+                else:
+                    estados.move_to_end(sensor)
+                estado.registrar(instante, evento.intensidade, tau)
+                # O sketch superestima sob colisões de hash; o total exato do sensor é um teto melhor
+                self.top.atualizar(sensor, min(self.sketch.adicionar(sensor), estado.total))
+
+    def _decair(self, instante):
+        if not self.intervalo_decaimento:
+            return
+        if self._ultimo_decaimento is None:
+            self._ultimo_decaimento = instante
+        elif instante - self._ultimo_decaimento >= self.intervalo_decaimento:
+            self.sketch.dividir()
+            self.top.dividir()
+            self._ultimo_decaimento = instante
+
+    # ========== CONSULTAS ==========
+    def obter(self, sensor, agora):
+        """Estado do sensor (None se nunca visto ou já removido do índice) e contagem estimada recente."""
+        with self._lock:
+            estado = self._estados.get(sensor)
+            dados = estado.para_dict(agora, self.constante_tempo) if estado else None
+            estimativa = self.sketch.estimar(sensor)
+        return dados, estimativa
+
+    def listar(self, agora, ordem="ultimo_visto", limite=50):
+        """Os `limite` sensores com maior valor de `ordem` (ultimo_visto, total ou taxa)."""
+        tau = self.constante_tempo
+        chaves = {
+            "ultimo_visto": lambda e: e.ultimo_visto,
+            "total": lambda e: e.total,
+            "taxa": lambda e: e.taxa(agora, tau),
+        }
+        if ordem not in chaves:
+            raise ValueError(f"Ordem desconhecida: {ordem!r} (use {', '.join(chaves)})")
+        with self._lock:
+            if ordem == "ultimo_visto":
+                # A ordem do índice já é a de última vista
+                selecionados = [self._estados[s] for s in itertools.islice(reversed(self._estados), limite)]
+            else:
+                selecionados = heapq.nlargest(limite, self._estados.values(), key=chaves[ordem])
+            return [estado.para_dict(agora, tau) for estado in selecionados]
+
+    def mais_ativos(self, agora, k=None):
+        """Ranking dos sensores quentes: contagem recente estimada + estado, se ainda no índice."""
+        with self._lock:
+            ranking = self.top.itens()[:k]
+            resultado = []
+            for sensor, contagem in ranking:
+                estado = self._estados.get(sensor)
+                resultado.append({
+                    "sensor": sensor,
+                    "contagem_recente": contagem,
+                    "estado": estado.para_dict(agora, self.constante_tempo) if estado else None,
+                })
+        return resultado
+
+    def estatisticas(self):
+        return {
+            "sensores": len(self._estados),
+            "removidos": self.removidos,
+            "top_k": self.top.k,
+            "sketch": f"{self.sketch.profundidade}x{self.sketch.largura}",
+        }
+
+    # ========== SNAPSHOT ==========
+    def capturar(self):
+        """Cópia dos estados por sensor e do ranking (sob o lock, sem serializar); ver `serializar`."""
+        with self._lock:
+            return self._ultimo_decaimento, [estado.para_lista() for estado in self._estados.values()], self.top.itens()
+
+    @staticmethod
+    def serializar(captura):
+        """Estados por sensor (em colunas) e o ranking de uma captura, em bytes para a seção do snapshot.
+
+        O sketch usa hash por processo e é reconstruído do ranking.
+        """
+        ultimo_decaimento, estados, top = captura
+        sensores, primeiros, ultimos, totais, intensidades, taxas = zip(*estados) if estados else ((),) * 6
+        return empacotar_partes([
+            struct.pack("<d", NAN if ultimo_decaimento is None else ultimo_decaimento),
+            empacotar_textos(sensores),
+            array("d", primeiros).tobytes(),
+            array("d", ultimos).tobytes(),
+            array("q", totais).tobytes(),
+            array("d", [NAN if i is None else i for i in intensidades]).tobytes(),
+            array("d", taxas).tobytes(),
+            empacotar_textos([sensor for sensor, _ in top]),
+            array("q", [contagem for _, contagem in top]).tobytes(),
+        ])
+
+    def exportar(self):
+        return self.serializar(self.capturar())
+
+    def restaurar(self, dados):
+        partes = desempacotar_partes(dados)
+        (ultimo_decaimento,) = struct.unpack("<d", partes[0])
+        colunas = [desempacotar_textos(partes[1]), ler_coluna("d", partes[2]), ler_coluna("d", partes[3]),
+                   ler_coluna("q", partes[4]), [None if i != i else i for i in ler_coluna("d", partes[5])],
+                   ler_coluna("d", partes[6])]
+        top = zip(desempacotar_textos(partes[7]), ler_coluna("q", partes[8]))
+        with self._lock:
+            for lista in zip(*colunas):
+                estado = EstadoSensor.de_lista(lista)
+                self._estados[estado.sensor] = estado
+            while len(self._estados) > self.max_sensores:
+                self._estados.popitem(last=False)
+            for sensor, contagem in top:
+                self.top.atualizar(sensor, self.sketch.adicionar(sensor, contagem))
+            self._ultimo_decaimento = None if ultimo_decaimento != ultimo_decaimento else ultimo_decaimento
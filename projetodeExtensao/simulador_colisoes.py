@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 """
 Simulador de colisões para testar o sistema completo
+
+Uso:
+    python simulador_colisoes.py                       # uma colisão a cada 1-5 s (modo original)
+    python simulador_colisoes.py --carga --taxa 2000   # gerador de carga (veja --help)
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import threading
 import time
 import json
 import random
@@ -99,7 +105,258 @@ def simulate_collisions():
     except Exception as e:
         print(f"❌ Erro: {e}")
 
-if __name__ == "__main__":
-    simulate_collisions()
 
+# ========== GERADOR DE CARGA (--carga) ==========
+FORMATOS = ("compacto", "indentado", "integracao")
+
+
+def montar_payload(formato, rnd, sensor, numero):
+    """Payload no formato do simulador (compacto ou indentado) ou do SimuladorIntegracao.
+
+    Todos levam `enviado_em_ns`, o instante de envio (time.time_ns()).
+    """
+    if formato == "integracao":
+        dados = {
+            "tipo": "colisao",
+            "numero": numero,
+            "sensor_id": sensor,
+            "timestamp": time.time(),
+            "distancia": round(rnd.uniform(5, 15), 1),
+            "velocidade": round(rnd.uniform(30, 80), 1),
+            "intensidade": rnd.choice(["baixa", "media", "alta"]),
+            "localizacao": rnd.choice(["frontal", "lateral_esquerda", "lateral_direita", "traseira"]),
+        }
+    else:
+        dados = {
+            "tipo": "colisao",
+            "sensor": sensor,
+            "timestamp": time.time(),
+            "colisao_id": numero,
+            "tipo_colisao": rnd.choice(["colisão frontal", "colisão lateral", "colisão traseira",
+                                        "colisão múltipla", "quase colisão"]),
+            "intensidade": rnd.randint(1, 10),
+            "localizacao": {"x": rnd.randint(0, 100), "y": rnd.randint(0, 100)},
+            "velocidade": rnd.randint(20, 120),
+            "mensagem": f"Colisão #{numero} detectada no {sensor}",
+        }
+    dados["enviado_em_ns"] = time.time_ns()
+    if formato == "indentado":
+        return json.dumps(dados, indent=2)
+    return json.dumps(dados, separators=(",", ":"))
+
+
+class BaldeTokens:
+    """Ritmo de envio em malha aberta: `taxa(t)` tokens/s acumulados até `capacidade` (rajada)."""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa                # função: segundos desde o início -> mensagens/s
+        self.capacidade = capacidade
+        self.tokens = 0.0
+        self.inicio = self._ultimo = time.monotonic()
+
+    def retirar(self):
+        """Retorna quantas mensagens podem ser enviadas agora (dorme se nenhuma)."""
+        agora = time.monotonic()
+        taxa = self.taxa(agora - self.inicio)
+        self.tokens = min(self.capacidade, self.tokens + taxa * (agora - self._ultimo))
+        self._ultimo = agora
+        if self.tokens < 1:
+            time.sleep(min(0.05, (1 - self.tokens) / taxa) if taxa > 0 else 0.01)
+            return 0
+        quantidade = int(self.tokens)
+        self.tokens -= quantidade
+        return quantidade
+
+
+def curva_de_taxa(taxa, rampa=0.0, estagios=None):
+    """Taxa-alvo em função do tempo: estágios "taxa:segundos" em sequência, ou taxa fixa com rampa linear."""
+    if estagios:
+        limites, acumulado = [], 0.0
+        for taxa_estagio, duracao in estagios:
+            acumulado += duracao
+            limites.append((acumulado, taxa_estagio))
+
+        def taxa_em(t):
+            for fim, taxa_estagio in limites:
+                if t < fim:
+                    return taxa_estagio
+            return limites[-1][1]
+        return taxa_em, acumulado
+
+    def taxa_em(t):
+        return taxa * min(1.0, t / rampa) if rampa > 0 else taxa
+    return taxa_em, None
+
+
+def _estagio(texto):
+    taxa, duracao = texto.split(":")
+    return float(taxa), float(duracao)
+
+
+class GeradorCarga:
+    """N sensores virtuais publicando num ritmo-alvo agregado, medindo taxa real e latência de ack."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rnd = random.Random(args.semente)
+        self.sensores = [f"sensor_{i:03d}" for i in range(args.sensores)]
+        self.enviadas = 0
+        self.erros = 0
+        self.acks = 0
+        self.latencias = []             # Latência de ack (s), QoS >= 1
+        self._pendentes = {}            # (cliente, mid) -> instante de envio
+        self._acks_antecipados = {}     # ack processado antes do registro do envio
+        self._lock = threading.Lock()
+        quantidade = args.sensores if args.conexao_por_sensor else 1
+        self.clientes = [self._criar_cliente(i) for i in range(quantidade)]
 
+    def _criar_cliente(self, indice):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"carga_{self.args.semente}_{indice}")
+        client.max_inflight_messages_set(self.args.inflight)
+        client.max_queued_messages_set(0)
+        client.on_publish = lambda c, u, mid, rc, props=None: self._ack(indice, mid)
+        return client
+
+    def _ack(self, indice, mid):
+        """Executado na thread de rede do paho: nunca chama o paho segurando o lock."""
+        agora = time.perf_counter()
+        with self._lock:
+            self.acks += 1
+            if not self.args.qos:
+                return              # QoS 0: o paho só confirma a escrita no socket
+            enviado = self._pendentes.pop((indice, mid), None)
+            if enviado is None:
+                self._acks_antecipados[(indice, mid)] = agora
+            else:
+                self.latencias.append(agora - enviado)
+
+    def _registrar_envio(self, indice, mid, enviado):
+        with self._lock:
+            ack = self._acks_antecipados.pop((indice, mid), None)
+            if ack is None:
+                self._pendentes[(indice, mid)] = enviado
+            else:
+                self.latencias.append(ack - enviado)
+
+    def _publicar(self, numero):
+        indice_sensor = self.rnd.randrange(len(self.sensores))
+        indice = indice_sensor if self.args.conexao_por_sensor else 0
+        payload = montar_payload(self.args.formato, self.rnd, self.sensores[indice_sensor], numero)
+        enviado = time.perf_counter()
+        info = self.clientes[indice].publish(self.args.topic, payload, qos=self.args.qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.erros += 1
+            return
+        self.enviadas += 1
+        if self.args.qos:
+            self._registrar_envio(indice, info.mid, enviado)
+
+    @staticmethod
+    def _percentis(latencias):
+        if not latencias:
+            return None
+        ordenadas = sorted(latencias)
+        pegar = lambda p: round(ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))] * 1000, 2)
+        return {"p50_ms": pegar(50), "p99_ms": pegar(99), "max_ms": round(ordenadas[-1] * 1000, 2)}
+
+    def executar(self):
+        args = self.args
+        for client in self.clientes:
+            client.connect(args.broker, args.port, 60)
+            client.loop_start()
+        time.sleep(1)
+
+        taxa_em, duracao_estagios = curva_de_taxa(args.taxa, args.rampa, args.estagios)
+        duracao = args.duracao or duracao_estagios
+        capacidade = args.rajada or max(1.0, (args.taxa or 1) / 10)
+        balde = BaldeTokens(taxa_em, capacidade)
+        print(f"🚀 Carga: {len(self.sensores)} sensores em {len(self.clientes)} conexão(ões), "
+              f"formato {args.formato}, QoS {args.qos}, semente {args.semente}")
+
+        inicio = time.monotonic()
+        proximo_relatorio = inicio + 1
+        enviadas_antes, latencias_antes = 0, 0
+        numero = 0
+        try:
+            while True:
+                agora = time.monotonic()
+                if (duracao and agora - inicio >= duracao) or (args.total and numero >= args.total):
+                    break
+                for _ in range(balde.retirar()):
+                    numero += 1
+                    self._publicar(numero)
+                if agora >= proximo_relatorio:
+                    # Relatório por segundo: taxa obtida e latência de ack do último intervalo
+                    proximo_relatorio += 1
+                    with self._lock:
+                        recentes = self.latencias[latencias_antes:]
+                        latencias_antes = len(self.latencias)
+                    percentis = self._percentis(recentes)
+                    print(f"📤 t={agora - inicio:4.0f}s | alvo {taxa_em(agora - inicio):7.0f}/s | "
+                          f"obtida {self.enviadas - enviadas_antes:7d}/s | acks {self.acks} | erros {self.erros}"
+                          + (f" | ack p50 {percentis['p50_ms']}ms p99 {percentis['p99_ms']}ms" if percentis else ""))
+                    enviadas_antes = self.enviadas
+        except KeyboardInterrupt:
+            print("\n🛑 Carga interrompida pelo usuário")
+
+        decorrido = time.monotonic() - inicio
+        # Aguarda os acks pendentes antes do resumo
+        limite = time.monotonic() + 5
+        while args.qos and self._pendentes and time.monotonic() < limite:
+            time.sleep(0.05)
+        for client in self.clientes:
+            client.loop_stop()
+            client.disconnect()
+        return self.resumo(decorrido)
+
+    def resumo(self, decorrido):
+        resultado = {
+            "enviadas": self.enviadas,
+            "erros": self.erros,
+            "acks": self.acks,
+            "duracao_s": round(decorrido, 2),
+            "taxa_obtida": round(self.enviadas / decorrido, 1) if decorrido else 0.0,
+            "latencia_ack": self._percentis(self.latencias),
+        }
+        print("=" * 50)
+        print(f"📊 {resultado['enviadas']} mensagens em {resultado['duracao_s']}s "
+              f"({resultado['taxa_obtida']}/s), {resultado['erros']} erros, {resultado['acks']} acks")
+        if resultado["latencia_ack"]:
+            lat = resultado["latencia_ack"]
+            print(f"⏱️  Latência de ack: p50 {lat['p50_ms']}ms | p99 {lat['p99_ms']}ms | máx {lat['max_ms']}ms")
+        return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador de colisões / gerador de carga MQTT")
+    parser.add_argument("--carga", action="store_true", help="modo gerador de carga")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--topic", default="vini123/colisao")
+    parser.add_argument("--sensores", type=int, default=10, help="sensores virtuais")
+    parser.add_argument("--conexao-por-sensor", action="store_true", help="uma conexão MQTT por sensor")
+    parser.add_argument("--taxa", type=float, default=1000, help="mensagens/s agregadas")
+    parser.add_argument("--rampa", type=float, default=0, help="segundos de subida linear até a taxa")
+    parser.add_argument("--rajada", type=float, default=None, help="capacidade do balde de tokens (mensagens)")
+    parser.add_argument("--estagios", type=_estagio, nargs="+", default=None,
+                        help="sequência taxa:segundos (ex.: 500:10 5000:2 500:10)")
+    parser.add_argument("--duracao", type=float, default=None, help="segundos de carga")
+    parser.add_argument("--total", type=int, default=None, help="encerra após N mensagens")
+    parser.add_argument("--formato", choices=FORMATOS, default="compacto")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument("--inflight", type=int, default=1000, help="mensagens QoS>0 sem ack por conexão")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", default=None, help="grava o resumo em JSON")
+    args = parser.parse_args()
+
+    if not args.carga:
+        simulate_collisions()
+        return
+    resultado = GeradorCarga(args).executar()
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultado": resultado}, f, ensure_ascii=False, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,18 @@ import random
 from datetime import datetime
 from pathlib import Path
 
+from decodificador import INTENSIDADES
+from rollups import AgregadorRollups
+import analitica
+
 class SimuladorIntegracao:
     def __init__(self):
         self.colisoes_detectadas = 0
         self.historico = []
         self.log_file = Path("logs/simulacao.log")
         self.data_file = Path("historico_simulacao.json")
+        # Agregados incrementais (evita percorrer o histórico para as estatísticas)
+        self.rollups = AgregadorRollups()
         
         # Cria diretório de logs
         self.log_file.parent.mkdir(exist_ok=True)
@@ -49,6 +55,13 @@ class SimuladorIntegracao:
         }
         
         self.historico.append(colisao)
+        self.rollups.registrar(
+            timestamp.timestamp(),
+            sensor=sensor_id,
+            tipo=colisao['localizacao'],
+            intensidade=INTENSIDADES[colisao['intensidade']],
+            velocidade=colisao['velocidade'],
+        )
         
         # Log da colisão
         self.log_event(f"COLISÃO DETECTADA #{self.colisoes_detectadas}")
@@ -102,7 +115,8 @@ class SimuladorIntegracao:
         print("=" * 60)
         print(f"Total de colisões: {self.colisoes_detectadas}")
         
-        if self.historico:
+        resumo = self.rollups.resumo()
+        if resumo.contagem:
             primeira = datetime.fromisoformat(self.historico[0]['timestamp'])
             ultima = datetime.fromisoformat(self.historico[-1]['timestamp'])
             duracao = (ultima - primeira).total_seconds()
@@ -111,18 +125,36 @@ class SimuladorIntegracao:
             print(f"Última colisão: {ultima.strftime('%H:%M:%S')}")
             
             if duracao > 0:
-                taxa = self.colisoes_detectadas / (duracao / 60)
+                taxa = resumo.contagem / (duracao / 60)
                 print(f"Taxa média: {taxa:.2f} colisões/minuto")
+            if resumo.intervalo.media is not None:
+                print(f"Intervalo médio: {resumo.intervalo.media:.1f}s")
+            if resumo.velocidade.n:
+                print(f"Velocidade: média {resumo.velocidade.media:.1f}% "
+                      f"(mín {resumo.velocidade.minimo}%, máx {resumo.velocidade.maximo}%)")
             
-            # Análise por localização
-            localizacoes = {}
-            for colisao in self.historico:
-                loc = colisao['localizacao']
-                localizacoes[loc] = localizacoes.get(loc, 0) + 1
+            pico = self.rollups.hora_pico()
+            if pico:
+                inicio = datetime.fromtimestamp(pico.inicio).strftime('%H:%M')
+                print(f"Hora de pico: {inicio} ({pico.contagem} colisões)")
             
+            # Análise por localização
             print("\n📍 Colisões por localização:")
-            for loc, count in sorted(localizacoes.items(), key=lambda x: x[1], reverse=True):
+            for loc, count in sorted(resumo.por_tipo.items(), key=lambda x: x[1], reverse=True):
                 print(f"  {loc}: {count} colisões")
+            
+            # Distribuições (vetorizadas; só com NumPy instalado)
+            if analitica.NUMPY_DISPONIVEL:
+                colunas = analitica.HistoricoColunar.de_registros(
+                    (datetime.fromisoformat(c['timestamp']).timestamp(), c) for c in self.historico
+                )
+                print("\n📈 Distribuições:")
+                for coluna, unidade in (("distancia", "cm"), ("velocidade", "%")):
+                    resumo_coluna = colunas.percentis(coluna, (50, 90))
+                    if resumo_coluna["n"]:
+                        p = resumo_coluna["percentis"]
+                        print(f"  {coluna}: p50 {p['p50']:.1f}{unidade}, p90 {p['p90']:.1f}{unidade} "
+                              f"(desvio {resumo_coluna['desvio']:.1f})")
         
         print("=" * 60)
     
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Supervisor de múltiplos processos detectores.
+
+Cada worker é um DetectorColisao com client id único que assina o tópico via
+assinatura compartilhada ($share/<grupo>/<topic>), de modo que o broker
+distribui as mensagens entre eles. Os workers enviam suas estatísticas ao
+supervisor, que as combina numa visão global e reinicia workers que caírem.
+
+Uso: python supervisor_detector.py [--workers N] [--grupo detectores]
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from pathlib import Path
+
+from config import MQTT_CONFIG, LOGGING_CONFIG, DATA_CONFIG, STATS_CONFIG, SUPERVISOR_CONFIG
+
+
+def _com_sufixo(caminho, indice):
+    """historico_colisoes.json -> historico_colisoes_w2.json (um arquivo por worker)."""
+    caminho = Path(caminho)
+    return str(caminho.with_name(f"{caminho.stem}_w{indice}{caminho.suffix}"))
+
+
+def _executar_worker(indice, grupo, resultados, report_interval):
+    """Ponto de entrada do processo worker."""
+    # Identidade e arquivos próprios (evita disputa de log/dados entre processos)
+    base_dir = Path(__file__).resolve().parent
+    os.environ["MQTT_CLIENT_ID"] = f"{MQTT_CONFIG['client_id']}_w{indice}_{os.getpid()}"
+    os.environ["MQTT_SHARED_GROUP"] = grupo
+    os.environ["LOG_FILE"] = _com_sufixo(
+        os.getenv("LOG_FILE") or base_dir / "logs" / Path(LOGGING_CONFIG["file"]).name, indice
+    )
+    for chave, env in (("data_file", "DATA_FILE"), ("segments_dir", "SEGMENTS_DIR"), ("sqlite_file", "SQLITE_FILE"),
+                       ("rollups_file", "ROLLUPS_FILE"), ("recovery_dir", "RECOVERY_DIR")):
+        os.environ[env] = _com_sufixo(os.getenv(env) or base_dir / "data" / Path(DATA_CONFIG[chave]).name, indice)
+
+    from detector_colisao import DetectorColisao
+
+    # Só o supervisor decide o encerramento: Ctrl+C é ignorado e o SIGTERM
+    # vira KeyboardInterrupt, para o detector salvar e encerrar normalmente
+    def _interromper(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _interromper)
+
+    detector = DetectorColisao()
+
+    def reportar():
+        while not detector._stop_event.wait(report_interval):
+            resultados.put((indice, os.getpid(), detector.get_estatisticas()))
+    threading.Thread(target=reportar, name="reporter", daemon=True).start()
+
+    detector.run()
+
+
+class SupervisorDetectores:
+    """Inicia, monitora e reinicia N processos detectores, combinando suas estatísticas."""
+
+    def __init__(self, workers=None, grupo=None):
+        self.config = SUPERVISOR_CONFIG.copy()
+        self.workers = workers or self.config["workers"]
+        self.grupo = grupo or self.config["shared_group"]
+        self._ctx = multiprocessing.get_context("spawn")
+        self._resultados = self._ctx.Queue()
+        self._processos = {}        # indice -> Process
+        self._reinicios = {}        # indice -> quantidade de reinícios
+        self._reiniciar_em = {}     # indice -> instante (monotônico) do próximo reinício
+        self._ultimas = {}          # indice -> últimas estatísticas recebidas
+        self._acumulado = {}        # indice -> total das encarnações anteriores (só sem recuperação)
+        self._parar = threading.Event()
+
+    # ========== PROCESSOS ==========
+    def _iniciar_worker(self, indice):
+        processo = self._ctx.Process(
+            target=_executar_worker,
+            args=(indice, self.grupo, self._resultados, self.config["report_interval"]),
+            name=f"detector-w{indice}",
+            daemon=False,
+        )
+        processo.start()
+        self._processos[indice] = processo
+        print(f"▶️ Worker {indice} iniciado (pid {processo.pid})")
+
+    def _verificar_workers(self):
+        """Agenda o reinício (com espera crescente) dos workers que terminaram."""
+        agora = time.monotonic()
+        for indice, processo in list(self._processos.items()):
+            if processo.is_alive():
+                continue
+            if indice not in self._reiniciar_em:
+                reinicios = self._reinicios.get(indice, 0)
+                espera = min(self.config["restart_delay"] * 2 ** reinicios, self.config["max_restart_delay"])
+                self._reiniciar_em[indice] = agora + espera
+                ultima = self._ultimas.pop(indice, None)
+                # Com recuperação, a próxima encarnação já restaura o total (snapshot + WAL): somar contaria duas vezes
+                if ultima and not DATA_CONFIG["recovery"]:
+                    self._acumulado[indice] = self._acumulado.get(indice, 0) + ultima["total"]
+                print(f"💀 Worker {indice} terminou (código {processo.exitcode}); reinício em {espera}s")
+            elif agora >= self._reiniciar_em[indice]:
+                del self._reiniciar_em[indice]
+                self._reinicios[indice] = self._reinicios.get(indice, 0) + 1
+                self._iniciar_worker(indice)
+
+    def _receber_resultados(self, timeout):
+        try:
+            indice, pid, stats = self._resultados.get(timeout=timeout)
+        except queue.Empty:
+            return
+        processo = self._processos.get(indice)
+        if processo is not None and processo.pid == pid:
+            self._ultimas[indice] = stats
+
+    # ========== VISÃO GLOBAL ==========
+    def visao_global(self):
+        """Combina as estatísticas mais recentes de todos os workers."""
+        visao = {
+            "workers": len(self._processos),
+            "ativos": sum(1 for p in self._processos.values() if p.is_alive()),
+            "reinicios": sum(self._reinicios.values()),
+            "total": sum(self._acumulado.values()),
+            "janelas": {},
+            "fila": 0,
+            "descartadas": 0,
+            "alertas": 0,
+            "por_worker": {},
+        }
+        for indice, stats in self._ultimas.items():
+            visao["total"] += stats["total"]
+            for janela, contagem in stats["janelas"].items():
+                visao["janelas"][janela] = visao["janelas"].get(janela, 0) + contagem
+            for campo in ("fila", "descartadas", "alertas"):
+                visao[campo] += stats.get(campo, 0)
+            visao["por_worker"][indice] = {"total": stats["total"], "ultimo_minuto": stats["janelas"].get(60, 0)}
+        visao["alerta_global"] = visao["janelas"].get(60, 0) > STATS_CONFIG["alert_threshold"]
+        return visao
+
+    def _exibir(self):
+        visao = self.visao_global()
+        print(
+            f"📊 Workers {visao['ativos']}/{visao['workers']} | total {visao['total']} | "
+            f"último minuto {visao['janelas'].get(60, 0)} | alertas {visao['alertas']} | reinícios {visao['reinicios']}"
+        )
+        if visao["alerta_global"]:
+            print("🚨 ALERTA GLOBAL: Alta taxa de colisões detectada!")
+
+    # ========== CICLO PRINCIPAL ==========
+    def executar(self):
+        print(f"🚀 Supervisor: {self.workers} workers no grupo '$share/{self.grupo}/{MQTT_CONFIG['topic']}'")
+        for indice in range(self.workers):
+            self._iniciar_worker(indice)
+        proxima_exibicao = time.monotonic() + self.config["report_interval"]
+        try:
+            while not self._parar.is_set():
+                self._receber_resultados(timeout=0.5)
+                self._verificar_workers()
+                if time.monotonic() >= proxima_exibicao:
+                    proxima_exibicao += self.config["report_interval"]
+                    self._exibir()
+        except KeyboardInterrupt:
+            print("\n🛑 Encerrando workers...")
+        finally:
+            self._encerrar()
+
+    def parar(self):
+        self._parar.set()
+
+    def _encerrar(self):
+        for processo in self._processos.values():
+            if processo.is_alive():
+                processo.terminate()
+        for processo in self._processos.values():
+            processo.join(timeout=10)
+        self._exibir()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Supervisor de detectores com assinatura compartilhada")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--grupo", default=None)
+    args = parser.parse_args()
+    SupervisorDetectores(args.workers, args.grupo).executar()
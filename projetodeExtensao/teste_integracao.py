@@ -2,12 +2,20 @@
 """
 Script de Teste de Integração MQTT
 Simula mensagens de colisão para testar a comunicação entre sistemas
+
+Uso:
+    python teste_integracao.py             # broker público (mqtt.eclipseprojects.io)
+    python teste_integracao.py --loopback  # detector no mesmo processo, sem rede
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import os
+import threading
 import json
 import time
 import random
+import tempfile
 from datetime import datetime
 
 # Configurações MQTT
@@ -17,9 +25,12 @@ MQTT_TOPIC = "vini123/colisao"
 MQTT_USERNAME = "vini123"
 
 class MQTTTester:
-    def __init__(self):
+    def __init__(self, loopback=False):
         self.client = None
         self.connected = False
+        self.loopback = loopback
+        # Sem rede não há o que esperar entre as mensagens
+        self.intervalo = 0 if loopback else 1
         
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
@@ -37,7 +48,11 @@ class MQTTTester:
         
     def connect(self):
         try:
-            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="teste_integracao")
+            if self.loopback:
+                from transporte import ClienteLoopback
+                self.client = ClienteLoopback(client_id="teste_integracao")
+            else:
+                self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="teste_integracao")
             self.client.on_connect = self.on_connect
             self.client.on_disconnect = self.on_disconnect
             
@@ -140,17 +155,17 @@ class MQTTTester:
         print("\n📋 SEQUÊNCIA DE TESTES:")
         print("1. Enviando mensagem de status inicial...")
         self.send_status_message("sistema_iniciado")
-        time.sleep(2)
+        time.sleep(2 * self.intervalo)
         
         print("\n2. Simulando colisões...")
         for i in range(1, 6):
             print(f"\n🚗 Simulando colisão #{i}...")
             self.send_collision_message(i, f"sensor_{i}")
-            time.sleep(3)  # Intervalo entre colisões
+            time.sleep(3 * self.intervalo)  # Intervalo entre colisões
         
         print("\n3. Enviando mensagem de status final...")
         self.send_status_message("teste_concluido")
-        time.sleep(2)
+        time.sleep(2 * self.intervalo)
         
         print("\n" + "=" * 60)
         print("✅ TESTE DE INTEGRAÇÃO CONCLUÍDO!")
@@ -167,18 +182,68 @@ class MQTTTester:
             self.client.disconnect()
             print("🔌 Desconectado do broker MQTT")
 
+def iniciar_detector_loopback(saida):
+    """Roda o DetectorColisao neste processo, ligado ao barramento loopback.
+
+    Dados, logs e recuperação ficam em `saida` (diretório temporário) e a recuperação
+    fica desligada: cada execução começa do zero, sem tocar em data/ e logs/.
+    """
+    os.environ["MQTT_TRANSPORT"] = "loopback"
+    os.environ.update(
+        DATA_FILE=os.path.join(saida, "historico_colisoes.json"), SEGMENTS_DIR=os.path.join(saida, "segmentos"),
+        SQLITE_FILE=os.path.join(saida, "colisoes.db"), ROLLUPS_FILE=os.path.join(saida, "rollups.json"),
+        RECOVERY_DIR=os.path.join(saida, "recuperacao"), LOG_FILE=os.path.join(saida, "colisao.log"),
+    )
+    from config import DATA_CONFIG
+    DATA_CONFIG.update(recovery=False)
+    from detector_colisao import DetectorColisao
+    detector = DetectorColisao()
+    executor = threading.Thread(target=detector.run, name="detector", daemon=True)
+    executor.start()
+    while not detector.conectado:
+        time.sleep(0.01)
+    return detector, executor
+
+def verificar_detector(detector, esperadas=5):
+    """Confere se o detector recebeu as colisões (as mensagens de status são rejeitadas)."""
+    limite = time.time() + 5
+    while detector.colisoes.ultimo_seq < esperadas and time.time() < limite:
+        time.sleep(0.05)
+    recebidas = detector.colisoes.ultimo_seq
+    if recebidas == esperadas:
+        print(f"✅ Detector processou as {recebidas} colisões")
+    else:
+        print(f"❌ Detector processou {recebidas} de {esperadas} colisões")
+    detector._stop_event.set()
+    return recebidas == esperadas
+
 def main():
     """Função principal do teste"""
-    tester = MQTTTester()
+    parser = argparse.ArgumentParser(description="Teste de integração MQTT")
+    parser.add_argument("--loopback", action="store_true", help="detector em processo, sem broker")
+    args = parser.parse_args()
+
+    detector = executor = temporario = None
+    if args.loopback:
+        temporario = tempfile.TemporaryDirectory(prefix="teste_integracao_", ignore_cleanup_errors=True)
+        detector, executor = iniciar_detector_loopback(temporario.name)
+    tester = MQTTTester(loopback=args.loopback)
     
     try:
         tester.run_test_sequence()
+        if detector is not None:
+            verificar_detector(detector)
     except KeyboardInterrupt:
         print("\n\n⏹️ Teste interrompido pelo usuário")
     except Exception as e:
         print(f"\n❌ Erro durante o teste: {e}")
     finally:
         tester.disconnect()
+        if detector is not None:
+            # Espera o último salvamento antes de apagar o diretório temporário
+            detector._stop_event.set()
+            executor.join(timeout=30)
+            temporario.cleanup()
 
 if __name__ == "__main__":
     main()
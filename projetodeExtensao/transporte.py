@@ -0,0 +1,214 @@
+"""
+Transportes de mensagens do detector.
+
+- "paho": cliente MQTT real (paho.mqtt.client.Client), via broker TCP.
+- "loopback": barramento em processo com a mesma interface usada pelo detector
+  (connect/subscribe/publish/loop_start e callbacks no estilo paho v1). Casa
+  tópicos com curingas e $share, entrega de forma síncrona e confirma QoS 1
+  (on_publish) só depois de entregar a todos os assinantes, como o PUBACK de
+  um broker. Sem rede: o pipeline roda na velocidade da CPU em testes e
+  benchmarks.
+"""
+
+import itertools
+import threading
+
+import paho.mqtt.client as mqtt
+
+from broker_local import topico_corresponde, separar_compartilhada
+
+TRANSPORTES = ("paho", "loopback")
+
+
+class MensagemLoopback:
+    """Mensagem entregue ao on_message (mesmos atributos usados do MQTTMessage)."""
+
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+
+class InfoPublicacao:
+    """Resultado de publish() (subconjunto do MQTTMessageInfo)."""
+
+    __slots__ = ("rc", "mid", "_publicada")
+
+    def __init__(self, rc, mid, publicada):
+        self.rc = rc
+        self.mid = mid
+        self._publicada = publicada
+
+    def is_published(self):
+        return self._publicada
+
+    def wait_for_publish(self, timeout=None):
+        return self._publicada
+
+
+class BarramentoLocal:
+    """Roteia publicações entre clientes loopback do mesmo processo."""
+
+    def __init__(self):
+        self._assinaturas = {}      # cliente -> {filtro: qos}
+        self._rodizio = {}          # (grupo, filtro) -> contador para round-robin
+        self._lock = threading.Lock()
+        self.publicadas = 0
+        self.entregues = 0
+
+    def assinar(self, cliente, filtro, qos):
+        with self._lock:
+            self._assinaturas.setdefault(cliente, {})[filtro] = qos
+
+    def cancelar(self, cliente, filtro=None):
+        with self._lock:
+            if filtro is None:
+                self._assinaturas.pop(cliente, None)
+            else:
+                self._assinaturas.get(cliente, {}).pop(filtro, None)
+
+    def _destinos(self, topico, qos):
+        """[(cliente, qos)] que recebem o tópico: assinantes diretos + um por grupo $share."""
+        destinos, grupos = [], {}
+        with self._lock:
+            for cliente, filtros in self._assinaturas.items():
+                melhor = -1
+                for filtro, qos_assinatura in filtros.items():
+                    grupo, real = separar_compartilhada(filtro)
+                    if not topico_corresponde(real, topico):
+                        continue
+                    if grupo is None:
+                        melhor = max(melhor, qos_assinatura)
+                    else:
+                        grupos.setdefault((grupo, real), []).append((cliente, qos_assinatura))
+                if melhor >= 0:
+                    destinos.append((cliente, min(qos, melhor)))
+            for chave, membros in grupos.items():
+                indice = self._rodizio.get(chave, 0)
+                self._rodizio[chave] = indice + 1
+                cliente, qos_assinatura = membros[indice % len(membros)]
+                destinos.append((cliente, min(qos, qos_assinatura)))
+            self.publicadas += 1
+        return destinos
+
+    def publicar(self, topico, payload, qos=0, retain=False):
+        """Entrega a mensagem aos assinantes na thread de quem publica."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif payload is None:
+            payload = b""
+        for cliente, qos_entrega in self._destinos(topico, qos):
+            cliente._entregar(MensagemLoopback(topico, payload, qos_entrega, retain))
+            self.entregues += 1
+
+
+_barramento_padrao = BarramentoLocal()
+
+
+def barramento_padrao():
+    """Barramento compartilhado pelos clientes loopback do processo."""
+    return _barramento_padrao
+
+
+class ClienteLoopback:
+    """Cliente com a interface do paho usada pelo detector, ligado a um BarramentoLocal."""
+
+    def __init__(self, client_id="", clean_session=True, userdata=None, barramento=None):
+        self._client_id = client_id
+        self._userdata = userdata
+        self.barramento = barramento or _barramento_padrao
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+        self._conectado = False
+        self._loop_ativo = False
+        self._mids = itertools.cycle(range(1, 65536))
+
+    # ========== CONEXÃO ==========
+    def username_pw_set(self, username, password=None):
+        """Sem autenticação no barramento local."""
+
+    def connect(self, host="loopback", port=0, keepalive=60, *args, **kwargs):
+        self._conectado = True
+        if self.on_connect:
+            self.on_connect(self, self._userdata, {"session present": 0}, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self, *args, **kwargs):
+        if not self._conectado:
+            return mqtt.MQTT_ERR_NO_CONN
+        self._desconectar(0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def simular_queda(self):
+        """Derruba a conexão como uma falha de rede (on_disconnect com rc != 0)."""
+        if self._conectado:
+            self._desconectar(mqtt.MQTT_ERR_CONN_LOST)
+
+    def _desconectar(self, rc):
+        self._conectado = False
+        self.barramento.cancelar(self)
+        # Como no paho, o callback só roda com o loop ativo
+        if self._loop_ativo and self.on_disconnect:
+            self.on_disconnect(self, self._userdata, rc)
+
+    def is_connected(self):
+        return self._conectado
+
+    def loop_start(self):
+        self._loop_ativo = True
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self, *args, **kwargs):
+        self._loop_ativo = False
+        return mqtt.MQTT_ERR_SUCCESS
+
+    # ========== MENSAGENS ==========
+    def subscribe(self, topic, qos=0, *args, **kwargs):
+        if not self._conectado:
+            return mqtt.MQTT_ERR_NO_CONN, None
+        mid = next(self._mids)
+        self.barramento.assinar(self, topic, qos)
+        if self.on_subscribe:
+            self.on_subscribe(self, self._userdata, mid, (qos,))
+        return mqtt.MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        self.barramento.cancelar(self, topic)
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, *args, **kwargs):
+        mid = next(self._mids)
+        if not self._conectado:
+            return InfoPublicacao(mqtt.MQTT_ERR_NO_CONN, mid, False)
+        self.barramento.publicar(topic, payload, qos, retain)
+        # QoS 1/2: o "PUBACK" só ocorre após a entrega a todos os assinantes
+        if self.on_publish:
+            self.on_publish(self, self._userdata, mid)
+        return InfoPublicacao(mqtt.MQTT_ERR_SUCCESS, mid, True)
+
+    def _entregar(self, mensagem):
+        if self.on_message:
+            self.on_message(self, self._userdata, mensagem)
+
+
+def criar_cliente(transporte, client_id, clean_session=True, reconexao_automatica=True):
+    """Cria o cliente do transporte configurado (MQTT_CONFIG["transport"]).
+
+    Com reconexao_automatica=False a thread de rede do paho termina ao perder a
+    conexão, e quem chamou fica responsável por reconnect() + loop_start().
+    """
+    if transporte == "paho":
+        return mqtt.Client(client_id=client_id, clean_session=clean_session, reconnect_on_failure=reconexao_automatica)
+    if transporte == "loopback":
+        return ClienteLoopback(client_id=client_id, clean_session=clean_session)
+    raise ValueError(f"Transporte desconhecido: {transporte!r} (use {', '.join(TRANSPORTES)})")
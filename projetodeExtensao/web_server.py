@@ -1,27 +1,369 @@
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, request, jsonify, Response
+import hashlib
+import hmac
+import json
+import math
 import threading
+import time
 import os
+from concurrent.futures import TimeoutError as TempoEsgotado
+from config import WEB_CONFIG, PROFILING_CONFIG, ANALYTICS_CONFIG
+from analitica import ExecutorRelatorios, AnaliticaIndisponivel
+from metricas import TIPO_CONTEUDO
+from perfilador import PerfilEmAndamento
 from detector_colisao import DetectorColisao  # importa tua classe
 
 app = Flask(__name__, static_folder="web/assets", static_url_path="/assets")
 
+# Instância do detector em execução (as rotas /api leem o buffer em memória dela)
+detector = None
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
 # === Rotas da interface ===
 @app.route('/')
 def serve_index():
     return send_from_directory('web', 'index.html')
 
+# === API de histórico ===
+def _buffer():
+    """Buffer de eventos do detector (None enquanto o detector não iniciou)."""
+    return detector.colisoes if detector is not None else None
+
+def _limite():
+    limite = request.args.get('limit', LIMITE_PADRAO, type=int)
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+def _serializar(eventos):
+    return [evento.campos() for evento in eventos]
+
+def _responder(buffer, eventos, pagina):
+    """Responde a página de eventos com ETag fraco; 304 se o cliente já tem a página.
+
+    O ETag vem só do que a página devolve (faixa de seqs, campos de paginação e
+    primeiro_seq do buffer), então eventos novos fora da faixa não invalidam
+    páginas já vistas; `ultimo_seq` no corpo é informativo (por isso o ETag é fraco).
+    """
+    faixa = f"{eventos[0].seq}-{eventos[-1].seq}:{len(eventos)}" if eventos else "vazia"
+    campos = ",".join(f"{nome}={pagina[nome]}" for nome in sorted(pagina))
+    chave = f"{buffer.primeiro_seq}:{faixa}:{campos}:{request.full_path}"
+    etag = hashlib.blake2b(chave.encode("utf-8"), digest_size=8).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        resposta = Response(status=304)
+    else:
+        resposta = jsonify({"eventos": _serializar(eventos), **pagina, "ultimo_seq": buffer.ultimo_seq})
+    resposta.set_etag(etag, weak=True)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+def _indisponivel():
+    return jsonify({"erro": "detector não iniciado"}), 503
+
+# Paginação: `cursor` é sempre a seq do último evento da página anterior (exclusiva):
+# a próxima página começa logo depois dele na ordem da rota. `since` idem, em ordem de chegada.
+@app.route('/api/eventos')
+def api_eventos():
+    """Eventos recentes (do mais novo ao mais antigo, seq < cursor) ou incrementais (seq > since)."""
+    buffer = _buffer()
+    if buffer is None:
+        return _indisponivel()
+    limite = _limite()
+    since = request.args.get('since', type=int)
+    cursor = request.args.get('cursor', type=int)
+
+    if since is not None:
+        eventos = list(buffer.iterar(since + 1, since + limite))
+        proximo = eventos[-1].seq if eventos else max(since, buffer.primeiro_seq - 1)
+        return _responder(buffer, eventos, {
+            "since": proximo,
+            "mais": proximo < buffer.ultimo_seq,
+            "perdidos": max(0, buffer.primeiro_seq - since - 1),
+        })
+    eventos = buffer.recentes(limite, antes_de=cursor)
+    mais = len(eventos) == limite and eventos[-1].seq > buffer.primeiro_seq
+    return _responder(buffer, eventos, {"cursor": eventos[-1].seq if mais else None})
+
+@app.route('/api/eventos/intervalo')
+def api_eventos_intervalo():
+    """Eventos recebidos entre inicio e fim (epoch), em ordem de chegada, com seq > cursor."""
+    buffer = _buffer()
+    if buffer is None:
+        return _indisponivel()
+    inicio = request.args.get('inicio', type=float)
+    if inicio is None:
+        return jsonify({"erro": "parâmetro 'inicio' (epoch) é obrigatório"}), 400
+    fim = request.args.get('fim', type=float)
+    limite = _limite()
+    cursor = request.args.get('cursor', type=int)
+
+    primeiro = buffer.buscar_seq(inicio)
+    if cursor is not None:
+        primeiro = max(primeiro, cursor + 1)
+    ultimo = buffer.ultimo_seq if fim is None else buffer.buscar_seq(fim) - 1
+    eventos = list(buffer.iterar(primeiro, min(ultimo, primeiro + limite - 1)))
+    mais = bool(eventos) and eventos[-1].seq < ultimo
+    return _responder(buffer, eventos, {"cursor": eventos[-1].seq if mais else None})
+
+@app.route('/api/sensores/<sensor>/eventos')
+def api_eventos_sensor(sensor):
+    """Histórico recente de um sensor (do mais novo ao mais antigo, seq < cursor)."""
+    buffer = _buffer()
+    if buffer is None:
+        return _indisponivel()
+    limite = _limite()
+    cursor = request.args.get('cursor', type=int)
+
+    eventos = buffer.recentes(limite, antes_de=cursor, filtro=lambda e: e.sensor == sensor)
+    return _responder(buffer, eventos, {
+        "sensor": sensor,
+        "cursor": eventos[-1].seq if len(eventos) == limite else None,
+    })
+
+# === API por sensor (índice em memória) ===
+@app.route('/api/sensores')
+def api_sensores():
+    """Sensores do índice ordenados por ultimo_visto (padrão), total ou taxa."""
+    if detector is None:
+        return _indisponivel()
+    try:
+        sensores = detector.sensores.listar(time.time(), request.args.get('ordem', 'ultimo_visto'), _limite())
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    return jsonify({"sensores": sensores, **detector.sensores.estatisticas()})
+
+@app.route('/api/sensores/top')
+def api_sensores_top():
+    """Sensores mais ativos recentemente (contagens do count-min sketch, com decaimento)."""
+    if detector is None:
+        return _indisponivel()
+    k = request.args.get('k', type=int)
+    return jsonify({"sensores": detector.sensores.mais_ativos(time.time(), k)})
+
+@app.route('/api/sensores/<sensor>')
+def api_sensor(sensor):
+    """Estado de um sensor; fora do índice, só a contagem recente estimada."""
+    if detector is None:
+        return _indisponivel()
+    estado, estimativa = detector.sensores.obter(sensor, time.time())
+    if estado is None and not estimativa:
+        return jsonify({"erro": "sensor desconhecido", "sensor": sensor}), 404
+    anomalias = detector.anomalias.obter(sensor) if detector.anomalias is not None else None
+    return jsonify({"sensor": sensor, "estado": estado, "contagem_recente_estimada": estimativa,
+                    "anomalias": anomalias})
+
+# === API espacial (localização das colisões) ===
+def _consulta_espacial(*obrigatorios):
+    """Lê x, y (e os demais `obrigatorios`) como float e `minutos` -> instante inicial; ValueError se faltar algum."""
+    valores = []
+    for nome in ('x', 'y') + obrigatorios:
+        valor = request.args.get(nome, type=float)
+        if valor is None or not math.isfinite(valor):
+            raise ValueError(f"parâmetro '{nome}' numérico (finito) obrigatório")
+        valores.append(valor)
+    minutos = request.args.get('minutos', type=float)
+    desde = time.time() - minutos * 60 if minutos is not None else None
+    return valores, desde
+
+@app.route('/api/espacial/raio')
+def api_espacial_raio():
+    """Colisões a até r de (x, y), opcionalmente só dos últimos N minutos, da mais próxima à mais distante."""
+    if detector is None:
+        return _indisponivel()
+    try:
+        (x, y, raio), desde = _consulta_espacial('r')
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    colisoes = detector.espacial.no_raio(x, y, raio, desde, _limite(), agora=time.time())
+    return jsonify({"x": x, "y": y, "r": raio, "colisoes": colisoes})
+
+@app.route('/api/espacial/vizinhos')
+def api_espacial_vizinhos():
+    """As k colisões mais próximas de (x, y), opcionalmente só dos últimos N minutos."""
+    if detector is None:
+        return _indisponivel()
+    try:
+        (x, y), desde = _consulta_espacial()
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    k = max(1, min(request.args.get('k', 10, type=int), LIMITE_MAXIMO))
+    return jsonify({"x": x, "y": y, "k": k, "colisoes": detector.espacial.vizinhos(x, y, k, desde, agora=time.time())})
+
+@app.route('/api/espacial/mapa_calor')
+def api_espacial_mapa_calor():
+    """Mapa de calor pré-calculado da janela de retenção (custo fixo, independente do volume)."""
+    if detector is None:
+        return _indisponivel()
+    return jsonify(detector.espacial.mapa_calor(time.time()))
+
+# === Análises vetorizadas (NumPy, em pool de processos) ===
+_relatorios = ExecutorRelatorios.de_config(ANALYTICS_CONFIG)
+
+@app.route('/api/analise')
+def api_analise():
+    """Percentis, histogramas, agrupamento por sensor, intervalos e taxa móvel.
+
+    fonte=memoria (padrão) analisa o histórico em memória; fonte=persistencia, todo o histórico gravado.
+    Se o relatório estourar o tempo limite, o Future é cancelado; um relatório que já
+    começou no pool não pode ser interrompido: termina lá e o resultado é descartado.
+    """
+    if detector is None:
+        return _indisponivel()
+    fonte = request.args.get('fonte', 'memoria')
+    if fonte not in ('memoria', 'persistencia'):
+        return jsonify({"erro": "fonte deve ser memoria ou persistencia"}), 400
+    minutos = request.args.get('minutos', type=float)
+    try:
+        faixas = int(request.args.get('faixas', ANALYTICS_CONFIG["histogram_bins"]))
+    except ValueError:
+        return jsonify({"erro": "faixas deve ser um inteiro"}), 400
+    if faixas < 1:
+        return jsonify({"erro": "faixas deve ser maior que zero"}), 400
+    opcoes = {
+        "inicio": time.time() - minutos * 60 if minutos is not None else None,
+        "percentis": ANALYTICS_CONFIG["percentiles"],
+        "faixas": min(faixas, ANALYTICS_CONFIG["max_histogram_bins"]),
+        "janela_taxa": ANALYTICS_CONFIG["rate_window"],
+        "passo_taxa": ANALYTICS_CONFIG["rate_step"],
+        "limite_sensores": _limite(),
+    }
+    try:
+        if fonte == 'memoria':
+            futuro = _relatorios.relatorio_eventos(detector.colisoes.iterar(), opcoes)
+        else:
+            futuro = _relatorios.relatorio_persistencia(
+                detector.data_config, detector.ui_config["date_format"], opcoes)
+        relatorio = futuro.result(timeout=ANALYTICS_CONFIG["timeout"])
+    except AnaliticaIndisponivel as e:
+        return jsonify({"erro": str(e)}), 501
+    except TempoEsgotado:
+        futuro.cancel()
+        return jsonify({"erro": "relatório demorou mais que o limite"}), 504
+    return jsonify({"fonte": fonte, **relatorio})
+
+@app.route('/api/eventos', methods=['POST'])
+def api_injetar_evento():
+    """Recebe um evento do simulador web e o envia ao pipeline do detector."""
+    if detector is None:
+        return _indisponivel()
+    if not detector.injetar(request.get_data()):
+        return jsonify({"erro": "fila do detector cheia"}), 429
+    return jsonify({"aceito": True}), 202
+
+# === Canal de push (Server-Sent Events) ===
+_estatisticas_lock = threading.Lock()
+_estatisticas_cache = (0.0, None)
+
+def _estatisticas_compartilhadas():
+    """Estatísticas do detector, calculadas no máximo uma vez por intervalo para todos os painéis."""
+    global _estatisticas_cache
+    with _estatisticas_lock:
+        instante, stats = _estatisticas_cache
+        agora = time.monotonic()
+        if stats is None or agora - instante >= WEB_CONFIG["stream_stats_interval"]:
+            stats = detector.get_estatisticas()
+            _estatisticas_cache = (agora, stats)
+        return stats
+
+def _quadro(evento, dados, seq=None):
+    """Formata uma mensagem SSE; o `id` permite ao navegador retomar após reconectar."""
+    cabecalho = f"id: {seq}\n" if seq is not None else ""
+    return f"{cabecalho}event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
+
+def _transmitir(buffer, ultimo):
+    """Gera os quadros de um painel: eventos agrupados a cada 1/fps s, estatísticas e heartbeat."""
+    intervalo = 1 / WEB_CONFIG["stream_fps"]
+    max_eventos = WEB_CONFIG["stream_max_eventos"]
+    yield f"retry: {WEB_CONFIG['stream_retry_ms']}\n\n"
+    proximas_stats = proximo_heartbeat = time.monotonic()
+    while True:
+        agora = time.monotonic()
+        if agora >= proximas_stats:
+            yield _quadro("estatisticas", _estatisticas_compartilhadas())
+            proximas_stats = agora + WEB_CONFIG["stream_stats_interval"]
+            proximo_heartbeat = agora + WEB_CONFIG["stream_heartbeat"]
+        if buffer.ultimo_seq > ultimo:
+            perdidos = max(0, buffer.primeiro_seq - ultimo - 1)
+            eventos = list(buffer.iterar(ultimo + 1, ultimo + max_eventos))
+            ultimo = eventos[-1].seq if eventos else max(ultimo, buffer.primeiro_seq - 1)
+            yield _quadro("eventos", {"eventos": _serializar(eventos), "perdidos": perdidos}, ultimo)
+            proximo_heartbeat = agora + WEB_CONFIG["stream_heartbeat"]
+            if buffer.ultimo_seq > ultimo:
+                continue  # Atraso acumulado: envia o próximo quadro sem esperar
+        elif agora >= proximo_heartbeat:
+            yield ": ping\n\n"
+            proximo_heartbeat = agora + WEB_CONFIG["stream_heartbeat"]
+        # Agrupa o que chegar durante o intervalo; ocioso, bloqueia até o próximo evento
+        time.sleep(intervalo)
+        buffer.aguardar(ultimo, timeout=min(proximas_stats, proximo_heartbeat) - time.monotonic())
+
+@app.route('/api/stream')
+def api_stream():
+    """Push de eventos normalizados e estatísticas; retoma por Last-Event-ID ou ?since=seq."""
+    buffer = _buffer()
+    if buffer is None:
+        return _indisponivel()
+    ultimo = request.headers.get('Last-Event-ID', type=int)
+    if ultimo is None:
+        ultimo = request.args.get('since', buffer.ultimo_seq, type=int)
+    return Response(
+        _transmitir(buffer, ultimo),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+# === Métricas (formato texto do Prometheus) ===
+@app.route('/metrics')
+def metrics():
+    """Contadores, histogramas de latência por etapa e profundidade das filas do detector."""
+    if detector is None:
+        return _indisponivel()
+    return Response(detector.metricas.exportar(), mimetype=None, content_type=TIPO_CONTEUDO)
+
+# === Administração: perfilamento sob demanda ===
+def _admin_autorizado():
+    """Com admin_token, exige o cabeçalho X-Admin-Token; sem token, só aceita requisições locais."""
+    token = os.getenv("ADMIN_TOKEN", PROFILING_CONFIG["admin_token"])
+    if token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/api/admin/perfil', methods=['GET', 'POST', 'DELETE'])
+def api_admin_perfil():
+    """GET: estado; POST {"modo", "duracao", "memoria"}: abre uma janela; DELETE: encerra e grava agora."""
+    if not _admin_autorizado():
+        return jsonify({"erro": "não autorizado"}), 403
+    if detector is None:
+        return _indisponivel()
+    perfilador = detector.perfilador
+    if request.method == 'GET':
+        return jsonify(perfilador.estado())
+    if request.method == 'DELETE':
+        return jsonify({"arquivos": perfilador.parar()})
+    corpo = request.get_json(silent=True) or {}
+    try:
+        duracao = float(corpo.get("duracao", PROFILING_CONFIG["duration"]))
+        if not 0 < duracao <= PROFILING_CONFIG["max_duration"]:
+            raise ValueError(f"duracao deve estar entre 0 e {PROFILING_CONFIG['max_duration']}s")
+        estado = perfilador.iniciar(
+            corpo.get("modo", PROFILING_CONFIG["mode"]), duracao, bool(corpo.get("memoria", PROFILING_CONFIG["memory"]))
+        )
+    except PerfilEmAndamento as e:
+        return jsonify({"erro": str(e), **perfilador.estado()}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({"erro": str(e)}), 400
+    return jsonify(estado), 202
+
 @app.route('/<path:path>')
 def serve_static(path):
     return send_from_directory('web', path)
 
-# === Função para rodar o detector em paralelo ===
-def start_detector():
-    detector = DetectorColisao()
-    detector.run()
-
 if __name__ == '__main__':
+    # Criado na thread principal (o sinal de perfilamento só pode ser instalado nela)
+    detector = DetectorColisao()
+    detector.instalar_sinal_perfil()
     # Roda o detector em uma thread separada
-    threading.Thread(target=start_detector, daemon=True).start()
+    threading.Thread(target=detector.run, daemon=True).start()
 
     # Inicia o servidor Flask
-    app.run(host='0.0.0.0', port=5000)
+    app.run(host=WEB_CONFIG["host"], port=WEB_CONFIG["port"], threaded=True)